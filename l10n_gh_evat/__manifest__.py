@@ -13,11 +13,12 @@ under VAT Act 1151.
 
 Features:
 - Submit sales invoices to GRA VSDC
-- Submit POS receipts to GRA E-VAT automatically
+- Submit POS receipts to GRA E-VAT automatically, from a background queue
+  with retries (the till never waits for GRA)
 - Receive SDC codes and QR codes
 - Print E-VAT compliant receipts from POS
 - Track submission status
-- TIN validation via GRA API
+- TIN validation via GRA API, cached and in bulk from the partner list
 
 IMPORTANT - Tax Setup (GRA Best Practice):
 ------------------------------------------
@@ -46,13 +47,16 @@ Reference: https://gra.gov.gh/e-services/e-vat/
     'author': 'VumaCloud',
     'website': 'https://vumacloud.com',
     'license': 'LGPL-3',
-    'depends': ['account', 'point_of_sale'],
+    'depends': ['account', 'point_of_sale', 'bus'],
     'data': [
         'security/ir.model.access.csv',
         'data/evat_tax_code_data.xml',
+        'data/evat_cron.xml',
         'views/evat_config_views.xml',
+        'views/account_tax_views.xml',
         'views/account_move_views.xml',
         'views/pos_order_views.xml',
+        'views/evat_tin_cache_views.xml',
         'views/menu.xml',
     ],
     'assets': {
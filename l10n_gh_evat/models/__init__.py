@@ -3,6 +3,10 @@
 
 from . import evat_config
 from . import evat_tax_code
+from . import evat_tin_cache
+from . import evat_payload
+from . import account_tax
 from . import account_move
 from . import pos_order
 from . import product_template
+from . import res_partner
@@ -9,7 +9,7 @@ _logger = logging.getLogger(__name__)
 
 
 class AccountMove(models.Model):
-    _inherit = 'account.move'
+    _inherit = ['account.move', 'ghana.evat.payload.mixin']
 
     # E-VAT Fields (v8.2)
     evat_submitted = fields.Boolean(string='Submitted to E-VAT', copy=False)
@@ -36,14 +36,6 @@ class AccountMove(models.Model):
             dt = fields.Date.from_string(dt)
         return dt.strftime('%Y-%m-%d')
 
-    def _get_evat_calculation_type(self):
-        """Determine if prices are tax inclusive or exclusive."""
-        # Check if any line has tax included in price
-        for line in self.invoice_line_ids.filtered(lambda l: l.display_type == 'product'):
-            if line.tax_ids and any(t.price_include for t in line.tax_ids):
-                return 'INCLUSIVE'
-        return 'EXCLUSIVE'
-
     def _get_evat_tax_type(self, line):
         """Determine tax type for a line."""
         if not line.tax_ids:
@@ -57,149 +49,43 @@ class AccountMove(models.Model):
         else:
             return 'STANDARD'
 
-    def _get_evat_item_category(self, line):
-        """
-        Determine GRA item category code.
-        Valid values: "", "CST", "TRSM", "EXM", "RNT", "EXC_PLASTIC"
-        """
-        if not line.tax_ids:
-            return 'EXM'  # Zero rated/Exempt
-
-        tax = line.tax_ids[0]
-        tax_name = (tax.name or '').upper()
-
-        # Check tax name for category hints
-        if 'CST' in tax_name or 'COMMUNICATION' in tax_name:
-            return 'CST'
-        elif 'TOURISM' in tax_name or 'TRSM' in tax_name:
-            return 'TRSM'
-        elif 'EXEMPT' in tax_name or tax.amount == 0:
-            return 'EXM'
-        elif 'RENT' in tax_name:
-            return 'RNT'
-        elif 'PLASTIC' in tax_name or 'EXCISE' in tax_name:
-            return 'EXC_PLASTIC'
+    def _get_evat_item_lines(self):
+        return self.invoice_line_ids.filtered(lambda l: l.display_type == 'product')
 
-        return ''  # Standard taxable item
+    def _get_evat_line_values(self, line):
+        return {
+            'description': line.name or line.product_id.name,
+            'quantity': line.quantity,
+            'price_unit': line.price_unit,
+            'discount_amt': round((line.price_unit * line.quantity) - line.price_subtotal, 2) if line.discount else 0,
+        }
 
-    def _get_line_tax_amounts(self, line):
+    def _prepare_evat_payload(self, config=None):
         """
-        Extract VAT, NHIL, GETFund, CST, and Tourism amounts from line taxes.
-        Returns dict with vat, nhil, getfund, cst, tourism amounts.
+        Prepare the full GRA E-VAT v8.2 payload.
 
-        Per GRA best practice, taxes should be applied separately:
-        - VAT 15%
-        - NHIL 2.5%
-        - GETFund 2.5%
-        - CST 5% (communication services)
-        - Tourism 1% (hospitality)
+        Args:
+            config: ghana.evat.config of the company, looked up if not given
         """
-        result = {'vat': 0.0, 'nhil': 0.0, 'getfund': 0.0, 'cst': 0.0, 'tourism': 0.0}
-        base_amt = line.price_subtotal
-
-        if not line.tax_ids:
-            return result
-
-        for tax in line.tax_ids:
-            tax_name = (tax.name or '').upper()
-            tax_amount = round(base_amt * tax.amount / 100, 2)
-
-            if 'NHIL' in tax_name:
-                result['nhil'] = tax_amount
-            elif 'GETFUND' in tax_name or 'GET FUND' in tax_name or 'GETFund' in tax.name:
-                result['getfund'] = tax_amount
-            elif 'CST' in tax_name or 'COMMUNICATION' in tax_name:
-                result['cst'] = tax_amount
-            elif 'TOURISM' in tax_name:
-                result['tourism'] = tax_amount
-            elif 'VAT' in tax_name and tax.amount > 0:
-                result['vat'] = tax_amount
-
-        return result
-
-    def _prepare_evat_item(self, line):
-        """Prepare a single invoice line for GRA E-VAT v8.2."""
-        base_amt = line.price_subtotal
-        item_category = self._get_evat_item_category(line)
-
-        # Get actual tax amounts from Odoo taxes
-        tax_amounts = self._get_line_tax_amounts(line)
-
-        # Use actual tax amounts if available, otherwise calculate
-        levy_a = tax_amounts['nhil']
-        levy_b = tax_amounts['getfund']
-        levy_d = tax_amounts['cst']
-        levy_e = tax_amounts['tourism']
-
-        # Fallback: if no NHIL/GETFund taxes applied but item is standard taxable,
-        # calculate them (for backward compatibility)
-        if item_category == '' and levy_a == 0 and levy_b == 0:
-            # Check if VAT is applied - if so, levies should also apply
-            if tax_amounts['vat'] > 0:
-                levy_a = round(base_amt * 0.025, 2)  # NHIL 2.5%
-                levy_b = round(base_amt * 0.025, 2)  # GETFund 2.5%
-                _logger.warning(
-                    'Line "%s" has VAT but no NHIL/GETFund taxes. '
-                    'Consider adding NHIL 2.5%% and GETFund 2.5%% taxes for GRA compliance.',
-                    line.name
-                )
-
-        return {
-            'itemCode': line.product_id.default_code or f'PROD{line.product_id.id}' if line.product_id else 'ITEM',
-            'itemCategory': item_category,
-            'expireDate': '',
-            'description': (line.name or line.product_id.name or 'Item')[:100],
-            'quantity': str(round(line.quantity, 3)),
-            'levyAmountA': levy_a,
-            'levyAmountB': levy_b,
-            'levyAmountC': 0,  # COVID levy - include even if 0 per v8.2 spec
-            'levyAmountD': levy_d,
-            'levyAmountE': levy_e,
-            'discountAmount': round((line.price_unit * line.quantity) - base_amt, 2) if line.discount else 0,
-            'exciseAmount': 0,
-            'batchCode': '',
-            'unitPrice': str(round(line.price_unit, 2)),
-        }
-
-    def _prepare_evat_payload(self):
-        """Prepare the full GRA E-VAT v8.2 payload."""
         self.ensure_one()
 
         if self.move_type not in ('out_invoice', 'out_refund'):
             raise UserError(_('Only customer invoices can be submitted to E-VAT.'))
 
-        config = self.env['ghana.evat.config'].get_config(self.company_id)
-
-        items = []
-        total_levy = 0.0
-        total_vat = 0.0
-        total_discount = 0.0
-        total_base = 0.0
-
-        for line in self.invoice_line_ids.filtered(lambda l: l.display_type == 'product'):
-            item = self._prepare_evat_item(line)
-            items.append(item)
-
-            # Accumulate levy totals from item
-            total_levy += item['levyAmountA'] + item['levyAmountB'] + item['levyAmountD'] + item['levyAmountE']
-            total_discount += item['discountAmount']
-            total_base += line.price_subtotal
-
-            # Get VAT amount from actual taxes
-            tax_amounts = self._get_line_tax_amounts(line)
-            total_vat += tax_amounts['vat']
+        config = config or self.env['ghana.evat.config'].get_config(self.company_id)
+        items, totals = self._prepare_evat_items()
 
         # Determine flag (INVOICE or REFUND)
         flag = 'REFUND' if self.move_type == 'out_refund' else 'INVOICE'
 
-        # Get calculation type
-        calc_type = self._get_evat_calculation_type()
+        # Prices are tax inclusive if any line has tax included in price
+        calc_type = 'INCLUSIVE' if totals['price_include'] else 'EXCLUSIVE'
 
         # Per GRA sample invoice:
         # - EXCLUSIVE: totalAmount = base amount (before taxes)
         # - INCLUSIVE: totalAmount = total including taxes
         if calc_type == 'EXCLUSIVE':
-            total_amount = total_base
+            total_amount = totals['base']
         else:
             total_amount = self.amount_total
 
@@ -218,11 +104,11 @@ class AccountMove(models.Model):
             'currency': self.currency_id.name or 'GHS',
             'exchangeRate': str(self.currency_id.rate or 1.0),
             'invoiceNumber': self.name or '',
-            'totalLevy': round(total_levy, 2),
+            'totalLevy': round(totals['levy'], 2),
             'userName': config.user_name,
             'flag': flag,
             'calculationType': calc_type,
-            'totalVat': round(total_vat, 2),
+            'totalVat': round(totals['vat'], 2),
             'transactionDate': self._get_evat_date(),
             'totalAmount': round(total_amount, 2),
             'totalExciseAmount': 0.00,
@@ -230,7 +116,7 @@ class AccountMove(models.Model):
             'businessPartnerTin': self.partner_id.vat or 'C0000000000',
             'saleType': 'NORMAL',
             'discountType': 'GENERAL',
-            'discountAmount': round(total_discount, 2),
+            'discountAmount': round(totals['discount'], 2),
             'reference': reference,
             'groupReferenceId': '',
             'purchaseOrderReference': self.invoice_origin or '',
@@ -250,7 +136,7 @@ class AccountMove(models.Model):
             raise UserError(_('Only posted invoices can be submitted to E-VAT.'))
 
         config = self.env['ghana.evat.config'].get_config(self.company_id)
-        payload = self._prepare_evat_payload()
+        payload = self._prepare_evat_payload(config)
 
         _logger.info('Submitting invoice %s to GRA E-VAT v8.2', self.name)
 
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+E-VAT Classification of Odoo Taxes
+
+Building an E-VAT payload used to uppercase every tax name and substring
+match it on every line of every submission, once for the item category and
+again for the levy amounts.
+
+Each tax now stores the levy slot its amount is reported in (VAT, NHIL,
+GETFund, CST, Tourism) and the GRA item category of lines carrying it,
+derived from the name and rate and editable when the name is not telling.
+Line building reads them from a per-company map held in an ormcache,
+cleared whenever taxes are created, written or deleted. The Ghana default
+taxes of new products are cached the same way.
+"""
+from odoo import api, fields, models, tools
+
+
+class AccountTax(models.Model):
+    _inherit = 'account.tax'
+
+    l10n_gh_evat_levy = fields.Selection([
+        ('vat', 'VAT'),
+        ('nhil', 'NHIL (Levy A)'),
+        ('getfund', 'GETFund (Levy B)'),
+        ('cst', 'CST (Levy D)'),
+        ('tourism', 'Tourism (Levy E)'),
+        ('none', 'Not Reported'),
+    ], string='E-VAT Levy', compute='_compute_l10n_gh_evat', store=True, readonly=False,
+       help='E-VAT amount this tax is reported in')
+    l10n_gh_evat_category = fields.Selection([
+        ('standard', 'Standard'),
+        ('CST', 'Communication Service'),
+        ('TRSM', 'Tourism'),
+        ('EXM', 'Exempt / Zero Rated'),
+        ('RNT', 'Rent'),
+        ('EXC_PLASTIC', 'Excise / Plastic'),
+    ], string='E-VAT Item Category', compute='_compute_l10n_gh_evat', store=True, readonly=False,
+       help='GRA item category of lines whose first tax is this one')
+
+    @api.depends('name', 'amount')
+    def _compute_l10n_gh_evat(self):
+        for tax in self:
+            tax_name = (tax.name or '').upper()
+
+            if 'NHIL' in tax_name:
+                tax.l10n_gh_evat_levy = 'nhil'
+            elif 'GETFUND' in tax_name or 'GET FUND' in tax_name:
+                tax.l10n_gh_evat_levy = 'getfund'
+            elif 'CST' in tax_name or 'COMMUNICATION' in tax_name:
+                tax.l10n_gh_evat_levy = 'cst'
+            elif 'TOURISM' in tax_name:
+                tax.l10n_gh_evat_levy = 'tourism'
+            elif 'VAT' in tax_name and tax.amount > 0:
+                tax.l10n_gh_evat_levy = 'vat'
+            else:
+                tax.l10n_gh_evat_levy = 'none'
+
+            if 'CST' in tax_name or 'COMMUNICATION' in tax_name:
+                tax.l10n_gh_evat_category = 'CST'
+            elif 'TOURISM' in tax_name or 'TRSM' in tax_name:
+                tax.l10n_gh_evat_category = 'TRSM'
+            elif 'EXEMPT' in tax_name or tax.amount == 0:
+                tax.l10n_gh_evat_category = 'EXM'
+            elif 'RENT' in tax_name:
+                tax.l10n_gh_evat_category = 'RNT'
+            elif 'PLASTIC' in tax_name or 'EXCISE' in tax_name:
+                tax.l10n_gh_evat_category = 'EXC_PLASTIC'
+            else:
+                tax.l10n_gh_evat_category = 'standard'
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_evat_tax_map(self, company_id):
+        """
+        E-VAT classification of every tax of the company, active or not.
+
+        Returns:
+            dict: tax id -> (levy slot, GRA item category, rate, price
+                  included); the category is '' for standard taxable items
+        """
+        taxes = self.with_context(active_test=False).sudo().search_read(
+            [('company_id', '=', company_id)], ['l10n_gh_evat_levy', 'l10n_gh_evat_category', 'amount', 'price_include'])
+        return {
+            tax['id']: (
+                tax['l10n_gh_evat_levy'] or 'none',
+                '' if tax['l10n_gh_evat_category'] in ('standard', False) else tax['l10n_gh_evat_category'],
+                tax['amount'],
+                tax['price_include'],
+            )
+            for tax in taxes
+        }
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_ghana_default_tax_ids(self, company_id):
+        """
+        Ghana standard taxes (VAT 15%, NHIL 2.5%, GETFund 2.5%) given to new products.
+
+        Returns:
+            tuple (sale tax ids, purchase tax ids)
+        """
+        Tax = self.sudo()
+        name_domain = ['|', '|',
+                       ('name', 'ilike', 'VAT 15%'),
+                       ('name', 'ilike', 'NHIL'),
+                       ('name', 'ilike', 'GETFund')]
+        sale_taxes = Tax.search([
+            ('company_id', '=', company_id),
+            ('type_tax_use', '=', 'sale'),
+        ] + name_domain)
+
+        # Fall back on the rates when the names are not telling
+        if len(sale_taxes) < 3:
+            sale_taxes = Tax.search([
+                ('company_id', '=', company_id),
+                ('type_tax_use', '=', 'sale'),
+                ('amount', 'in', [15.0, 2.5]),  # VAT 15%, NHIL 2.5%, GETFund 2.5%
+            ])
+
+        purchase_taxes = Tax.search([
+            ('company_id', '=', company_id),
+            ('type_tax_use', '=', 'purchase'),
+        ] + name_domain)
+        return tuple(sale_taxes.ids), tuple(purchase_taxes.ids)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        taxes = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return taxes
+
+    def write(self, vals):
+        res = super().write(vals)
+        if {'name', 'amount', 'price_include', 'company_id', 'active', 'type_tax_use',
+            'l10n_gh_evat_levy', 'l10n_gh_evat_category'} & set(vals):
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
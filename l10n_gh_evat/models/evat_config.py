@@ -1,16 +1,25 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 
+from .evat_transport import EvatConnectionError, get_transport, peek_transport
+
 _logger = logging.getLogger(__name__)
 
 # GRA E-VAT API v8.2 URLs
 SANDBOX_URL = 'https://vsdcstaging.vat-gh.com'
 PRODUCTION_URL = 'https://vsdc.vat-gh.com'
 
+# Transport timeouts in seconds
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
 
 class GhanaEvatConfig(models.Model):
     _name = 'ghana.evat.config'
@@ -38,15 +47,48 @@ class GhanaEvatConfig(models.Model):
     user_name = fields.Char(string='User Name', required=True,
                             help='User name for E-VAT submissions')
 
-    # Status
-    last_request_date = fields.Datetime(string='Last Request')
-    last_response = fields.Text(string='Last Response')
+    # POS submission queue
+    max_concurrency = fields.Integer(
+        string='Max Concurrent Submissions', default=4,
+        help='Maximum worker threads the POS submission queue uses for this company.')
+
+    # Status (current worker process only, see evat_transport)
+    last_request_date = fields.Datetime(string='Last Request', compute='_compute_transport_stats')
+    last_response = fields.Text(string='Last Response', compute='_compute_transport_stats')
+    request_log = fields.Text(string='Recent Requests', compute='_compute_transport_stats')
+    transport_requests = fields.Integer(string='Requests Sent', compute='_compute_transport_stats')
+    transport_errors = fields.Integer(string='Failed Requests', compute='_compute_transport_stats')
+    transport_avg_latency = fields.Float(string='Avg Latency (ms)', compute='_compute_transport_stats')
+    transport_circuit_state = fields.Selection([
+        ('closed', 'Closed (VSDC reachable)'),
+        ('open', 'Open (failing fast)'),
+        ('half_open', 'Half-open (probing)'),
+    ], string='Circuit', compute='_compute_transport_stats')
 
     _sql_constraints = [
         ('company_uniq', 'unique(company_id)',
          'Only one E-VAT configuration per company allowed.')
     ]
 
+    def _compute_transport_stats(self):
+        for config in self:
+            transport = peek_transport(config._get_transport_key()) if config.id else None
+            stats = transport.get_stats() if transport else {}
+            telemetry = transport.get_telemetry() if transport else []
+            last = telemetry[0] if telemetry else {}
+            config.last_request_date = last.get('date', False)
+            config.last_response = last.get('response', False)
+            config.request_log = '\n'.join(
+                '%s  %s %s  %s  %.0f ms' % (
+                    entry['date'], entry['method'], entry['url'].rsplit('/', 1)[-1],
+                    entry['status'] or 'ERR', entry['latency_ms'])
+                for entry in telemetry
+            ) or False
+            config.transport_requests = stats.get('requests', 0)
+            config.transport_errors = stats.get('errors', 0)
+            config.transport_avg_latency = stats.get('avg_latency_ms', 0.0)
+            config.transport_circuit_state = stats.get('circuit_state') or 'closed'
+
     def _get_api_url(self):
         """Get the API base URL based on environment."""
         self.ensure_one()
@@ -65,6 +107,31 @@ class GhanaEvatConfig(models.Model):
             'security_key': self.security_key,
         }
 
+    def _get_health_url(self):
+        self.ensure_one()
+        return f"{self._get_taxpayer_endpoint()}/health"
+
+    def _get_transport_key(self):
+        self.ensure_one()
+        return (self.env.cr.dbname, self.id)
+
+    def _get_transport(self):
+        """
+        Get the pooled keep-alive HTTP transport for this configuration.
+
+        One transport (and connection pool) is kept per worker process and
+        configuration; it is rebuilt when the credentials or the concurrency
+        change.
+        """
+        self.ensure_one()
+        settings = {
+            'connect_timeout': CONNECT_TIMEOUT,
+            'read_timeout': READ_TIMEOUT,
+            'pool_size': max(self.max_concurrency or 1, 4),
+            'headers': self._prepare_headers(),
+        }
+        return get_transport(self._get_transport_key(), settings)
+
     def _call_api(self, endpoint, data, method='POST'):
         """
         Make an API call to GRA E-VAT v8.2.
@@ -73,6 +140,7 @@ class GhanaEvatConfig(models.Model):
         :param data: Dictionary with request data
         :param method: HTTP method (POST, GET)
         :return: Response dictionary
+        :raises EvatConnectionError: VSDC unreachable or circuit open
         """
         self.ensure_one()
         url = f"{self._get_taxpayer_endpoint()}/{endpoint}"
@@ -80,101 +148,128 @@ class GhanaEvatConfig(models.Model):
         _logger.info('GRA E-VAT API v8.2 Request to %s', url)
         _logger.debug('Request data: %s', json.dumps(data, indent=2))
 
-        try:
-            if method == 'POST':
-                response = requests.post(
-                    url,
-                    json=data,
-                    headers=self._prepare_headers(),
-                    timeout=30
-                )
-            else:
-                response = requests.get(
-                    url,
-                    headers=self._prepare_headers(),
-                    timeout=30
-                )
-
-            # Log response
-            self.write({
-                'last_request_date': fields.Datetime.now(),
-                'last_response': response.text[:5000] if response.text else '',
-            })
-
-            _logger.info('GRA E-VAT API Response Status: %s', response.status_code)
-            _logger.debug('Response: %s', response.text[:1000])
-
-            if response.status_code in (200, 201):
-                result = response.json()
-                return result
-            else:
-                error_msg = response.text[:500] if response.text else f'HTTP {response.status_code}'
-                raise UserError(_('E-VAT API Error: %s') % error_msg)
-
-        except requests.exceptions.Timeout:
-            raise UserError(_('Connection to GRA E-VAT timed out.'))
-        except requests.exceptions.ConnectionError as e:
-            raise UserError(_('Cannot connect to GRA E-VAT: %s') % str(e))
-        except json.JSONDecodeError:
-            raise UserError(_('Invalid response from GRA E-VAT server.'))
+        response = self._get_transport().request(
+            method, url, json=data if method == 'POST' else None, health_url=self._get_health_url())
+
+        _logger.info('GRA E-VAT API Response Status: %s', response.status_code)
+        _logger.debug('Response: %s', response.text[:1000])
+
+        if response.status_code in (200, 201):
+            try:
+                return response.json()
+            except ValueError:
+                raise UserError(_('Invalid response from GRA E-VAT server.'))
+        error_msg = response.text[:500] if response.text else f'HTTP {response.status_code}'
+        raise UserError(_('E-VAT API Error: %s') % error_msg)
 
     def action_test_connection(self):
         """Test connection to GRA E-VAT API v8.2 using health endpoint."""
         self.ensure_one()
+        transport = self._get_transport()
         try:
-            # Use the documented /health endpoint
-            url = f"{self._get_taxpayer_endpoint()}/health"
-            response = requests.get(
-                url,
-                headers=self._prepare_headers(),
-                timeout=30
-            )
-
-            self.write({
-                'last_request_date': fields.Datetime.now(),
-                'last_response': response.text[:5000] if response.text else '',
-            })
-
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('status') == 'UP':
-                    return {
-                        'type': 'ir.actions.client',
-                        'tag': 'display_notification',
-                        'params': {
-                            'title': _('Connection Test'),
-                            'message': _('GRA E-VAT connection successful! Status: UP'),
-                            'type': 'success',
-                        }
-                    }
-            elif response.status_code == 403:
-                raise UserError(_('Invalid security key or taxpayer reference (E907).'))
-
-            raise UserError(_('E-VAT Error: %s') % response.text[:200])
+            # Bypasses the circuit breaker, and closes it when the VSDC is UP
+            healthy, error = transport._probe(self._get_health_url())
         except requests.exceptions.RequestException as e:
             raise UserError(_('Connection test failed: %s') % str(e))
 
+        if healthy:
+            transport.breaker.record_success()
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('Connection Test'),
+                    'message': _('GRA E-VAT connection successful! Status: UP'),
+                    'type': 'success',
+                }
+            }
+        if error.startswith('HTTP 403'):
+            raise UserError(_('Invalid security key or taxpayer reference (E907).'))
+        raise UserError(_('E-VAT Error: %s') % error)
+
     def validate_tin(self, tin):
         """
-        Validate a TIN using GRA E-VAT API v8.2.
+        Validate a TIN using GRA E-VAT API v8.2 (answers are cached, see
+        ghana.evat.tin.cache).
         Returns dict with tin, type, name, sector, address or raises error.
         """
         self.ensure_one()
-        try:
-            url = f"{self._get_taxpayer_endpoint()}/identification/tin/{tin}"
-            response = requests.get(
-                url,
-                headers=self._prepare_headers(),
-                timeout=30
-            )
-
-            if response.status_code == 200:
-                result = response.json()
+        if not self._normalize_tin(tin):
+            raise UserError(_('TIN is required.'))
+        result = self.validate_tins([tin])[self._normalize_tin(tin)]
+        if not result['valid']:
+            raise UserError(_('TIN validation failed: %s') % result['error'])
+        return result
+
+    @api.model
+    def _normalize_tin(self, tin):
+        return (tin or '').strip().upper()
+
+    def validate_tins(self, tins, force=False):
+        """
+        Validate many TINs at once.
+
+        TINs are deduplicated and answered from the cache when possible; the
+        others are fetched from GRA concurrently (bounded by max_concurrency)
+        and cached.
+
+        Args:
+            tins: Iterable of TINs
+            force: Ignore cached answers
+
+        Returns:
+            dict {normalized tin: {valid, tin, name, type, sector, address, error}}
+
+        Raises:
+            EvatConnectionError: VSDC unreachable while fetching uncached TINs
+            UserError: GRA rejected our credentials
+        """
+        self.ensure_one()
+        tins = {self._normalize_tin(tin) for tin in tins} - {''}
+        if not tins:
+            return {}
+        Cache = self.env['ghana.evat.tin.cache'].sudo()
+        cached = {} if force else Cache._get_fresh(self.company_id, tins)
+        missing = sorted(tins - set(cached))
+
+        answers = {}
+        if missing:
+            transport = self._get_transport()
+            base_url = f"{self._get_taxpayer_endpoint()}/identification/tin/"
+            health_url = self._get_health_url()
+
+            def fetch(tin):
+                try:
+                    response = transport.request('GET', base_url + tin, health_url=health_url)
+                except EvatConnectionError as e:
+                    return tin, None, e
+                try:
+                    result = response.json() if response.status_code == 200 else {}
+                except ValueError:
+                    result = {}
                 if result.get('status') == 'SUCCESS':
-                    return result.get('data', {})
-            raise UserError(_('TIN validation failed: %s') % response.text[:200])
-        except requests.exceptions.RequestException as e:
-            raise UserError(_('TIN validation error: %s') % str(e))
+                    return tin, result.get('data') or {'tin': tin}, None
+                if response.status_code in (401, 403):
+                    # Our credentials, not the TIN: nothing to cache
+                    return tin, None, UserError(_('Invalid security key or taxpayer reference (E907).'))
+                return tin, None, (response.text or 'HTTP %s' % response.status_code)[:200]
+
+            workers = max(1, min(self.max_concurrency or 1, len(missing)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='evat-tin') as executor:
+                fetched = list(executor.map(fetch, missing))
+
+            request_error = None
+            for tin, data, error in fetched:
+                if isinstance(error, Exception):
+                    request_error = request_error or error
+                    continue
+                answers[tin] = (data, error)
+            Cache._store(self.company_id, answers)
+            if request_error:
+                raise request_error
+            cached.update(Cache._get_fresh(self.company_id, answers))
+
+        return {tin: entry._to_result() for tin, entry in cached.items()}
 
     @api.model
     def get_config(self, company=None):
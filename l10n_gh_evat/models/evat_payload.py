@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+E-VAT Payload Builder
+
+Invoices and POS orders each built their E-VAT items line by line: the
+levies of a line were computed twice (once for the item, once more for the
+VAT total), the calculation type walked every line's taxes again and the
+configuration was searched once more for the user name.
+
+ghana.evat.payload.mixin builds the items of a document in one pass:
+- Product codes and line taxes are fetched up front for all lines
+- Item category, levies A-E, VAT, discount and base totals come out of the
+  same loop, with taxes classified through the cached per-company map of
+  account.tax
+- The calculation type (tax included or not) is collected along the way
+
+Models using it provide the lines to report (_get_evat_item_lines) and the
+values of a line (_get_evat_line_values); the rest is shared.
+"""
+import logging
+
+from odoo import models
+
+_logger = logging.getLogger(__name__)
+
+
+class GhanaEvatPayloadMixin(models.AbstractModel):
+    """
+    Shared item builder for documents submitted to the GRA VSDC.
+
+    Models using the mixin implement:
+    - _get_evat_item_lines(): the lines reported to E-VAT, in order
+    - _get_evat_line_values(line): dict with keys description, quantity,
+      price_unit and discount_amt
+    """
+    _name = 'ghana.evat.payload.mixin'
+    _description = 'Ghana E-VAT Payload Builder'
+
+    def _get_evat_line_taxes(self, line):
+        """
+        Classify the taxes of a line in one walk.
+
+        Per GRA best practice, taxes should be applied separately:
+        - VAT 15%
+        - NHIL 2.5%
+        - GETFund 2.5%
+        - CST 5% (communication services)
+        - Tourism 1% (hospitality)
+
+        Returns:
+            tuple (item category, amounts, price_include): the GRA item
+            category ("", "CST", "TRSM", "EXM", "RNT", "EXC_PLASTIC") taken
+            from the first tax, a dict of vat, nhil, getfund, cst and tourism
+            amounts, and whether any tax is included in the price
+        """
+        amounts = {'vat': 0.0, 'nhil': 0.0, 'getfund': 0.0, 'cst': 0.0, 'tourism': 0.0}
+        if not line.tax_ids:
+            return 'EXM', amounts, False  # Zero rated/Exempt
+
+        base_amt = line.price_subtotal
+        Tax = self.env['account.tax']
+        item_category = None
+        price_include = False
+        for tax in line.tax_ids:
+            levy, category, rate, included = Tax._get_evat_tax_map(tax.company_id.id)[tax.id]
+            if item_category is None:
+                item_category = category
+            if levy != 'none':
+                amounts[levy] = round(base_amt * rate / 100, 2)
+            price_include = price_include or included
+        return item_category, amounts, price_include
+
+    def _prepare_evat_items(self):
+        """
+        Build the items and totals of the document in one pass.
+
+        Returns:
+            tuple (items, totals) where totals is a dict with levy, vat,
+            discount and base amounts and price_include (True if any line
+            tax is included in the price)
+        """
+        self.ensure_one()
+        lines = self._get_evat_item_lines()
+        lines.product_id.fetch(['default_code'])
+        lines.tax_ids.fetch(['company_id'])
+
+        items = []
+        totals = {'levy': 0.0, 'vat': 0.0, 'discount': 0.0, 'base': 0.0, 'price_include': False}
+        for line in lines:
+            values = self._get_evat_line_values(line)
+            base_amt = line.price_subtotal
+            item_category, tax_amounts, price_include = self._get_evat_line_taxes(line)
+            totals['price_include'] = totals['price_include'] or price_include
+
+            levy_a = tax_amounts['nhil']
+            levy_b = tax_amounts['getfund']
+            levy_d = tax_amounts['cst']
+            levy_e = tax_amounts['tourism']
+
+            # Fallback: if no NHIL/GETFund taxes applied but item is standard taxable,
+            # calculate them (for backward compatibility)
+            if item_category == '' and levy_a == 0 and levy_b == 0 and tax_amounts['vat'] > 0:
+                levy_a = round(base_amt * 0.025, 2)  # NHIL 2.5%
+                levy_b = round(base_amt * 0.025, 2)  # GETFund 2.5%
+                _logger.warning(
+                    'Line "%s" has VAT but no NHIL/GETFund taxes. '
+                    'Consider adding NHIL 2.5%% and GETFund 2.5%% taxes for GRA compliance.',
+                    values['description'],
+                )
+
+            product = line.product_id
+            item = {
+                'itemCode': (product.default_code or f'PROD{product.id}') if product else 'ITEM',
+                'itemCategory': item_category,
+                'expireDate': '',
+                'description': (values['description'] or 'Item')[:100],
+                'quantity': str(round(values['quantity'], 3)),
+                'levyAmountA': levy_a,
+                'levyAmountB': levy_b,
+                'levyAmountC': 0,  # COVID levy - include even if 0 per v8.2 spec
+                'levyAmountD': levy_d,
+                'levyAmountE': levy_e,
+                'discountAmount': values['discount_amt'],
+                'exciseAmount': 0,
+                'batchCode': '',
+                'unitPrice': str(round(values['price_unit'], 2)),
+            }
+            items.append(item)
+
+            totals['levy'] += levy_a + levy_b + levy_d + levy_e
+            totals['vat'] += tax_amounts['vat']
+            totals['discount'] += item['discountAmount']
+            totals['base'] += base_amt
+
+        return items, totals
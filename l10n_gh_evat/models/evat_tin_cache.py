@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+GRA TIN Validation Cache
+
+validate_tin used to call GRA's /identification/tin/{tin} on every
+invocation, so the same business partners were looked up again and again
+during invoicing and partner imports.
+
+ghana.evat.tin.cache keeps the last answer per company and TIN:
+- Valid TINs are trusted for TIN_CACHE_TTL_DAYS, unknown ones for
+  TIN_CACHE_NEGATIVE_TTL_DAYS (a TIN may be registered in the meantime)
+- ghana.evat.config.validate_tins() dedupes a list of TINs, answers what it
+  can from the cache and fetches the rest concurrently over the pooled
+  transport
+- Expired entries are removed by the autovacuum
+"""
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+TIN_CACHE_TTL_DAYS = 30
+TIN_CACHE_NEGATIVE_TTL_DAYS = 1
+
+
+class GhanaEvatTinCache(models.Model):
+    _name = 'ghana.evat.tin.cache'
+    _description = 'Ghana E-VAT TIN Validation Cache'
+    _order = 'date_checked desc'
+    _rec_name = 'tin'
+
+    company_id = fields.Many2one('res.company', string='Company', required=True,
+                                 ondelete='cascade', readonly=True)
+    tin = fields.Char(string='TIN', required=True, readonly=True)
+    valid = fields.Boolean(string='Valid', readonly=True)
+    taxpayer_name = fields.Char(string='Name', readonly=True)
+    taxpayer_type = fields.Char(string='Type', readonly=True)
+    sector = fields.Char(string='Sector', readonly=True)
+    address = fields.Char(string='Address', readonly=True)
+    error = fields.Char(string='Error', readonly=True)
+    date_checked = fields.Datetime(string='Checked On', required=True, readonly=True)
+    date_expire = fields.Datetime(string='Expires On', required=True, readonly=True, index=True)
+
+    _sql_constraints = [
+        ('company_tin_uniq', 'unique(company_id, tin)',
+         'Only one cached validation per TIN and company allowed.'),
+    ]
+
+    @api.model
+    def _get_fresh(self, company, tins):
+        """Unexpired entries for the TINs, keyed by TIN."""
+        entries = self.search([
+            ('company_id', '=', company.id),
+            ('tin', 'in', list(tins)),
+            ('date_expire', '>', fields.Datetime.now()),
+        ])
+        return {entry.tin: entry for entry in entries}
+
+    @api.model
+    def _store(self, company, answers):
+        """
+        Insert or refresh the cache entries for GRA answers.
+
+        Written with INSERT ... ON CONFLICT, so two transactions validating
+        the same new TIN at once (e.g. invoicing and a partner import) do not
+        collide on the unique constraint.
+
+        Args:
+            company: res.company
+            answers: dict {tin: (data dict or None, error message or None)}
+        """
+        if not answers:
+            return
+        now = fields.Datetime.now()
+        rows = []
+        for tin, (data, error) in answers.items():
+            data = data or {}
+            ttl = TIN_CACHE_TTL_DAYS if data else TIN_CACHE_NEGATIVE_TTL_DAYS
+            rows.append((
+                company.id, tin, bool(data),
+                data.get('name') or None, data.get('type') or None,
+                data.get('sector') or None, data.get('address') or None,
+                error or None, now, now + timedelta(days=ttl),
+                self.env.uid, now, self.env.uid, now,
+            ))
+        self.env.cr.execute("""
+            INSERT INTO ghana_evat_tin_cache
+                   (company_id, tin, valid, taxpayer_name, taxpayer_type, sector, address,
+                    error, date_checked, date_expire,
+                    create_uid, create_date, write_uid, write_date)
+            VALUES {values}
+            ON CONFLICT (company_id, tin) DO UPDATE
+               SET valid = EXCLUDED.valid,
+                   taxpayer_name = EXCLUDED.taxpayer_name,
+                   taxpayer_type = EXCLUDED.taxpayer_type,
+                   sector = EXCLUDED.sector,
+                   address = EXCLUDED.address,
+                   error = EXCLUDED.error,
+                   date_checked = EXCLUDED.date_checked,
+                   date_expire = EXCLUDED.date_expire,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """.format(values=', '.join(['%s'] * len(rows))), rows)
+        self.invalidate_model()
+
+    def _to_result(self):
+        """Result dict as returned by ghana.evat.config.validate_tins()."""
+        self.ensure_one()
+        return {
+            'valid': self.valid,
+            'tin': self.tin,
+            'name': self.taxpayer_name or '',
+            'type': self.taxpayer_type or '',
+            'sector': self.sector or '',
+            'address': self.address or '',
+            'error': self.error or '',
+        }
+
+    @api.autovacuum
+    def _gc_expired(self):
+        self.search([('date_expire', '<', fields.Datetime.now())]).unlink()
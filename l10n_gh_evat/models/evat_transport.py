@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Pooled HTTP transport for GRA E-VAT
+
+Every E-VAT request used to be a bare requests.post()/get() with a 30s
+timeout and a fresh TCP and TLS handshake, followed by a write of
+last_request_date and up to 5 KB of last_response on the configuration row,
+a hot row every till of the company contended for.
+
+This module keeps one requests.Session per Odoo worker process and per
+E-VAT configuration, with:
+- Keep-alive connections and a bounded connection pool
+- Separate connect/read timeouts
+- A circuit breaker that fails fast while the VSDC is unreachable, with a
+  background probe of the VSDC /health endpoint that closes it again once
+  GRA reports UP
+- Request telemetry (time, endpoint, status, latency, response excerpt)
+  kept in an in-memory ring buffer instead of on the configuration row
+
+The transport holds no database state and is safe to use from worker threads.
+"""
+import collections
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from odoo import _, fields
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+# Circuit breaker: consecutive connection failures before opening, and
+# seconds to wait before probing the VSDC again
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RESET_TIMEOUT = 30
+CIRCUIT_MAX_RESET_TIMEOUT = 300
+
+# Requests remembered per transport for the configuration form
+TELEMETRY_SIZE = 50
+TELEMETRY_RESPONSE_SIZE = 2000
+
+# Transports keyed by (dbname, config_id); one set per worker process
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+class EvatConnectionError(UserError):
+    """GRA E-VAT could not be reached (network error, timeout, 5xx or open circuit)."""
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker guarding calls to the VSDC.
+
+    States:
+    - closed: requests flow normally
+    - open: requests fail immediately; a background /health probe checks the VSDC
+    - half_open: reset timeout elapsed, a single trial request is let through
+    """
+
+    def __init__(self, probe, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self._probe = probe
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = None
+        self._probe_timer = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() >= self.opened_at + self.reset_timeout:
+                # Let this caller through as the half-open trial
+                self.state = 'half_open'
+                return True
+            return False
+
+    def retry_in(self):
+        """Seconds until the circuit allows a trial request."""
+        return max(int(self.opened_at + self.reset_timeout - time.monotonic()), 0)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                _logger.info('E-VAT circuit closed: GRA VSDC is reachable again')
+            self.state = 'closed'
+            self.failures = 0
+            self.reset_timeout = self.base_reset_timeout
+            self.last_error = None
+            if self._probe_timer:
+                self._probe_timer.cancel()
+                self._probe_timer = None
+
+    def record_failure(self, error, health_url=None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            if self.state == 'half_open':
+                # Trial failed, stay open longer
+                self.reset_timeout = min(self.reset_timeout * 2, CIRCUIT_MAX_RESET_TIMEOUT)
+            elif self.state == 'closed' and self.failures < self.failure_threshold:
+                return
+            elif self.state == 'open':
+                return
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+            _logger.warning(
+                'E-VAT circuit opened after %d failures, retrying in %ds: %s',
+                self.failures, self.reset_timeout, error)
+            if health_url:
+                self._schedule_probe(health_url)
+
+    def _schedule_probe(self, health_url):
+        """Start the background probe timer. Must be called with _lock held."""
+        if self._probe_timer:
+            self._probe_timer.cancel()
+        timer = threading.Timer(self.reset_timeout, self._run_probe, args=(health_url,))
+        timer.daemon = True
+        timer.name = 'evat-circuit-probe'
+        self._probe_timer = timer
+        timer.start()
+
+    def _run_probe(self, health_url):
+        """Background half-open probe: the circuit closes when /health reports UP."""
+        with self._lock:
+            self._probe_timer = None
+            if self.state == 'closed':
+                return
+        try:
+            healthy, error = self._probe(health_url)
+        except requests.exceptions.RequestException as e:
+            healthy, error = False, str(e)
+        if healthy:
+            self.record_success()
+            return
+        with self._lock:
+            if self.state == 'closed':
+                # A live request closed the circuit while the probe was running
+                return
+            self.reset_timeout = min(self.reset_timeout * 2, CIRCUIT_MAX_RESET_TIMEOUT)
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+            self.last_error = error
+            _logger.info('E-VAT circuit probe failed (%s), next probe in %ds', error, self.reset_timeout)
+            self._schedule_probe(health_url)
+
+
+class EvatTransport(object):
+    """
+    Keep-alive HTTP client for a single E-VAT configuration.
+
+    Args:
+        settings: dict with connect_timeout, read_timeout, pool_size and
+            the security headers used by the background /health probe
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.connect_timeout = settings['connect_timeout']
+        self.read_timeout = settings['read_timeout']
+
+        # Invoice submissions are not idempotent: no automatic retries
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings['pool_size'],
+            max_retries=0,
+            pool_block=False,
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(dict(settings['headers']))
+
+        self.breaker = CircuitBreaker(self._probe)
+
+        self._telemetry_lock = threading.Lock()
+        self.telemetry = collections.deque(maxlen=TELEMETRY_SIZE)
+        self.request_count = 0
+        self.error_count = 0
+        self.total_latency = 0.0
+
+    def close(self):
+        self.breaker.record_success()  # cancels any pending probe
+        self.session.close()
+
+    def _probe(self, health_url):
+        """Check the VSDC /health endpoint; returns (healthy, error message)."""
+        response = self.request('GET', health_url, timeout=10, guarded=False)
+        if response.status_code == 200:
+            try:
+                if response.json().get('status') == 'UP':
+                    return True, None
+            except ValueError:
+                pass
+        return False, 'HTTP %s: %s' % (response.status_code, (response.text or '')[:200])
+
+    def request(self, method, url, json=None, health_url=None, timeout=None, guarded=True):
+        """
+        Send a request through the pooled session.
+
+        Args:
+            method: 'GET' or 'POST'
+            url: Full URL
+            json: JSON body (POST only)
+            health_url: /health URL probed while the circuit is open
+            timeout: Read timeout override in seconds
+            guarded: Go through the circuit breaker
+
+        Returns:
+            requests.Response (any status below 500)
+
+        Raises:
+            EvatConnectionError: VSDC unreachable, 5xx or circuit open
+        """
+        if guarded and not self.breaker.allow_request():
+            raise EvatConnectionError(_(
+                'GRA E-VAT is currently unreachable. '
+                'Retrying automatically in %(seconds)s seconds.\n'
+                'Last error: %(error)s'
+            ) % {'seconds': self.breaker.retry_in(), 'error': self.breaker.last_error})
+
+        start = time.monotonic()
+        try:
+            response = self.session.request(
+                method, url, json=json,
+                timeout=(self.connect_timeout, timeout or self.read_timeout),
+            )
+        except requests.exceptions.RequestException as e:
+            self._record(method, url, time.monotonic() - start, error=str(e))
+            if not guarded:
+                raise
+            self.breaker.record_failure(str(e), health_url=health_url)
+            if isinstance(e, requests.exceptions.Timeout):
+                raise EvatConnectionError(_('Connection to GRA E-VAT timed out.'))
+            raise EvatConnectionError(_('Cannot connect to GRA E-VAT: %s') % str(e))
+
+        self._record(method, url, time.monotonic() - start, status=response.status_code,
+                     body=response.text)
+        if not guarded:
+            return response
+        if response.status_code >= 500:
+            error = 'HTTP %s: %s' % (response.status_code, (response.text or '')[:200])
+            self.breaker.record_failure(error, health_url=health_url)
+            raise EvatConnectionError(_('E-VAT API Error: %s') % error)
+        # The VSDC answered: the host is up whatever the payload says
+        self.breaker.record_success()
+        return response
+
+    def _record(self, method, url, latency, status=None, body=None, error=None):
+        with self._telemetry_lock:
+            self.request_count += 1
+            self.total_latency += latency
+            if error or (status and status >= 400):
+                self.error_count += 1
+            self.telemetry.append({
+                'date': fields.Datetime.now(),
+                'method': method,
+                'url': url,
+                'status': status,
+                'latency_ms': round(latency * 1000, 1),
+                'response': (body or error or '')[:TELEMETRY_RESPONSE_SIZE],
+            })
+
+    def get_telemetry(self):
+        """Recent requests, newest first."""
+        with self._telemetry_lock:
+            return list(reversed(self.telemetry))
+
+    def get_stats(self):
+        """
+        Get request counters for this transport.
+
+        Returns:
+            dict with requests, errors, avg_latency_ms and circuit_state
+        """
+        with self._telemetry_lock:
+            count = self.request_count
+            return {
+                'requests': count,
+                'errors': self.error_count,
+                'avg_latency_ms': round(self.total_latency / count * 1000, 1) if count else 0.0,
+                'circuit_state': self.breaker.state,
+            }
+
+
+def get_transport(key, settings):
+    """
+    Get the pooled transport for a configuration, creating it if needed.
+
+    The transport is rebuilt when its settings change (e.g. a new security
+    key entered on the configuration form).
+
+    Args:
+        key: Hashable key, usually (dbname, config_id)
+        settings: dict of transport settings
+
+    Returns:
+        EvatTransport
+    """
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is not None and transport.settings == settings:
+            return transport
+        if transport is not None:
+            transport.close()
+        transport = EvatTransport(settings)
+        _transports[key] = transport
+        _logger.info('E-VAT transport created for %s', key)
+        return transport
+
+
+def peek_transport(key):
+    """Get the transport for a key without creating one (None if not created yet)."""
+    return _transports.get(key)
@@ -1,15 +1,50 @@
 # -*- coding: utf-8 -*-
+"""
+Ghana E-VAT for POS orders
+
+Orders synced from the till used to be submitted to GRA inside
+create_from_ui, one blocking VSDC call per order: a till syncing a backlog
+of offline orders waited minutes for its RPC and often timed out.
+
+create_from_ui now only queues paid orders (evat_state = 'queued'); the
+pos.order rows themselves are the persistent queue. A cron drains it:
+- Due orders are split into lanes per company, at most the configuration's
+  max_concurrency lanes, each run in a worker thread with its own cursor
+- Each order is locked with FOR UPDATE SKIP LOCKED before it is sent and
+  committed on its own, so no order is submitted twice
+- Failures are retried with exponential backoff and marked failed after
+  EVAT_MAX_ATTEMPTS attempts
+- Receipt data is pushed to the POS over the bus as soon as GRA returns it
+"""
 import json
 import logging
-from datetime import datetime
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+
+from .evat_transport import EvatConnectionError
 
 _logger = logging.getLogger(__name__)
 
+# Retry backoff: 1 min, 2 min, 4 min ... capped at 6 hours
+EVAT_RETRY_BASE_DELAY = 60
+EVAT_RETRY_MAX_DELAY = 6 * 3600
+EVAT_MAX_ATTEMPTS = 8
+
+# Hard cap on worker threads per cron run, across all companies
+EVAT_MAX_WORKER_THREADS = 16
+
+# Bus notification carrying receipt data to the POS
+EVAT_BUS_NOTIFICATION = 'l10n_gh_evat.receipt'
+
 
 class PosOrder(models.Model):
-    _inherit = 'pos.order'
+    _inherit = ['pos.order', 'ghana.evat.payload.mixin']
 
     # E-VAT Fields (v8.2)
     evat_submitted = fields.Boolean(string='Submitted to E-VAT', copy=False)
@@ -28,6 +63,23 @@ class PosOrder(models.Model):
     evat_submit_date = fields.Datetime(string='E-VAT Submit Date', copy=False, readonly=True)
     evat_response = fields.Text(string='E-VAT Response', copy=False, readonly=True)
 
+    # Submission queue
+    evat_state = fields.Selection([
+        ('queued', 'Queued'),
+        ('retry', 'Retry Scheduled'),
+        ('submitted', 'Submitted'),
+        ('failed', 'Failed'),
+    ], string='E-VAT Status', copy=False, readonly=True, index=True)
+    evat_attempts = fields.Integer(string='E-VAT Attempts', copy=False, readonly=True)
+    evat_next_attempt = fields.Datetime(string='E-VAT Next Attempt', copy=False, readonly=True)
+    evat_error = fields.Text(string='E-VAT Error', copy=False, readonly=True)
+
+    def init(self):
+        super().init()
+        # The cron only ever looks at queued orders
+        create_index(self._cr, 'pos_order_evat_queue_idx', self._table,
+                     ['evat_next_attempt', 'id'], where="evat_state IN ('queued', 'retry')")
+
     def _get_evat_date(self, dt=None):
         """Format date for GRA E-VAT v8.2: YYYY-MM-DD"""
         dt = dt or self.date_order or fields.Datetime.now()
@@ -35,136 +87,28 @@ class PosOrder(models.Model):
             dt = fields.Datetime.from_string(dt)
         return dt.strftime('%Y-%m-%d')
 
-    def _get_evat_item_category(self, line):
-        """
-        Determine GRA item category code for POS line.
-        Valid values: "", "CST", "TRSM", "EXM", "RNT", "EXC_PLASTIC"
-        """
-        if not line.tax_ids:
-            return 'EXM'  # Zero rated/Exempt
-
-        tax = line.tax_ids[0]
-        tax_name = (tax.name or '').upper()
-
-        # Check tax name for category hints
-        if 'CST' in tax_name or 'COMMUNICATION' in tax_name:
-            return 'CST'
-        elif 'TOURISM' in tax_name or 'TRSM' in tax_name:
-            return 'TRSM'
-        elif 'EXEMPT' in tax_name or tax.amount == 0:
-            return 'EXM'
-        elif 'RENT' in tax_name:
-            return 'RNT'
-        elif 'PLASTIC' in tax_name or 'EXCISE' in tax_name:
-            return 'EXC_PLASTIC'
-
-        return ''  # Standard taxable item
-
-    def _get_line_tax_amounts(self, line):
-        """
-        Extract VAT, NHIL, GETFund, CST, and Tourism amounts from POS line taxes.
-        Returns dict with vat, nhil, getfund, cst, tourism amounts.
-
-        Per GRA best practice, taxes should be applied separately:
-        - VAT 15%
-        - NHIL 2.5%
-        - GETFund 2.5%
-        - CST 5% (communication services)
-        - Tourism 1% (hospitality)
-        """
-        result = {'vat': 0.0, 'nhil': 0.0, 'getfund': 0.0, 'cst': 0.0, 'tourism': 0.0}
-        base_amt = line.price_subtotal
-
-        if not line.tax_ids:
-            return result
-
-        for tax in line.tax_ids:
-            tax_name = (tax.name or '').upper()
-            tax_amount = round(base_amt * tax.amount / 100, 2)
-
-            if 'NHIL' in tax_name:
-                result['nhil'] = tax_amount
-            elif 'GETFUND' in tax_name or 'GET FUND' in tax_name or 'GETFund' in tax.name:
-                result['getfund'] = tax_amount
-            elif 'CST' in tax_name or 'COMMUNICATION' in tax_name:
-                result['cst'] = tax_amount
-            elif 'TOURISM' in tax_name:
-                result['tourism'] = tax_amount
-            elif 'VAT' in tax_name and tax.amount > 0:
-                result['vat'] = tax_amount
-
-        return result
-
-    def _prepare_evat_item(self, line):
-        """Prepare a single POS order line for GRA E-VAT v8.2."""
-        base_amt = line.price_subtotal
-        item_category = self._get_evat_item_category(line)
-
-        # Get actual tax amounts from Odoo taxes
-        tax_amounts = self._get_line_tax_amounts(line)
-
-        # Use actual tax amounts if available, otherwise calculate
-        levy_a = tax_amounts['nhil']
-        levy_b = tax_amounts['getfund']
-        levy_d = tax_amounts['cst']
-        levy_e = tax_amounts['tourism']
-
-        # Fallback: if no NHIL/GETFund taxes applied but item is standard taxable,
-        # calculate them (for backward compatibility)
-        if item_category == '' and levy_a == 0 and levy_b == 0:
-            # Check if VAT is applied - if so, levies should also apply
-            if tax_amounts['vat'] > 0:
-                levy_a = round(base_amt * 0.025, 2)  # NHIL 2.5%
-                levy_b = round(base_amt * 0.025, 2)  # GETFund 2.5%
-                _logger.warning(
-                    'POS line "%s" has VAT but no NHIL/GETFund taxes. '
-                    'Consider adding NHIL 2.5%% and GETFund 2.5%% taxes for GRA compliance.',
-                    line.full_product_name or line.product_id.name
-                )
-
-        discount_amt = round(line.discount * line.price_unit * line.qty / 100, 2) if line.discount else 0
+    def _get_evat_item_lines(self):
+        return self.lines
 
+    def _get_evat_line_values(self, line):
         return {
-            'itemCode': line.product_id.default_code or f'PROD{line.product_id.id}' if line.product_id else 'ITEM',
-            'itemCategory': item_category,
-            'expireDate': '',
-            'description': (line.full_product_name or line.product_id.name or 'Item')[:100],
-            'quantity': str(round(line.qty, 3)),
-            'levyAmountA': levy_a,
-            'levyAmountB': levy_b,
-            'levyAmountC': 0,  # COVID levy - include even if 0 per v8.2 spec
-            'levyAmountD': levy_d,
-            'levyAmountE': levy_e,
-            'discountAmount': discount_amt,
-            'exciseAmount': 0,
-            'batchCode': '',
-            'unitPrice': str(round(line.price_unit, 2)),
+            'description': line.full_product_name or line.product_id.name,
+            'quantity': line.qty,
+            'price_unit': line.price_unit,
+            'discount_amt': round(line.discount * line.price_unit * line.qty / 100, 2) if line.discount else 0,
         }
 
-    def _prepare_evat_payload(self):
-        """Prepare the full GRA E-VAT v8.2 payload for POS order."""
-        self.ensure_one()
-
-        config = self.env['ghana.evat.config'].get_config(self.company_id)
-
-        items = []
-        total_levy = 0.0
-        total_vat = 0.0
-        total_discount = 0.0
-        total_base = 0.0
-
-        for line in self.lines:
-            item = self._prepare_evat_item(line)
-            items.append(item)
+    def _prepare_evat_payload(self, config=None):
+        """
+        Prepare the full GRA E-VAT v8.2 payload for POS order.
 
-            # Accumulate levy totals from item
-            total_levy += item['levyAmountA'] + item['levyAmountB'] + item['levyAmountD'] + item['levyAmountE']
-            total_discount += item['discountAmount']
-            total_base += line.price_subtotal
+        Args:
+            config: ghana.evat.config of the company, looked up if not given
+        """
+        self.ensure_one()
 
-            # Get VAT amount from actual taxes
-            tax_amounts = self._get_line_tax_amounts(line)
-            total_vat += tax_amounts['vat']
+        config = config or self.env['ghana.evat.config'].get_config(self.company_id)
+        items, totals = self._prepare_evat_items()
 
         # Determine flag
         flag = 'REFUND' if self.amount_total < 0 else 'INVOICE'
@@ -185,19 +129,19 @@ class PosOrder(models.Model):
             'currency': self.currency_id.name or 'GHS',
             'exchangeRate': exchange_rate,
             'invoiceNumber': self.pos_reference or self.name or '',
-            'totalLevy': round(total_levy, 2),
+            'totalLevy': round(totals['levy'], 2),
             'userName': config.user_name,
             'flag': flag,
             'calculationType': 'EXCLUSIVE',
-            'totalVat': round(total_vat, 2),
+            'totalVat': round(totals['vat'], 2),
             'transactionDate': self._get_evat_date(),
-            'totalAmount': round(abs(total_base), 2),
+            'totalAmount': round(abs(totals['base']), 2),
             'totalExciseAmount': 0.00,
             'businessPartnerName': client_name[:100],
             'businessPartnerTin': client_tin,
             'saleType': 'NORMAL',
             'discountType': 'GENERAL',
-            'discountAmount': round(total_discount, 2),
+            'discountAmount': round(totals['discount'], 2),
             'reference': '',
             'groupReferenceId': '',
             'purchaseOrderReference': '',
@@ -217,7 +161,7 @@ class PosOrder(models.Model):
             raise UserError(_('Only paid orders can be submitted to E-VAT.'))
 
         config = self.env['ghana.evat.config'].get_config(self.company_id)
-        payload = self._prepare_evat_payload()
+        payload = self._prepare_evat_payload(config)
 
         _logger.info('Submitting POS order %s to GRA E-VAT v8.2', self.name)
 
@@ -239,7 +183,10 @@ class PosOrder(models.Model):
                 'evat_signature': message.get('ysdcregsig', ''),
                 'evat_qrcode': response_data.get('qr_code', ''),
                 'evat_response': json.dumps(result, indent=2),
+                'evat_state': 'submitted',
+                'evat_error': False,
             })
+            self._evat_notify_pos()
 
             return {
                 'evat_submitted': True,
@@ -257,28 +204,160 @@ class PosOrder(models.Model):
 
     @api.model
     def create_from_ui(self, orders, draft=False):
-        """Override to auto-submit to E-VAT after order creation."""
+        """Queue paid orders for E-VAT submission; the till does not wait for GRA."""
         order_ids = super().create_from_ui(orders, draft=draft)
-
-        # Get the created orders
         orders = self.browse([o['id'] for o in order_ids])
+        orders.filtered(lambda o: o.state in ('paid', 'done') and not o.evat_submitted)._evat_enqueue()
+        return order_ids
 
-        # Auto-submit to E-VAT for paid orders
-        for order in orders.filtered(lambda o: o.state in ('paid', 'done') and not o.evat_submitted):
-            try:
-                # Check if E-VAT is configured
-                config = self.env['ghana.evat.config'].search([
-                    ('company_id', '=', order.company_id.id)
-                ], limit=1)
-
-                if config:
-                    order.action_submit_evat()
-                    _logger.info('E-VAT auto-submitted for POS order %s', order.name)
-            except Exception as e:
-                _logger.warning('E-VAT auto-submission failed for %s: %s', order.name, str(e))
-                # Don't fail the order creation, just log the warning
+    def _evat_enqueue(self):
+        """Queue orders of E-VAT configured companies for background submission."""
+        configured = self.env['ghana.evat.config'].sudo().search([
+            ('company_id', 'in', self.company_id.ids),
+        ]).company_id
+        orders = self.filtered(lambda o: o.company_id in configured and not o.evat_submitted
+                               and o.evat_state not in ('queued', 'retry'))
+        if not orders:
+            return
+        orders.write({
+            'evat_state': 'queued',
+            'evat_attempts': 0,
+            'evat_next_attempt': False,
+            'evat_error': False,
+        })
+        self.env.ref('l10n_gh_evat.ir_cron_evat_pos_queue')._trigger()
+
+    def action_evat_requeue(self):
+        """Put failed orders back in the submission queue."""
+        self.filtered(lambda o: o.evat_state == 'failed')._evat_enqueue()
 
-        return order_ids
+    @api.model
+    def _cron_process_evat_queue(self, limit=200):
+        """Submit due queued orders in per-company worker lanes."""
+        self.flush_model(['evat_state', 'evat_next_attempt'])
+        self.env.cr.execute("""
+            SELECT id FROM pos_order
+             WHERE evat_state IN ('queued', 'retry')
+               AND (evat_next_attempt IS NULL
+                    OR evat_next_attempt <= now() at time zone 'UTC')
+          ORDER BY id
+             LIMIT %s
+        """, (limit,))
+        order_ids = [row[0] for row in self.env.cr.fetchall()]
+        if not order_ids:
+            return
+
+        lanes = self.browse(order_ids)._evat_build_lanes()
+        _logger.info('E-VAT queue: processing %d POS orders in %d lanes', len(order_ids), len(lanes))
+        workers = min(len(lanes), EVAT_MAX_WORKER_THREADS)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='evat-pos') as executor:
+            futures = [executor.submit(self._evat_run_lane, lane) for lane in lanes]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception:
+                    _logger.exception('E-VAT queue lane crashed')
+
+        # More due orders than one batch: run again right away
+        if len(order_ids) >= limit:
+            self.env.ref('l10n_gh_evat.ir_cron_evat_pos_queue')._trigger()
+
+    def _evat_build_lanes(self):
+        """Split orders into lanes of ids, at most max_concurrency lanes per company."""
+        configs = {
+            config.company_id.id: config
+            for config in self.env['ghana.evat.config'].sudo().search([
+                ('company_id', 'in', self.company_id.ids),
+            ])
+        }
+        by_company = defaultdict(list)
+        for order in self:
+            by_company[order.company_id.id].append(order.id)
+
+        lanes = []
+        for company_id, ids in by_company.items():
+            config = configs.get(company_id)
+            concurrency = max(config.max_concurrency if config else 1, 1)
+            lane_count = min(concurrency, len(ids))
+            lanes.extend(ids[i::lane_count] for i in range(lane_count))
+        return lanes
+
+    def _evat_run_lane(self, order_ids):
+        """Submit a lane of orders, one transaction per order (worker thread)."""
+        threading.current_thread().dbname = self.env.cr.dbname
+        with self.env.registry.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            for order_id in order_ids:
+                cr.execute("""
+                    SELECT id FROM pos_order
+                     WHERE id = %s AND evat_state IN ('queued', 'retry')
+                       FOR UPDATE SKIP LOCKED
+                """, (order_id,))
+                if not cr.fetchone():
+                    continue
+                try:
+                    env['pos.order'].browse(order_id)._evat_submit_from_queue()
+                except EvatConnectionError as e:
+                    # GRA is down: leave the rest of the lane for the next run
+                    _logger.warning('E-VAT queue lane paused: %s', str(e))
+                    cr.commit()
+                    break
+                cr.commit()
+
+    def _evat_submit_from_queue(self):
+        """
+        Submit a queued order; schedule a retry or fail it on error.
+
+        Raises:
+            EvatConnectionError: VSDC unreachable; the order is rescheduled
+                without counting the attempt
+        """
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                self.with_company(self.company_id).action_submit_evat()
+        except EvatConnectionError as e:
+            self.write({
+                'evat_state': 'retry',
+                'evat_next_attempt': fields.Datetime.now() + timedelta(seconds=EVAT_RETRY_BASE_DELAY),
+                'evat_error': str(e),
+            })
+            raise
+        except Exception as e:
+            attempts = self.evat_attempts + 1
+            if attempts >= EVAT_MAX_ATTEMPTS:
+                _logger.error('E-VAT submission of %s failed after %d attempts: %s',
+                              self.name, attempts, str(e))
+                self.write({'evat_state': 'failed', 'evat_attempts': attempts, 'evat_error': str(e)})
+                self._evat_notify_pos()
+                return
+            delay = min(EVAT_RETRY_BASE_DELAY * 2 ** (attempts - 1), EVAT_RETRY_MAX_DELAY)
+            self.write({
+                'evat_state': 'retry',
+                'evat_attempts': attempts,
+                'evat_next_attempt': fields.Datetime.now() + timedelta(seconds=delay),
+                'evat_error': str(e),
+            })
+            return
+        _logger.info('E-VAT submitted for POS order %s', self.name)
+
+    def _evat_notify_pos(self):
+        """Push E-VAT receipt data (or the final error) to the POS of the order."""
+        notifications = []
+        for order in self.filtered('config_id'):
+            notifications.append((
+                order._evat_bus_channel(),
+                EVAT_BUS_NOTIFICATION,
+                dict(order.get_evat_receipt_data(),
+                     pos_reference=order.pos_reference,
+                     evat_error=order.evat_error or ''),
+            ))
+        if notifications:
+            self.env['bus.bus']._sendmany(notifications)
+
+    def _evat_bus_channel(self):
+        self.ensure_one()
+        return f'l10n_gh_evat_{self.config_id.access_token}'
 
     def get_evat_receipt_data(self):
         """Get E-VAT data for receipt printing."""
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from odoo import models, _
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    def action_validate_evat_tin(self):
+        """Validate the TINs of the selected partners with GRA in one batch."""
+        config = self.env['ghana.evat.config'].get_config(self.env.company)
+        # A VAT made of blanks normalises to '' and is skipped like a missing one
+        partners = self.filtered(lambda p: config._normalize_tin(p.vat))
+        results = config.validate_tins(partners.mapped('vat'))
+
+        invalid = [
+            '%s (%s): %s' % (partner.display_name, partner.vat,
+                             results[config._normalize_tin(partner.vat)]['error'])
+            for partner in partners
+            if not results[config._normalize_tin(partner.vat)]['valid']
+        ]
+        message = _('%(valid)s of %(total)s TINs are valid (%(skipped)s partners without TIN).',
+                    valid=len(partners) - len(invalid), total=len(partners),
+                    skipped=len(self) - len(partners))
+        if invalid:
+            message += '\n' + '\n'.join(invalid[:10])
+            if len(invalid) > 10:
+                message += '\n' + _('... and %s more', len(invalid) - 10)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('GRA TIN Validation'),
+                'message': message,
+                'type': 'warning' if invalid else 'success',
+                'sticky': bool(invalid),
+            }
+        }
@@ -1,8 +1,35 @@
 /** @odoo-module */
 
 import { Order } from "@point_of_sale/app/store/models";
+import { PosStore } from "@point_of_sale/app/store/pos_store";
 import { patch } from "@web/core/utils/patch";
 
+/**
+ * Orders are submitted to GRA in the background after sync; the server
+ * pushes the E-VAT receipt data of this POS's orders over the bus.
+ */
+patch(PosStore.prototype, {
+    async setup() {
+        await super.setup(...arguments);
+        const bus = this.env.services.bus_service;
+        bus.addChannel(`l10n_gh_evat_${this.config.access_token}`);
+        bus.subscribe("l10n_gh_evat.receipt", (payload) => this.applyEvatReceipt(payload));
+    },
+
+    applyEvatReceipt(payload) {
+        const order = this.get_order_list().find((o) => o.name === payload.pos_reference);
+        if (order) {
+            order.set_evat_data(payload);
+        }
+        if (payload.evat_error && !payload.evat_submitted) {
+            this.env.services.notification.add(
+                `E-VAT submission failed for ${payload.pos_reference}: ${payload.evat_error}`,
+                { type: "warning", sticky: true }
+            );
+        }
+    },
+});
+
 patch(Order.prototype, {
     /**
      * Get E-VAT data for receipt
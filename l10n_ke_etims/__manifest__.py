@@ -6,7 +6,7 @@
     # - TIS_MAJOR: Breaking changes or major KRA compliance updates
     # - TIS_MINOR: New features or KRA requirement additions
     # - TIS_PATCH: Bug fixes and minor improvements
-    'version': '17.0.2.0.1',
+    'version': '17.0.2.0.2',
     'category': 'Accounting/Localizations',
     'summary': 'VumaERP KRA eTIMS OSCU integration for Kenya',
     'description': """
@@ -39,6 +39,8 @@ FEATURES
 - UNSPSC classification management for products
 - Multi-branch support with branch IDs
 - Sandbox and Production environment support
+- Background submission queue with retry (checkout never waits on KRA)
+- Bulk product registration in resumable, concurrent batches
 
 VERSIONING
 ----------
@@ -61,7 +63,11 @@ For KRA registration, report TIS Version as: 2.0.0
         'views/etims_config_views.xml',
         'views/etims_code_views.xml',
         'views/etims_daily_report_views.xml',
+        'views/etims_submission_job_views.xml',
+        'views/etims_registration_batch_views.xml',
+        'views/etims_transaction_line_views.xml',
         'views/product_views.xml',
+        'views/account_tax_views.xml',
         'views/account_move_views.xml',
         'views/menu.xml',
     ],
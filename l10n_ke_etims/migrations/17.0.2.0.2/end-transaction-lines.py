@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Backfill the eTIMS transaction ledger for documents submitted before it existed.
+
+Runs at the end of the upgrade so POS orders are included when
+l10n_ke_etims_pos is installed.
+
+The payloads sent to KRA were never stored (etims_response only holds KRA's
+answer), so the items are rebuilt from the current products, taxes and tax
+type mapping. They may differ from what KRA received; the rows are flagged
+as backfilled so reports and audits can tell them apart.
+"""
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+
+def _backfill(env, records, link_field):
+    Line = env['etims.transaction.line']
+    env.cr.execute(
+        f"SELECT DISTINCT {link_field} FROM etims_transaction_line WHERE {link_field} IS NOT NULL")
+    done = {row[0] for row in env.cr.fetchall()}
+
+    count = 0
+    for record in records.filtered(lambda r: r.id not in done):
+        items = record._prepare_etims_items()[0]
+        Line._create_from_payload({'invcNo': record.etims_invoice_number, 'itemList': items}, {
+            link_field: record.id,
+            'company_id': record.company_id.id,
+            'receipt_type_label': record.etims_receipt_type_label,
+            'submit_date': record.etims_submit_date or record.write_date,
+            'backfilled': True,
+        })
+        count += 1
+    return count
+
+
+def migrate(cr, version):
+    env = api.Environment(cr, SUPERUSER_ID, {})
+
+    moves = env['account.move'].search([
+        ('etims_submitted', '=', True),
+        ('move_type', 'in', ('out_invoice', 'out_refund')),
+    ])
+    count = _backfill(env, moves, 'move_id')
+    _logger.info('eTIMS ledger backfilled for %d invoices', count)
+
+    if 'pos_order_id' in env['etims.transaction.line']._fields:
+        orders = env['pos.order'].search([('etims_submitted', '=', True)])
+        count = _backfill(env, orders, 'pos_order_id')
+        _logger.info('eTIMS ledger backfilled for %d POS orders', count)
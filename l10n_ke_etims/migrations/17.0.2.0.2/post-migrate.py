@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Seed etims.counter from the invoice numbers already used.
+
+Counters are also seeded lazily on first use; seeding here avoids the
+one-off MAX() scan happening during a sale.
+"""
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    cr.execute("SELECT to_regclass('pos_order') IS NOT NULL")
+    has_pos = cr.fetchone()[0]
+
+    pos_max = """
+        UNION ALL
+        SELECT company_id, MAX(etims_invoice_number)
+        FROM pos_order
+        WHERE etims_invoice_number IS NOT NULL
+        GROUP BY company_id
+    """ if has_pos else ""
+
+    cr.execute("""
+        INSERT INTO etims_counter
+               (company_id, bhf_id, counter_type, last_number,
+                create_uid, create_date, write_uid, write_date)
+        SELECT cfg.company_id, COALESCE(cfg.bhf_id, '00'), 'invoice', COALESCE(MAX(used.max_num), 0),
+               1, now() at time zone 'UTC', 1, now() at time zone 'UTC'
+        FROM etims_config cfg
+        LEFT JOIN (
+            SELECT company_id, MAX(etims_invoice_number) AS max_num
+            FROM account_move
+            WHERE etims_invoice_number IS NOT NULL
+            GROUP BY company_id
+            {pos_max}
+        ) used ON used.company_id = cfg.company_id
+        GROUP BY cfg.company_id, cfg.bhf_id
+        ON CONFLICT (company_id, bhf_id, counter_type) DO NOTHING
+    """.format(pos_max=pos_max))
+    _logger.info('Seeded %d eTIMS invoice counters', cr.rowcount)
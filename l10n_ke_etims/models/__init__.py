@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
 from . import etims_config
 from . import etims_code
+from . import etims_counter
+from . import etims_payload
 from . import etims_receipt
+from . import etims_registration_batch
+from . import etims_submission_job
+from . import etims_transaction_line
 from . import etims_daily_report
 from . import product_template
+from . import account_tax
 from . import account_move
@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
 import logging
-from datetime import datetime
+from datetime import date, datetime
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+
+from .etims_transport import EtimsConnectionError
 
 _logger = logging.getLogger(__name__)
 
+# Larger manual selections are handed to the submission queue: a synchronous
+# batch holds the etims.counter row lock across all of its KRA round trips
+ETIMS_BULK_SYNC_LIMIT = 10
+
 
 class AccountMove(models.Model):
-    _inherit = 'account.move'
+    _inherit = ['account.move', 'etims.sales.payload.mixin']
 
     # eTIMS Fields
     etims_submitted = fields.Boolean(string='Submitted to eTIMS', copy=False)
@@ -57,9 +64,18 @@ class AccountMove(models.Model):
     etims_qr_code = fields.Binary(
         string='eTIMS QR Code',
         compute='_compute_etims_qr_code',
-        help='QR code for receipt per TIS spec'
+        store=True,
+        attachment=True,
+        copy=False,
+        help='QR code for receipt per TIS spec, rendered once when KRA returns the receipt data'
     )
 
+    def init(self):
+        super().init()
+        # X/Z reports aggregate submitted invoices by submission date
+        create_index(self._cr, 'account_move_etims_submit_date_idx', self._table,
+                     ['company_id', 'etims_submit_date'], where='etims_submitted')
+
     @api.depends('etims_transaction_type', 'move_type')
     def _compute_etims_receipt_type_label(self):
         """Compute receipt type label per TIS spec Section 4."""
@@ -86,7 +102,6 @@ class AccountMove(models.Model):
                  'etims_intrl_data', 'etims_rcpt_sign')
     def _compute_etims_qr_code(self):
         """Generate QR code image per TIS spec."""
-        import base64
         for move in self:
             if not move.etims_submitted:
                 move.etims_qr_code = False
@@ -111,40 +126,15 @@ class AccountMove(models.Model):
     def _get_next_etims_invoice_number(self):
         """
         Get the next sequential eTIMS invoice number.
-        Uses PostgreSQL advisory lock to prevent race conditions.
+
+        Numbers come from the company's etims.counter row (O(1), no scan of
+        the invoice history). The number is stored on the invoice right away,
+        so a retried submission reuses it instead of consuming a new one.
         """
         self.ensure_one()
-        self.env.cr.execute(
-            "SELECT pg_advisory_xact_lock(hashtext(%s))",
-            (f'etims_invc_no_{self.company_id.id}',)
-        )
-        # Check if pos_order table exists (POS module may not be installed)
-        self.env.cr.execute(
-            "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'pos_order')"
-        )
-        has_pos = self.env.cr.fetchone()[0]
-
-        if has_pos:
-            self.env.cr.execute("""
-                SELECT COALESCE(MAX(max_num), 0) + 1 FROM (
-                    SELECT MAX(etims_invoice_number) as max_num
-                    FROM account_move
-                    WHERE company_id = %s AND etims_invoice_number IS NOT NULL
-                    UNION ALL
-                    SELECT MAX(etims_invoice_number) as max_num
-                    FROM pos_order
-                    WHERE company_id = %s AND etims_invoice_number IS NOT NULL
-                ) combined
-            """, (self.company_id.id, self.company_id.id))
-        else:
-            self.env.cr.execute("""
-                SELECT COALESCE(MAX(etims_invoice_number), 0) + 1
-                FROM account_move
-                WHERE company_id = %s AND etims_invoice_number IS NOT NULL
-            """, (self.company_id.id,))
-
-        result = self.env.cr.fetchone()
-        return result[0] if result else 1
+        number = self.env['etims.counter']._reserve(self.company_id, 'invoice')
+        self.etims_invoice_number = number
+        return number
 
     def _get_etims_date(self, dt=None):
         """Format date for eTIMS: YYYYMMDD"""
@@ -160,97 +150,20 @@ class AccountMove(models.Model):
             dt = fields.Datetime.from_string(dt)
         return dt.strftime('%Y%m%d%H%M%S')
 
-    def _get_etims_tax_code(self, tax):
-        """
-        Map Odoo tax to eTIMS tax type code.
-        A = Exempt, B = 16%, C = 0%, D = Non-VAT, E = 8%
-        """
-        if not tax:
-            return 'D'
-        amount = tax.amount if tax else 0
-        if amount == 16:
-            return 'B'
-        elif amount == 8:
-            return 'E'
-        elif amount == 0:
-            return 'C'
-        else:
-            return 'D'
-
-    def _prepare_etims_item(self, line, seq):
-        """Prepare a single invoice line for eTIMS."""
-        product = line.product_id
-        product_tmpl = product.product_tmpl_id if product else None
-
-        # Get tax information - prefer product's eTIMS tax type, fallback to line tax
-        tax = line.tax_ids[:1] if line.tax_ids else None
-        if product_tmpl and product_tmpl.l10n_ke_tax_type:
-            tax_code = product_tmpl.l10n_ke_tax_type
-        else:
-            tax_code = self._get_etims_tax_code(tax)
-
-        tax_amt = tax.amount if tax else 0
-        tax_is_inclusive = tax.price_include if tax else True
-
-        unit_price = line.price_unit
-        qty = line.quantity
-        discount_amt = (line.price_unit * line.quantity * line.discount / 100) if line.discount else 0
-        supply_amt = (unit_price * qty) - discount_amt
-
-        # Calculate tax - handle both inclusive and exclusive pricing for B2B support
-        if tax_amt > 0:
-            if tax_is_inclusive:
-                # Tax-inclusive: price already includes tax, extract taxable amount
-                taxable_amt = supply_amt / (1 + tax_amt / 100)
-                tax_amount = supply_amt - taxable_amt
-            else:
-                # Tax-exclusive: price is net, calculate tax to add
-                taxable_amt = supply_amt
-                tax_amount = supply_amt * tax_amt / 100
-                # For eTIMS, supply_amt should be the gross amount
-                supply_amt = taxable_amt + tax_amount
-        else:
-            taxable_amt = supply_amt
-            tax_amount = 0
-
-        # Get item code - use eTIMS item code if registered, else default_code
-        if product:
-            item_code = product._get_etims_item_code()[:20]
-        else:
-            item_code = 'SVC'
-
-        # Get UNSPSC classification code from product
-        if product:
-            item_class_code = product._get_etims_item_class_code()
-        else:
-            item_class_code = ''
-
-        # Get unit codes from product
-        if product:
-            unit_codes = product._get_etims_unit_codes()
-            pkg_unit_code = unit_codes['pkg_unit']
-            qty_unit_code = unit_codes['qty_unit']
-        else:
-            pkg_unit_code = 'NT'
-            qty_unit_code = 'U'
+    def _get_etims_item_lines(self):
+        # Odoo 17 product lines have display_type 'product', not False
+        return self.invoice_line_ids.filtered(lambda l: l.display_type == 'product')
 
+    def _get_etims_line_amounts(self, line):
+        discount_amt = (line.price_unit * line.quantity * line.discount / 100) if line.discount else 0
         return {
-            'itemSeq': seq,
-            'itemCd': item_code,
-            'itemClsCd': item_class_code,
-            'itemNm': (line.name or (product.name if product else 'Item'))[:200],
-            'pkgUnitCd': pkg_unit_code,
-            'pkg': 1,
-            'qtyUnitCd': qty_unit_code,
-            'qty': qty,
-            'prc': round(unit_price, 2),
-            'splyAmt': round(supply_amt, 2),
-            'dcRt': line.discount or 0,
-            'dcAmt': round(discount_amt, 2),
-            'taxTyCd': tax_code,
-            'taxblAmt': round(taxable_amt, 2),
-            'taxAmt': round(tax_amount, 2),
-            'totAmt': round(supply_amt, 2),
+            'name': line.name or line.product_id.name,
+            'qty': line.quantity,
+            'price_unit': line.price_unit,
+            'discount': line.discount,
+            'discount_amt': discount_amt,
+            'supply_amt': (line.price_unit * line.quantity) - discount_amt,
+            'tax': line.tax_ids[:1] or None,
         }
 
     def _prepare_etims_payload(self):
@@ -260,21 +173,7 @@ class AccountMove(models.Model):
         if self.move_type not in ('out_invoice', 'out_refund'):
             raise UserError(_('Only customer invoices can be submitted to eTIMS.'))
 
-        # Prepare items
-        items = []
-        totals = {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'E': 0}
-        tax_totals = {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'E': 0}
-
-        seq = 0
-        for line in self.invoice_line_ids.filtered(lambda l: not l.display_type):
-            seq += 1
-            item = self._prepare_etims_item(line, seq)
-            items.append(item)
-
-            # Accumulate totals by tax type
-            tax_code = item['taxTyCd']
-            totals[tax_code] += item['taxblAmt']
-            tax_totals[tax_code] += item['taxAmt']
+        items, totals, tax_totals = self._prepare_etims_items()
 
         # Receipt type: S=Sale, R=Refund
         rcpt_ty_cd = 'R' if self.move_type == 'out_refund' else 'S'
@@ -371,8 +270,15 @@ class AccountMove(models.Model):
 
         return payload
 
-    def action_submit_etims(self):
-        """Submit invoice to eTIMS."""
+    def _check_etims_submission(self, infos, submitting=None):
+        """
+        Raise UserError if the invoice cannot be submitted to eTIMS.
+
+        Args:
+            infos: product.product._get_etims_item_infos() covering the invoice lines
+            submitting: Invoices sent before this one in the same batch; a
+                credit note may reference one of them as its original
+        """
         self.ensure_one()
 
         if self.etims_submitted:
@@ -381,41 +287,30 @@ class AccountMove(models.Model):
         if self.state != 'posted':
             raise UserError(_('Only posted invoices can be submitted to eTIMS.'))
 
+        if self.move_type not in ('out_invoice', 'out_refund'):
+            raise UserError(_('Only customer invoices can be submitted to eTIMS.'))
+
         # For credit notes, validate that the original invoice was submitted to eTIMS
-        if self.move_type == 'out_refund' and self.reversed_entry_id:
-            if not self.reversed_entry_id.etims_submitted:
+        original = self.reversed_entry_id
+        if self.move_type == 'out_refund' and original:
+            if not original.etims_submitted and original not in (submitting or self.browse()):
                 raise UserError(_(
                     'Cannot submit this credit note to eTIMS because the original '
                     'invoice (%s) has not been submitted yet.\n\n'
                     'Please submit the original invoice to eTIMS first, then submit this credit note.'
-                ) % self.reversed_entry_id.name)
+                ) % original.name)
 
         # Validate products are registered with eTIMS and have UNSPSC codes
-        product_lines = self.invoice_line_ids.filtered(
-            lambda l: not l.display_type and l.product_id
-        )
-
-        # Check for unregistered products
-        unregistered = product_lines.filtered(
-            lambda l: not l.product_id.product_tmpl_id.l10n_ke_etims_registered
-        )
-        if unregistered:
-            product_names = ', '.join(unregistered.mapped('product_id.name')[:5])
-            raise UserError(_(
-                'The following products must be registered with eTIMS before submitting the invoice:\n%s'
-                '\n\nGo to the product form and click "Register with eTIMS".'
-            ) % product_names)
-
-        # Check for missing UNSPSC classifications
-        missing_unspsc = product_lines.filtered(
-            lambda l: not l.product_id.product_tmpl_id.l10n_ke_item_class_id
-        )
-        if missing_unspsc:
-            product_names = ', '.join(missing_unspsc.mapped('product_id.name')[:5])
-            raise UserError(_(
-                'The following products are missing UNSPSC classification:\n%s'
-                '\n\nGo to the product form, eTIMS Kenya tab, and select a UNSPSC Classification.'
-            ) % product_names)
+        product_ids = set(self._get_etims_item_lines().product_id.ids)
+        self._check_etims_products({pid: info for pid, info in infos.items() if pid in product_ids})
+
+    def action_submit_etims(self):
+        """Submit invoice(s) to eTIMS."""
+        if len(self) > 1:
+            return self._action_submit_etims_bulk()
+        self.ensure_one()
+
+        self._check_etims_submission(self._get_etims_item_lines().product_id._get_etims_item_infos())
 
         # Get config and verify OSCU connection
         config = self.env['etims.config'].get_config(self.company_id)
@@ -425,35 +320,253 @@ class AccountMove(models.Model):
         payload = self._prepare_etims_payload()
         result = config._call_api('/saveTrnsSalesOsdc', payload)
 
-        # Process response per OSCU spec TrnsSalesSaveWrRes
-        if result.get('resultCd') == '000':
-            data = result.get('data', {})
-            # Get SDC ID from config (set during device initialization)
-            sdc_id = config.sdc_id if hasattr(config, 'sdc_id') else ''
-            # Per OSCU spec: curRcptNo is the current receipt number
-            rcpt_no = str(data.get('curRcptNo', data.get('rcptNo', '')))
-
-            self.write({
-                'etims_submitted': True,
-                'etims_invoice_number': payload.get('invcNo'),  # Store the invoice number we sent
-                'etims_sdc_id': sdc_id,
-                'etims_rcpt_no': rcpt_no,
-                'etims_intrl_data': data.get('intrlData', ''),
-                'etims_rcpt_sign': data.get('rcptSign', ''),
-                'etims_sdc_datetime': data.get('sdcDateTime', ''),
-                'etims_submit_date': fields.Datetime.now(),
-                'etims_response': str(result),
-            })
+        if self._etims_process_response(config, payload, result):
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
                 'params': {
                     'title': _('Success'),
-                    'message': _('Invoice submitted to eTIMS. Receipt #: %s') % rcpt_no,
+                    'message': _('Invoice submitted to eTIMS. Receipt #: %s') % self.etims_rcpt_no,
                     'type': 'success',
                 }
             }
-        else:
-            error_msg = result.get('resultMsg', 'Unknown error')
+        raise UserError(_('eTIMS Error: %s') % result.get('resultMsg', 'Unknown error'))
+
+    def _action_submit_etims_bulk(self):
+        """
+        Submit the selected invoices and report the outcome per invoice.
+
+        Up to ETIMS_BULK_SYNC_LIMIT invoices are sent right away; larger
+        selections are handed to the submission queue so the request does not
+        outlive the HTTP worker.
+        """
+        moves = self.filtered(lambda m: m.move_type in ('out_invoice', 'out_refund'))
+        if len(moves) > ETIMS_BULK_SYNC_LIMIT:
+            # Same priority as the other sales: the sale lane must not jump ahead
+            # of POS orders that already hold lower invoice numbers
+            jobs = self.env['etims.submission.job']._enqueue(
+                moves.filtered(lambda m: m.state == 'posted' and not m.etims_submitted))
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('eTIMS Submission'),
+                    'message': _('%(count)s invoices queued for eTIMS submission.', count=len(jobs)),
+                    'type': 'info',
+                }
+            }
+
+        results = {}
+        for company, company_moves in moves.grouped('company_id').items():
+            results.update(company_moves.with_company(company)._etims_submit_bulk())
+
+        counts = dict.fromkeys(('submitted', 'skipped', 'failed', 'pending'), 0)
+        failures = []
+        for move in moves:
+            state, error = results[move.id]
+            counts[state] += 1
+            if state != 'submitted' and error:
+                failures.append('%s: %s' % (move.name, error))
+
+        message = _(
+            'Submitted: %(submitted)s, Skipped: %(skipped)s, Failed: %(failed)s, Pending: %(pending)s',
+            **counts)
+        if failures:
+            message += '\n' + '\n'.join(failures[:10])
+            if len(failures) > 10:
+                message += '\n' + _('... and %s more', len(failures) - 10)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('eTIMS Submission'),
+                'message': message,
+                'type': 'warning' if failures else 'success',
+                'sticky': bool(failures),
+            }
+        }
+
+    def _etims_submit_bulk(self):
+        """
+        Submit invoices of one company to eTIMS.
+
+        Products of all invoices are read once and every invoice is validated
+        against them before anything is sent. Invoice numbers for the valid
+        invoices are reserved in one counter update; the invoices are then
+        sent in number order over the pooled connection, since KRA expects
+        invcNo in sequence. Originals go before their credit notes.
+
+        A number is only handed to an invoice when it is sent: an invoice
+        KRA rejects gives its number to the next one, and numbers left over
+        are released at the end, so the numbering stays gapless.
+
+        Returns:
+            dict {move_id: (state, error message or False)} with state one of
+            submitted, skipped (already submitted), failed or pending (KRA
+            unreachable)
+        """
+        results = {}
+        moves = self.sorted(lambda m: (m.move_type == 'out_refund', m.invoice_date or date.min, m.id))
+        infos = moves._get_etims_item_lines().product_id._get_etims_item_infos()
+        locked = moves._etims_lock_for_submission()
+
+        valid = self.browse()
+        for move in moves:
+            if move.etims_submitted:
+                results[move.id] = ('skipped', False)
+                continue
+            if move not in locked:
+                results[move.id] = ('failed', _('Invoice is being submitted by another process.'))
+                continue
+            try:
+                move._check_etims_submission(infos, submitting=valid)
+            except UserError as e:
+                results[move.id] = ('failed', str(e))
+                continue
+            valid |= move
+        if not valid:
+            return results
+
+        config = self.env['etims.config'].get_config(self.env.company)
+        is_ready, error_msg = config.check_connection(raise_on_error=False)
+        if not is_ready:
+            results.update({move.id: ('failed', error_msg) for move in valid})
+            return results
+
+        # One counter update for the whole batch. Invoices still holding a
+        # number from an earlier attempt go first, they are the lowest.
+        unnumbered = valid.filtered(lambda m: not m.etims_invoice_number)
+        next_number = last_number = 0
+        if unnumbered:
+            next_number = self.env['etims.counter']._reserve(self.env.company, 'invoice', count=len(unnumbered))
+            last_number = next_number + len(unnumbered) - 1
+
+        ordered = (valid - unnumbered).sorted('etims_invoice_number') + unnumbered
+        for index, move in enumerate(ordered):
+            original = move.reversed_entry_id
+            if move.move_type == 'out_refund' and original and not original.etims_submitted:
+                results[move.id] = ('failed', _('Original invoice %s was not accepted by eTIMS.') % original.name)
+                continue
+            fresh = not move.etims_invoice_number
+            if fresh:
+                move.etims_invoice_number = next_number
+            try:
+                with self.env.cr.savepoint():
+                    payload = move._prepare_etims_payload()
+                    result = config._call_api('/saveTrnsSalesOsdc', payload)
+                    accepted = move._etims_process_response(config, payload, result)
+            except EtimsConnectionError as e:
+                # KRA may have received this number: keep it for the retry,
+                # the invoices after it are numbered on the next attempt
+                if fresh:
+                    next_number += 1
+                for pending in ordered[index:]:
+                    results[pending.id] = ('pending', str(e))
+                break
+            except UserError as e:
+                accepted = False
+                error = str(e)
+            else:
+                error = not accepted and _('eTIMS Error: %s') % result.get('resultMsg', 'Unknown error')
+            if accepted:
+                results[move.id] = ('submitted', False)
+                if fresh:
+                    next_number += 1
+            else:
+                results[move.id] = ('failed', error)
+                if fresh:
+                    # The number goes to the next invoice of the batch
+                    move.etims_invoice_number = 0
+
+        if unnumbered and next_number <= last_number:
+            self.env['etims.counter']._release(self.env.company, 'invoice', next_number, last_number)
+        return results
+
+    def _etims_lock_for_submission(self):
+        """
+        Lock the unsubmitted invoices of this recordset for submission.
+
+        The submission queue may pick up an invoice while it is submitted
+        manually; only the transaction holding the row lock sends it.
+        Invoices locked by another transaction are left out.
+        """
+        if not self:
+            return self
+        self.flush_recordset(['etims_submitted'])
+        self.env.cr.execute("""
+            SELECT id FROM account_move
+             WHERE id IN %s AND etims_submitted IS NOT TRUE
+               FOR UPDATE SKIP LOCKED
+        """, (tuple(self.ids),))
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _etims_process_response(self, config, payload, result):
+        """
+        Store the KRA response of a sales submission.
+
+        On success the receipt data is written on the invoice and the item
+        lines are recorded in the eTIMS transaction ledger.
+
+        Returns:
+            bool: True if KRA accepted the transaction
+        """
+        self.ensure_one()
+
+        # Process response per OSCU spec TrnsSalesSaveWrRes
+        if result.get('resultCd') != '000':
             self.etims_response = str(result)
-            raise UserError(_('eTIMS Error: %s') % error_msg)
+            return False
+
+        data = result.get('data', {})
+        # Get SDC ID from config (set during device initialization)
+        sdc_id = config.sdc_id if hasattr(config, 'sdc_id') else ''
+        # Per OSCU spec: curRcptNo is the current receipt number
+        rcpt_no = str(data.get('curRcptNo', data.get('rcptNo', '')))
+
+        self.write({
+            'etims_submitted': True,
+            'etims_invoice_number': payload.get('invcNo'),  # Store the invoice number we sent
+            'etims_sdc_id': sdc_id,
+            'etims_rcpt_no': rcpt_no,
+            'etims_intrl_data': data.get('intrlData', ''),
+            'etims_rcpt_sign': data.get('rcptSign', ''),
+            'etims_sdc_datetime': data.get('sdcDateTime', ''),
+            'etims_submit_date': fields.Datetime.now(),
+            'etims_response': str(result),
+        })
+        self.env['etims.transaction.line']._create_from_payload(payload, {
+            'move_id': self.id,
+            'company_id': self.company_id.id,
+            'receipt_type_label': self.etims_receipt_type_label,
+            'submit_date': self.etims_submit_date,
+        })
+        return True
+
+    def _etims_submit_from_job(self):
+        """
+        Submission queue handler (see etims.submission.job).
+
+        Returns:
+            dict {move_id: error message or False}
+        """
+        errors = {}
+        for move in self:
+            if move.etims_submitted:
+                errors[move.id] = False
+                continue
+            connection_error = None
+            try:
+                with self.env.cr.savepoint():
+                    try:
+                        move.action_submit_etims()
+                    except EtimsConnectionError as e:
+                        # KRA may hold the invcNo already: keep it and the counter
+                        # increment, the retry resends the same number
+                        connection_error = e
+            except UserError as e:
+                errors[move.id] = str(e)
+                continue
+            if connection_error:
+                raise connection_error
+            errors[move.id] = False
+        return errors
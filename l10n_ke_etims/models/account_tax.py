@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+eTIMS Tax Type of Odoo Taxes
+
+Payload building used to map every line's tax to a KRA tax type (A-E) by
+comparing tax.amount again, separately in the invoice, POS order and POS
+order line code.
+
+The tax type is now stored on account.tax, derived from the rate and
+editable for the odd tax the rate does not describe (e.g. an exempt 0% tax
+that must be reported as A rather than C). Line building reads it from a
+per-company {tax id: tax type} map held in an ormcache, cleared whenever
+taxes are created, written or deleted.
+"""
+from odoo import api, fields, models, tools
+
+
+class AccountTax(models.Model):
+    _inherit = 'account.tax'
+
+    l10n_ke_tax_type = fields.Selection([
+        ('A', 'A - Exempt'),
+        ('B', 'B - Standard Rate (16%)'),
+        ('C', 'C - Zero Rate (0%)'),
+        ('D', 'D - Non-VAT'),
+        ('E', 'E - Reduced Rate (8%)'),
+    ], string='eTIMS Tax Type', compute='_compute_l10n_ke_tax_type', store=True, readonly=False,
+       help='KRA tax type reported for lines using this tax. Derived from the rate, can be overridden.')
+
+    @api.depends('amount')
+    def _compute_l10n_ke_tax_type(self):
+        for tax in self:
+            if tax.amount == 16:
+                tax.l10n_ke_tax_type = 'B'
+            elif tax.amount == 8:
+                tax.l10n_ke_tax_type = 'E'
+            elif tax.amount == 0:
+                tax.l10n_ke_tax_type = 'C'
+            else:
+                tax.l10n_ke_tax_type = 'D'
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_etims_tax_type_map(self, company_id):
+        """{tax id: eTIMS tax type} of every tax of the company, active or not."""
+        taxes = self.with_context(active_test=False).sudo().search_read(
+            [('company_id', '=', company_id)], ['l10n_ke_tax_type'])
+        return {tax['id']: tax['l10n_ke_tax_type'] or 'D' for tax in taxes}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        taxes = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return taxes
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'amount' in vals or 'l10n_ke_tax_type' in vals or 'company_id' in vals:
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
@@ -11,10 +11,53 @@ These models store KRA standard codes fetched from eTIMS including:
 """
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.tools import SQL, escape_psql
+from odoo.tools.sql import create_index
+import hashlib
+import json
 import logging
+import time
 
 _logger = logging.getLogger(__name__)
 
+# lastReqDt used when a code type has never been synced
+DEFAULT_LAST_REQ_DT = '20200101000000'
+
+# Rows per INSERT ... ON CONFLICT statement
+UPSERT_BATCH_SIZE = 1000
+
+# Code types fetched from /selectCodeList
+CODE_LIST_TYPES = [
+    ('01', 'Item Classification'),
+    ('02', 'Taxation Type'),
+    ('04', 'Packaging Unit'),
+    ('05', 'Quantity Unit'),
+    ('06', 'Payment Type'),
+]
+
+# Sync log code type for the UNSPSC list (/selectItemClsList)
+ITEM_CLASS_SYNC_TYPE = 'item_class'
+
+
+def _sync_hash(values):
+    """Stable hash of the synced values of a row, to skip unchanged rows."""
+    return hashlib.md5(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _unspsc_hierarchy(code, level=None):
+    """
+    Derive (parent_code, level) from a UNSPSC code.
+
+    UNSPSC codes are built from 2-digit pairs padded with zeros:
+    segment 10000000, family 10100000, class 10101500, commodity 10101501.
+    """
+    if not level:
+        significant = len(code.rstrip('0'))
+        level = max((significant + 1) // 2, 1)
+    if level <= 1:
+        return False, 1
+    return code[:2 * (level - 1)].ljust(len(code), '0'), level
+
 
 class EtimsCode(models.Model):
     """
@@ -45,6 +88,8 @@ class EtimsCode(models.Model):
     name = fields.Char(string='Name', required=True)
     description = fields.Text(string='Description')
     active = fields.Boolean(default=True)
+    sync_hash = fields.Char(string='Sync Hash', readonly=True, copy=False,
+                            help='Hash of the values last received from KRA')
 
     _sql_constraints = [
         ('code_type_uniq', 'unique(code_type, code)',
@@ -94,9 +139,9 @@ class EtimsItemClass(models.Model):
     _rec_name = 'display_name'
     _order = 'code'
 
-    code = fields.Char(string='Classification Code', required=True, index=True,
+    code = fields.Char(string='Classification Code', required=True, index='trigram',
                        help='UNSPSC Classification Code from KRA')
-    name = fields.Char(string='Name', required=True)
+    name = fields.Char(string='Name', required=True, index='trigram')
     display_name = fields.Char(string='Display Name', compute='_compute_display_name', store=True)
 
     # Tax information associated with this classification
@@ -109,6 +154,8 @@ class EtimsItemClass(models.Model):
     level = fields.Integer(string='Level', help='Hierarchy level (1=Segment, 2=Family, 3=Class, 4=Commodity)')
 
     active = fields.Boolean(default=True)
+    sync_hash = fields.Char(string='Sync Hash', readonly=True, copy=False,
+                            help='Hash of the values last received from KRA')
 
     _sql_constraints = [
         ('code_uniq', 'unique(code)', 'Classification code must be unique.'),
@@ -119,29 +166,93 @@ class EtimsItemClass(models.Model):
         for rec in self:
             rec.display_name = f"[{rec.code}] {rec.name}" if rec.code and rec.name else rec.name or rec.code
 
+    def init(self):
+        # Prefix search on the hierarchical code (LIKE '5010%') regardless of
+        # the database collation; infix/name search uses the trigram indexes
+        create_index(self._cr, 'etims_item_class_code_prefix_idx', self._table,
+                     ['code text_pattern_ops'])
+
+    @api.model
+    def _name_search(self, name, domain=None, operator='ilike', limit=None, order=None):
+        """
+        Ranked autocomplete for the product form UNSPSC field.
+
+        Exact code matches come first, then codes in the sub-tree of the
+        input (e.g. a family code lists its classes and commodities, by
+        level), then name matches. Only the contains operators are ranked;
+        exact-match operators such as '=ilike' keep the standard behaviour.
+        """
+        term = (name or '').strip()
+        if not term or operator not in ('ilike', 'like'):
+            return super()._name_search(name, domain, operator, limit, order)
+        return self._search_ranked(term, domain, limit)
+
+    @api.model
+    def _search_ranked(self, term, domain=None, limit=None):
+        """
+        Build a ranked search query for a code or name fragment.
+
+        Returns:
+            Query of matching etims.item.class ids, best matches first
+        """
+        prefix = escape_psql(self._get_code_prefix(term)) + '%'
+        code = SQL.identifier(self._table, 'code')
+
+        query = self._search(domain or [], limit=limit)
+        query.add_where(SQL(
+            "(%s LIKE %s OR %s ILIKE %s)",
+            code, prefix, SQL.identifier(self._table, 'name'), '%' + escape_psql(term) + '%',
+        ))
+        query.order = SQL(
+            "CASE WHEN %s = %s THEN 0 WHEN %s LIKE %s THEN 1 ELSE 2 END, %s, %s",
+            code, term, code, prefix, SQL.identifier(self._table, 'level'), code,
+        )
+        return query
+
+    @api.model
+    def _get_code_prefix(self, term):
+        """
+        Code prefix for a search term.
+
+        A full segment, family or class code ends in 00 pairs; dropping them
+        turns it into a prefix matching the whole sub-tree
+        (10100000 -> 1010 -> family 10100000 and everything below it).
+        """
+        if not term.isdigit():
+            return term
+        while len(term) > 2 and term.endswith('00'):
+            term = term[:-2]
+        return term
+
     @api.model
     def search_by_name_or_code(self, search_term, limit=100):
-        """Search classifications by name or code."""
-        return self.search([
-            '|',
-            ('code', 'ilike', search_term),
-            ('name', 'ilike', search_term),
-        ], limit=limit)
+        """Search classifications by name or code, best matches first."""
+        return self.browse(self._search_ranked(search_term.strip(), limit=limit))
 
 
 class EtimsCodeSync(models.Model):
     """
     Handles synchronization of OSCU codes from KRA eTIMS.
     This is typically triggered by a scheduled action.
+
+    Each code type is synced incrementally from its own last successful sync
+    (lastReqDt). Rows whose values did not change are skipped by hash, and
+    changed rows are written with bulk INSERT ... ON CONFLICT statements.
     """
     _name = 'etims.code.sync'
     _description = 'eTIMS Code Sync Log'
+    _order = 'sync_date desc, id desc'
 
     sync_date = fields.Datetime(string='Sync Date', default=fields.Datetime.now, readonly=True)
     company_id = fields.Many2one('res.company', string='Company', required=True,
                                  default=lambda self: self.env.company)
     code_type = fields.Char(string='Code Type Synced')
+    last_req_dt = fields.Char(string='Changes Since', readonly=True,
+                              help='lastReqDt sent to KRA (YYYYMMDDHHmmss)')
     records_synced = fields.Integer(string='Records Synced', default=0)
+    records_skipped = fields.Integer(string='Unchanged', default=0,
+                                     help='Rows received from KRA that were already up to date')
+    duration = fields.Float(string='Duration (s)', digits=(16, 2))
     status = fields.Selection([
         ('success', 'Success'),
         ('failed', 'Failed'),
@@ -149,19 +260,20 @@ class EtimsCodeSync(models.Model):
     ], string='Status', default='success')
     error_message = fields.Text(string='Error Message')
 
-    def _get_last_sync_date(self, code_type=None):
+    def _get_last_sync_date(self, code_type=None, company=None):
         """
         Get the last sync date for a code type.
         Returns datetime in eTIMS format: YYYYMMDDHHmmss
         """
-        domain = [('company_id', '=', self.env.company.id), ('status', '=', 'success')]
+        company = company or self.env.company
+        domain = [('company_id', '=', company.id), ('status', '=', 'success')]
         if code_type:
             domain.append(('code_type', '=', code_type))
 
         last_sync = self.search(domain, order='sync_date desc', limit=1)
         if last_sync and last_sync.sync_date:
             return last_sync.sync_date.strftime('%Y%m%d%H%M%S')
-        return '20200101000000'  # Default start date
+        return DEFAULT_LAST_REQ_DT
 
     @api.model
     def sync_all_codes(self, company=None):
@@ -171,107 +283,208 @@ class EtimsCodeSync(models.Model):
         """
         company = company or self.env.company
         config = self.env['etims.config'].get_config(company)
+        run_start = time.monotonic()
 
-        # Get last sync date for incremental sync
-        last_req_dt = self._get_last_sync_date()
-
-        # Code types to fetch - per OSCU spec, /selectCodeList uses lastReqDt
-        code_endpoints = [
-            ('/selectCodeList', '01', 'Item Classification'),
-            ('/selectCodeList', '02', 'Taxation Type'),
-            ('/selectCodeList', '04', 'Packaging Unit'),
-            ('/selectCodeList', '05', 'Quantity Unit'),
-            ('/selectCodeList', '06', 'Payment Type'),
-        ]
-
-        total_synced = 0
-        errors = []
+        # /selectCodeList answers the same for every code type; fetch it
+        # once per lastReqDt
+        responses = {}
 
-        for endpoint, code_type, type_name in code_endpoints:
-            try:
+        def fetch_code_list(last_req_dt):
+            if last_req_dt not in responses:
                 # Per OSCU spec: lastReqDt is required for /selectCodeList
-                result = config._call_api(endpoint, {'lastReqDt': last_req_dt})
+                responses[last_req_dt] = config._call_api('/selectCodeList', {'lastReqDt': last_req_dt})
+            return responses[last_req_dt]
 
-                if result.get('resultCd') == '000':
-                    data_list = result.get('data', {}).get('clsList', [])
-                    count = self._process_code_list(code_type, data_list)
-                    total_synced += count
-                    _logger.info('Synced %d %s codes', count, type_name)
-                else:
-                    errors.append(f"{type_name}: {result.get('resultMsg', 'Unknown error')}")
-
-            except Exception as e:
-                errors.append(f"{type_name}: {str(e)}")
-                _logger.error('Error syncing %s: %s', type_name, str(e))
+        logs = self.browse()
+        for code_type, type_name in CODE_LIST_TYPES:
+            logs |= self._sync_type(
+                company, code_type, type_name,
+                lambda last_req_dt, code_type=code_type: self._process_code_list(
+                    code_type, self._get_result_list(fetch_code_list(last_req_dt), 'clsList')))
 
         # Sync item classifications separately (larger dataset)
-        try:
-            cls_count = self._sync_item_classifications(config)
-            total_synced += cls_count
-        except Exception as e:
-            errors.append(f"Item Classifications: {str(e)}")
+        logs |= self._sync_type(
+            company, ITEM_CLASS_SYNC_TYPE, 'Item Classifications',
+            lambda last_req_dt: self._sync_item_classifications(config, last_req_dt))
+
+        total_synced = sum(logs.mapped('records_synced'))
+        errors = [log.error_message for log in logs if log.status == 'failed']
 
-        # Log the sync
+        # Log the run
         self.create({
             'company_id': company.id,
             'code_type': 'all',
             'records_synced': total_synced,
+            'records_skipped': sum(logs.mapped('records_skipped')),
+            'duration': time.monotonic() - run_start,
             'status': 'failed' if errors and total_synced == 0 else ('partial' if errors else 'success'),
             'error_message': '\n'.join(errors) if errors else False,
         })
 
         return total_synced
 
-    def _process_code_list(self, code_type, data_list):
-        """Process a list of codes from eTIMS API response."""
-        Code = self.env['etims.code']
-        count = 0
-
-        for item in data_list:
-            Code.create_or_update({
-                'code_type': code_type,
-                'code': item.get('cd') or item.get('cdCls'),
-                'name': item.get('cdNm') or item.get('cdClsNm', ''),
-                'description': item.get('cdDesc', ''),
-            })
-            count += 1
+    def _sync_type(self, company, code_type, type_name, sync_fn):
+        """
+        Sync one code type and record the run in the sync log.
 
-        return count
+        Args:
+            sync_fn: callable(last_req_dt) returning (synced, skipped)
 
-    def _sync_item_classifications(self, config):
-        """Sync item classifications (UNSPSC codes) from eTIMS."""
-        ItemClass = self.env['etims.item.class']
+        Returns:
+            etims.code.sync log record
+        """
+        last_req_dt = self._get_last_sync_date(code_type, company)
+        # Changes made while the request is running are picked up next time
+        started = fields.Datetime.now()
+        start = time.monotonic()
+        try:
+            with self.env.cr.savepoint():
+                synced, skipped = sync_fn(last_req_dt)
+            status, error = 'success', False
+            _logger.info('Synced %d %s codes since %s (%d unchanged) in %.2fs',
+                         synced, type_name, last_req_dt, skipped, time.monotonic() - start)
+        except Exception as e:
+            synced = skipped = 0
+            status, error = 'failed', f"{type_name}: {str(e)}"
+            _logger.error('Error syncing %s: %s', type_name, str(e))
 
-        result = config._call_api('/selectItemClsList', {'lastReqDt': '20200101000000'})
+        return self.create({
+            'sync_date': started,
+            'company_id': company.id,
+            'code_type': code_type,
+            'last_req_dt': last_req_dt,
+            'records_synced': synced,
+            'records_skipped': skipped,
+            'duration': time.monotonic() - start,
+            'status': status,
+            'error_message': error,
+        })
 
+    @api.model
+    def _get_result_list(self, result, key):
+        """Extract the data list of a code API response."""
+        if result.get('resultCd') == '001':
+            # No changes since lastReqDt
+            return []
         if result.get('resultCd') != '000':
-            raise UserError(_('Failed to fetch item classifications: %s') % result.get('resultMsg'))
+            raise UserError(result.get('resultMsg', 'Unknown error'))
+        return (result.get('data') or {}).get(key) or []
+
+    def _process_code_list(self, code_type, data_list):
+        """
+        Process a list of codes from eTIMS API response.
+
+        Returns:
+            tuple (rows written, rows unchanged)
+        """
+        rows = {}
+        for item in data_list:
+            code = item.get('cd') or item.get('cdCls')
+            if not code:
+                continue
+            values = {
+                'name': item.get('cdNm') or item.get('cdClsNm', ''),
+                'description': item.get('cdDesc', '') or '',
+            }
+            rows[code] = (values, _sync_hash(values))
+
+        self.env.cr.execute(
+            "SELECT code, sync_hash FROM etims_code WHERE code_type = %s", (code_type,))
+        known = dict(self.env.cr.fetchall())
+        changed = [(code, values, hash_) for code, (values, hash_) in rows.items()
+                   if known.get(code) != hash_]
+
+        for i in range(0, len(changed), UPSERT_BATCH_SIZE):
+            batch = changed[i:i + UPSERT_BATCH_SIZE]
+            self.env.cr.execute("""
+                INSERT INTO etims_code
+                       (code_type, code, name, description, active, sync_hash,
+                        create_uid, create_date, write_uid, write_date)
+                VALUES {values}
+                ON CONFLICT (code_type, code) DO UPDATE
+                   SET name = EXCLUDED.name,
+                       description = EXCLUDED.description,
+                       sync_hash = EXCLUDED.sync_hash,
+                       write_uid = EXCLUDED.write_uid,
+                       write_date = EXCLUDED.write_date
+                 WHERE etims_code.sync_hash IS DISTINCT FROM EXCLUDED.sync_hash
+            """.format(values=', '.join(['%s'] * len(batch))), [
+                (code_type, code, values['name'], values['description'], True, hash_,
+                 self.env.uid, fields.Datetime.now(), self.env.uid, fields.Datetime.now())
+                for code, values, hash_ in batch
+            ])
+
+        if changed:
+            self.env['etims.code'].invalidate_model()
+        return len(changed), len(rows) - len(changed)
+
+    def _sync_item_classifications(self, config, last_req_dt=DEFAULT_LAST_REQ_DT):
+        """
+        Sync item classifications (UNSPSC codes) from eTIMS.
 
-        data_list = result.get('data', {}).get('itemClsList', [])
-        count = 0
+        Returns:
+            tuple (rows written, rows unchanged)
+        """
+        result = config._call_api('/selectItemClsList', {'lastReqDt': last_req_dt})
+        try:
+            data_list = self._get_result_list(result, 'itemClsList')
+        except UserError as e:
+            raise UserError(_('Failed to fetch item classifications: %s') % str(e))
 
+        rows = {}
         for item in data_list:
             code = item.get('itemClsCd', '')
             if not code:
                 continue
-
-            existing = ItemClass.search([('code', '=', code)], limit=1)
-            vals = {
-                'code': code,
-                'name': item.get('itemClsNm', ''),
-                'tax_type_code': item.get('taxTyCd', ''),
+            parent_code, level = _unspsc_hierarchy(code, int(item.get('itemClsLvl') or 0))
+            values = {
+                'name': item.get('itemClsNm', '') or '',
+                'tax_type_code': item.get('taxTyCd', '') or '',
                 'tax_rate': float(item.get('taxRate', 0) or 0),
+                'parent_code': parent_code,
+                'level': level,
+                'active': item.get('useYn', 'Y') != 'N',
             }
-
-            if existing:
-                existing.write(vals)
-            else:
-                ItemClass.create(vals)
-
-            count += 1
-
-        _logger.info('Synced %d item classifications', count)
-        return count
+            rows[code] = (values, _sync_hash(values))
+
+        self.env.cr.execute("SELECT code, sync_hash FROM etims_item_class")
+        known = dict(self.env.cr.fetchall())
+        changed = [(code, values, hash_) for code, (values, hash_) in rows.items()
+                   if known.get(code) != hash_]
+
+        for i in range(0, len(changed), UPSERT_BATCH_SIZE):
+            batch = changed[i:i + UPSERT_BATCH_SIZE]
+            self.env.cr.execute("""
+                INSERT INTO etims_item_class
+                       (code, name, display_name, tax_type_code, tax_rate, parent_code,
+                        level, active, sync_hash, create_uid, create_date, write_uid, write_date)
+                VALUES {values}
+                ON CONFLICT (code) DO UPDATE
+                   SET name = EXCLUDED.name,
+                       display_name = EXCLUDED.display_name,
+                       tax_type_code = EXCLUDED.tax_type_code,
+                       tax_rate = EXCLUDED.tax_rate,
+                       parent_code = EXCLUDED.parent_code,
+                       level = EXCLUDED.level,
+                       active = EXCLUDED.active,
+                       sync_hash = EXCLUDED.sync_hash,
+                       write_uid = EXCLUDED.write_uid,
+                       write_date = EXCLUDED.write_date
+                 WHERE etims_item_class.sync_hash IS DISTINCT FROM EXCLUDED.sync_hash
+            """.format(values=', '.join(['%s'] * len(batch))), [
+                (code, values['name'],
+                 f"[{code}] {values['name']}" if values['name'] else code,
+                 values['tax_type_code'], values['tax_rate'], values['parent_code'] or None,
+                 values['level'], values['active'], hash_,
+                 self.env.uid, fields.Datetime.now(), self.env.uid, fields.Datetime.now())
+                for code, values, hash_ in batch
+            ])
+
+        if changed:
+            self.env['etims.item.class'].invalidate_model()
+        _logger.info('Synced %d item classifications (%d unchanged)',
+                     len(changed), len(rows) - len(changed))
+        return len(changed), len(rows) - len(changed)
 
     @api.model
     def action_sync_codes(self):
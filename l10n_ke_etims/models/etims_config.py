@@ -2,10 +2,13 @@
 import json
 import logging
 import re
-import requests
+from concurrent.futures import ThreadPoolExecutor
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 
+from .etims_transport import EtimsConnectionError, get_transport, peek_transport
+
 _logger = logging.getLogger(__name__)
 
 # ============================================================================
@@ -109,9 +112,48 @@ class EtimsConfig(models.Model):
     initialization_error = fields.Text(string='Initialization Error',
         help='Last initialization error message from KRA')
 
-    # Status
-    last_request_date = fields.Datetime(string='Last Request')
-    last_response = fields.Text(string='Last Response')
+    # Status (current worker process only, see etims_transport)
+    last_request_date = fields.Datetime(string='Last Request', compute='_compute_transport_stats')
+    last_response = fields.Text(string='Last Response', compute='_compute_transport_stats')
+    request_log = fields.Text(string='Recent Requests', compute='_compute_transport_stats')
+
+    # HTTP Transport (pooled keep-alive connections, one pool per worker process)
+    connect_timeout = fields.Integer(
+        string='Connect Timeout (s)', default=10,
+        help='Seconds to wait for a TCP/TLS connection to KRA')
+    read_timeout = fields.Integer(
+        string='Read Timeout (s)', default=30,
+        help='Seconds to wait for KRA to respond once connected')
+    pool_size = fields.Integer(
+        string='Connection Pool Size', default=10,
+        help='Maximum keep-alive connections kept open to KRA per worker process')
+    max_retries = fields.Integer(
+        string='Max Retries', default=2,
+        help='Retries (with backoff) for requests that never reached KRA, '
+             'e.g. connection refused. Submissions are not retried on gateway '
+             'errors; the submission queue retries them.')
+
+    # Submission queue
+    max_concurrency = fields.Integer(
+        string='Max Concurrent Submissions', default=4,
+        help='Maximum worker threads the submission queue uses for this company. '
+             'Sales transactions always run one at a time, in invoice number order.')
+
+    # Transport counters (current worker process only)
+    transport_requests = fields.Integer(
+        string='Requests Sent', compute='_compute_transport_stats')
+    transport_reused = fields.Integer(
+        string='Reused Connections', compute='_compute_transport_stats',
+        help='Requests served over an already-open keep-alive connection')
+    transport_avg_latency = fields.Float(
+        string='Avg Latency (ms)', compute='_compute_transport_stats')
+    transport_circuit_state = fields.Selection([
+        ('closed', 'Closed (KRA reachable)'),
+        ('open', 'Open (failing fast)'),
+        ('half_open', 'Half-open (probing)'),
+    ], string='Circuit', compute='_compute_transport_stats',
+        help='Circuit breaker state. While open, eTIMS calls fail immediately '
+             'and a background probe checks when KRA is back.')
 
     _sql_constraints = [
         ('company_uniq', 'unique(company_id)',
@@ -144,6 +186,25 @@ class EtimsConfig(models.Model):
             else:
                 record.dvc_srl_no = False
 
+    def _compute_transport_stats(self):
+        for record in self:
+            stats = record.get_transport_stats()
+            transport = peek_transport(record._get_transport_key()) if record.id else None
+            telemetry = transport.get_telemetry() if transport else []
+            last = telemetry[0] if telemetry else {}
+            record.last_request_date = last.get('date', False)
+            record.last_response = last.get('response', False)
+            record.request_log = '\n'.join(
+                '%s  %s %s  %s  %.0f ms' % (
+                    entry['date'], entry['method'], entry['url'].rsplit('/', 1)[-1],
+                    entry['status'] or 'ERR', entry['latency_ms'])
+                for entry in telemetry
+            ) or False
+            record.transport_requests = stats.get('requests', 0)
+            record.transport_reused = stats.get('reused', 0)
+            record.transport_avg_latency = stats.get('avg_latency_ms', 0.0)
+            record.transport_circuit_state = stats.get('circuit_state') or 'closed'
+
     def _compute_tis_info(self):
         """Compute TIS information fields from constants."""
         for record in self:
@@ -191,6 +252,42 @@ class EtimsConfig(models.Model):
                 return PRODUCTION_URL_NO_PREFIX
             return PRODUCTION_URL_WITH_PREFIX
 
+    def _get_transport_key(self):
+        self.ensure_one()
+        return (self.env.cr.dbname, self.id)
+
+    def _get_transport(self):
+        """
+        Get the pooled keep-alive HTTP transport for this configuration.
+
+        One transport (and connection pool) is kept per worker process and
+        per configuration, so consecutive eTIMS calls reuse the same TLS
+        connection to KRA instead of handshaking on every request.
+        """
+        self.ensure_one()
+        settings = {
+            'connect_timeout': self.connect_timeout or 10,
+            'read_timeout': self.read_timeout or 30,
+            'pool_size': max(self.pool_size or 10, 1),
+            'max_retries': max(self.max_retries, 0),
+        }
+        return get_transport(self._get_transport_key(), settings)
+
+    def get_transport_stats(self):
+        """
+        Get connection reuse and latency counters for this configuration.
+
+        Counters are kept in memory by the current worker process.
+
+        Returns:
+            dict with requests, errors, connections, reused, avg_latency_ms, max_latency_ms
+        """
+        self.ensure_one()
+        if not self.id:
+            return {}
+        transport = peek_transport(self._get_transport_key())
+        return transport.get_stats() if transport else {}
+
     def _prepare_headers(self, for_init=False):
         """
         Prepare HTTP headers for API request.
@@ -243,9 +340,10 @@ class EtimsConfig(models.Model):
         """
         Make an API call to eTIMS.
 
-        If the configured URL pattern fails with a connection error,
-        automatically tries the alternative pattern since KRA documentation
-        is inconsistent about the URL structure.
+        The working URL pattern is resolved once and cached in memory by the
+        transport; the alternative pattern is only tried when KRA answers 404.
+        While KRA is unreachable the transport's circuit breaker fails fast
+        instead of waiting for a timeout on every call.
 
         :param endpoint: API endpoint (e.g., '/saveTrnsSalesOsdc')
         :param data: Dictionary with request data
@@ -262,65 +360,78 @@ class EtimsConfig(models.Model):
         if self.cmn_key:
             data['cmcKey'] = self.cmn_key
 
-        # Build list of URL patterns to try (configured pattern first, then alternative)
-        url_patterns = [(self._get_api_url(), self.api_url_pattern)]
+        _logger.info('eTIMS API Request to %s: %s', endpoint, json.dumps(data, indent=2))
 
-        # Add alternative URL pattern as fallback
-        if self.environment == 'sandbox':
-            alt_url = SANDBOX_URL_NO_PREFIX if self.api_url_pattern == 'with_prefix' else SANDBOX_URL_WITH_PREFIX
-            alt_pattern = 'no_prefix' if self.api_url_pattern == 'with_prefix' else 'with_prefix'
-        else:
-            alt_url = PRODUCTION_URL_NO_PREFIX if self.api_url_pattern == 'with_prefix' else PRODUCTION_URL_WITH_PREFIX
-            alt_pattern = 'no_prefix' if self.api_url_pattern == 'with_prefix' else 'with_prefix'
+        result, pattern = self._get_transport().call(
+            self._get_api_base_urls(), self.api_url_pattern, endpoint, data,
+            headers=self._prepare_headers(),
+        )
+        self._update_url_pattern(pattern)
+
+        _logger.info('eTIMS API Response: %s', json.dumps(result, indent=2))
+        return result
+
+    def _call_api_concurrent(self, endpoint, payloads, max_workers=None):
+        """
+        Send several requests to the same endpoint over the pooled transport.
+
+        Only the HTTP round trips run in worker threads; headers and common
+        fields are prepared up front and the URL pattern is only written back
+        when it changed, so no ORM call happens outside the current thread.
 
-        url_patterns.append((alt_url, alt_pattern))
+        :param endpoint: API endpoint (e.g., '/saveItem')
+        :param payloads: List of request dictionaries
+        :param max_workers: Concurrent requests (defaults to max_concurrency)
+        :return: List of (result, exception) tuples, in payload order
+        """
+        self.ensure_one()
+        if not payloads:
+            return []
+
+        common = {'tin': self.tin, 'bhfId': self.bhf_id}
+        if self.cmn_key:
+            common['cmcKey'] = self.cmn_key
+        for data in payloads:
+            data.update(common)
 
-        last_error = None
-        for base_url, pattern in url_patterns:
-            url = base_url + endpoint
-            _logger.info('eTIMS API Request to %s (pattern: %s): %s',
-                        url, pattern, json.dumps(data, indent=2))
+        transport = self._get_transport()
+        base_urls = self._get_api_base_urls()
+        headers = self._prepare_headers()
+        preferred_pattern = self.api_url_pattern
 
+        def send(data):
             try:
-                response = requests.post(
-                    url,
-                    json=data,
-                    headers=self._prepare_headers(),
-                    timeout=30
-                )
-                response.raise_for_status()
-                result = response.json()
-
-                # Success! Update the URL pattern if we used the alternative
-                if pattern != self.api_url_pattern:
-                    _logger.warning(
-                        'eTIMS API call succeeded with alternative URL pattern "%s". '
-                        'Updating configuration from "%s" to "%s".',
-                        pattern, self.api_url_pattern, pattern
-                    )
-                    self.api_url_pattern = pattern
-
-                # Log response
-                self.write({
-                    'last_request_date': fields.Datetime.now(),
-                    'last_response': json.dumps(result, indent=2),
-                })
+                return transport.call(base_urls, preferred_pattern, endpoint, data, headers=headers), None
+            except UserError as e:
+                return (None, None), e
 
-                _logger.info('eTIMS API Response: %s', json.dumps(result, indent=2))
-                return result
+        workers = max(1, min(max_workers or self.max_concurrency or 1, len(payloads)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='etims-api') as executor:
+            responses = list(executor.map(send, payloads))
 
-            except requests.exceptions.RequestException as e:
-                last_error = str(e)
-                _logger.warning('eTIMS API call failed with URL %s: %s', url, str(e))
-                continue  # Try next URL pattern
+        patterns = {pattern for (result, pattern), error in responses if pattern}
+        if len(patterns) == 1:
+            self._update_url_pattern(patterns.pop())
 
-        # Both patterns failed
-        _logger.error('eTIMS API Error (all URL patterns failed): %s', last_error)
-        raise UserError(_(
-            'eTIMS API Error: Failed to connect. Tried both URL patterns.\n'
-            'Last error: %s\n\n'
-            'Please verify your network connection and try again.'
-        ) % last_error)
+        _logger.info('eTIMS API %s: %d requests sent with %d workers', endpoint, len(payloads), workers)
+        return [(result, error) for (result, pattern), error in responses]
+
+    def _get_api_base_urls(self):
+        """Base URLs for both URL patterns of the configured environment."""
+        self.ensure_one()
+        if self.environment == 'sandbox':
+            return {'with_prefix': SANDBOX_URL_WITH_PREFIX, 'no_prefix': SANDBOX_URL_NO_PREFIX}
+        return {'with_prefix': PRODUCTION_URL_WITH_PREFIX, 'no_prefix': PRODUCTION_URL_NO_PREFIX}
+
+    def _update_url_pattern(self, pattern):
+        """Persist a newly discovered URL pattern (only written when it changes)."""
+        if pattern != self.api_url_pattern:
+            _logger.warning(
+                'eTIMS API call succeeded with alternative URL pattern "%s". '
+                'Updating configuration from "%s" to "%s".',
+                pattern, self.api_url_pattern, pattern
+            )
+            self.api_url_pattern = pattern
 
     def action_test_connection(self):
         """Test connection to eTIMS API."""
@@ -580,72 +691,28 @@ class EtimsConfig(models.Model):
             'cmcKey': '',  # Empty for initialization - we're requesting this key
         }
 
-        # Try configured URL pattern first, then alternative if it fails
-        url_patterns = [
-            (self._get_api_url(), self.api_url_pattern),
-        ]
-
-        # Add alternative URL pattern as fallback
-        if self.environment == 'sandbox':
-            alt_url = SANDBOX_URL_NO_PREFIX if self.api_url_pattern == 'with_prefix' else SANDBOX_URL_WITH_PREFIX
-            alt_pattern = 'no_prefix' if self.api_url_pattern == 'with_prefix' else 'with_prefix'
-        else:
-            alt_url = PRODUCTION_URL_NO_PREFIX if self.api_url_pattern == 'with_prefix' else PRODUCTION_URL_WITH_PREFIX
-            alt_pattern = 'no_prefix' if self.api_url_pattern == 'with_prefix' else 'with_prefix'
-
-        url_patterns.append((alt_url, alt_pattern))
-
-        last_error = None
-        for base_url, pattern in url_patterns:
-            url = base_url + '/selectInitOsdcInfo'
-            headers = self._prepare_headers(for_init=True)
-
-            _logger.info('OSCU Init Request to %s (pattern: %s)', url, pattern)
-            _logger.info('OSCU Init Request Body: %s', json.dumps(data, indent=2))
-            _logger.info('OSCU Init Request Headers: %s', {k: v for k, v in headers.items() if k != 'cmcKey'})
-
-            try:
-                response = requests.post(
-                    url,
-                    json=data,
-                    headers=headers,
-                    timeout=60  # Longer timeout for initialization
-                )
-
-                # Log raw response for debugging
-                _logger.info('OSCU Init Response Status: %s', response.status_code)
-                _logger.info('OSCU Init Response Headers: %s', dict(response.headers))
-                _logger.info('OSCU Init Response Body: %s', response.text[:2000] if response.text else '(empty)')
+        headers = self._prepare_headers(for_init=True)
 
-                response.raise_for_status()
-                result = response.json()
+        _logger.info('OSCU Init Request Body: %s', json.dumps(data, indent=2))
+        _logger.info('OSCU Init Request Headers: %s', {k: v for k, v in headers.items() if k != 'cmcKey'})
 
-                # Success! Update the URL pattern if we used the alternative
-                if pattern != self.api_url_pattern:
-                    _logger.info('Alternative URL pattern worked, updating configuration')
-                    self.api_url_pattern = pattern
-
-                # Log response
-                self.write({
-                    'last_request_date': fields.Datetime.now(),
-                    'last_response': json.dumps(result, indent=2),
-                })
-
-                _logger.info('OSCU Init Response: %s', json.dumps(result, indent=2))
-                return result
-
-            except requests.exceptions.RequestException as e:
-                last_error = str(e)
-                _logger.warning('OSCU Init failed with URL %s: %s', url, str(e))
-                continue  # Try next URL pattern
-
-        # Both patterns failed
-        _logger.error('OSCU Init API Error (all URL patterns failed): %s', last_error)
-        raise UserError(_(
-            'Failed to connect to KRA eTIMS. Tried both URL patterns.\n'
-            'Last error: %s\n\n'
-            'Please verify your TIN, Branch ID, and Device Serial Number are correct.'
-        ) % last_error)
+        try:
+            result, pattern = self._get_transport().call(
+                self._get_api_base_urls(), self.api_url_pattern, '/selectInitOsdcInfo', data,
+                headers=headers,
+                timeout=max(self.read_timeout or 30, 60),  # Longer timeout for initialization
+            )
+        except EtimsConnectionError as e:
+            _logger.error('OSCU Init API Error: %s', e)
+            raise UserError(_(
+                'Failed to connect to KRA eTIMS.\n'
+                '%s\n\n'
+                'Please verify your TIN, Branch ID, and Device Serial Number are correct.'
+            ) % e)
+        self._update_url_pattern(pattern)
+
+        _logger.info('OSCU Init Response: %s', json.dumps(result, indent=2))
+        return result
 
     def action_reset_device(self):
         """
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+eTIMS Number Counters
+
+KRA requires gapless sequential numbers per branch (e.g. invcNo for sales).
+They used to be computed as MAX(number) + 1 over the whole invoice and POS
+order history under an advisory lock, which got slower as history grew.
+
+Each (company, branch, counter type) now has one etims.counter row. Numbers
+are handed out with a single UPDATE ... RETURNING, in O(1) regardless of
+history. The row lock is held until the transaction commits, so a number
+whose submission is rolled back is handed out again. Numbers reserved for
+documents KRA then rejects are given back with _release() while they are
+still the last ones handed out, or passed on to the next document of the
+same batch.
+
+The price of gapless numbering is that lock: a transaction that reserved a
+number blocks every other reservation of the company (single submissions,
+the sale lane, POS fiscalisation) until it commits, KRA round trips
+included. Synchronous batches are therefore kept small
+(ETIMS_BULK_SYNC_LIMIT, MAX_FISCALISE_BATCH); larger selections go through
+the submission queue, whose single sale lane serialises invcNo anyway.
+"""
+import logging
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class EtimsCounter(models.Model):
+    _name = 'etims.counter'
+    _description = 'eTIMS Number Counter'
+    _order = 'company_id, bhf_id, counter_type'
+
+    company_id = fields.Many2one('res.company', string='Company', required=True, ondelete='cascade')
+    bhf_id = fields.Char(string='Branch ID', required=True, default='00')
+    counter_type = fields.Selection([
+        ('invoice', 'Invoice Number (invcNo)'),
+    ], string='Counter', required=True)
+    last_number = fields.Integer(string='Last Number', default=0, readonly=True,
+                                 help='Last number handed out for this counter')
+
+    _sql_constraints = [
+        ('counter_uniq', 'unique(company_id, bhf_id, counter_type)',
+         'Only one counter per company, branch and type allowed.'),
+    ]
+
+    @api.model
+    def _reserve(self, company, counter_type='invoice', count=1):
+        """
+        Reserve a block of consecutive numbers.
+
+        Args:
+            company: res.company record
+            counter_type: Counter selection value
+            count: Number of numbers to reserve (for bulk submission)
+
+        Returns:
+            int: First number of the block; the block is first..first + count - 1
+        """
+        config = self.env['etims.config'].sudo().search([('company_id', '=', company.id)], limit=1)
+        bhf_id = config.bhf_id or '00'
+
+        last_number = self._increment(company.id, bhf_id, counter_type, count)
+        if last_number is None:
+            self._seed(company, bhf_id, counter_type)
+            last_number = self._increment(company.id, bhf_id, counter_type, count)
+
+        self.invalidate_model(['last_number'])
+        return last_number - count + 1
+
+    @api.model
+    def _release(self, company, counter_type, first, last=None):
+        """
+        Give back the block first..last if it is still the last one handed out.
+
+        Args:
+            company: res.company record
+            counter_type: Counter selection value
+            first: First number of the block
+            last: Last number of the block (defaults to first)
+
+        Returns:
+            bool: True if the numbers were released; False if later numbers
+            were handed out since, in which case the caller keeps them
+        """
+        config = self.env['etims.config'].sudo().search([('company_id', '=', company.id)], limit=1)
+        self.env.cr.execute("""
+            UPDATE etims_counter
+               SET last_number = %s,
+                   write_date = now() at time zone 'UTC',
+                   write_uid = %s
+             WHERE company_id = %s AND bhf_id = %s AND counter_type = %s
+               AND last_number = %s
+         RETURNING id
+        """, (first - 1, self.env.uid, company.id, config.bhf_id or '00', counter_type,
+              last if last is not None else first))
+        released = bool(self.env.cr.fetchone())
+        self.invalidate_model(['last_number'])
+        return released
+
+    @api.model
+    def _increment(self, company_id, bhf_id, counter_type, count):
+        self.env.cr.execute("""
+            UPDATE etims_counter
+               SET last_number = last_number + %s,
+                   write_date = now() at time zone 'UTC',
+                   write_uid = %s
+             WHERE company_id = %s AND bhf_id = %s AND counter_type = %s
+         RETURNING last_number
+        """, (count, self.env.uid, company_id, bhf_id, counter_type))
+        row = self.env.cr.fetchone()
+        return row[0] if row else None
+
+    @api.model
+    def _seed(self, company, bhf_id, counter_type):
+        """Create the counter row, starting after the highest number already used."""
+        start = self._get_seed_value(company, counter_type)
+        self.env.cr.execute("""
+            INSERT INTO etims_counter
+                   (company_id, bhf_id, counter_type, last_number,
+                    create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+            ON CONFLICT (company_id, bhf_id, counter_type) DO NOTHING
+        """, (company.id, bhf_id, counter_type, start, self.env.uid, self.env.uid))
+        _logger.info('eTIMS %s counter seeded for company %s, branch %s at %s',
+                     counter_type, company.name, bhf_id, start)
+
+    @api.model
+    def _get_seed_value(self, company, counter_type):
+        """
+        Highest number already used for a counter type.
+
+        Modules adding documents that consume the same numbers (e.g. POS
+        orders for invcNo) extend this.
+        """
+        if counter_type == 'invoice':
+            self.env.cr.execute("""
+                SELECT COALESCE(MAX(etims_invoice_number), 0)
+                FROM account_move
+                WHERE company_id = %s
+            """, (company.id,))
+            return self.env.cr.fetchone()[0]
+        return 0
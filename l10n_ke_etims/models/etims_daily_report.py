@@ -14,6 +14,11 @@ Both include:
 - Payment method breakdown
 - Discounts
 - Number of copies/training/proforma receipts
+
+Figures are computed with grouped SQL aggregates over the period (receipt
+counts/totals per document type, per-tax-type sums from the eTIMS
+transaction ledger, payment methods) so the Z report stays fast on busy
+tills.
 """
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
@@ -21,6 +26,28 @@ import logging
 
 _logger = logging.getLogger(__name__)
 
+# Receipt type labels (TIS spec Section 4) -> count field
+RECEIPT_COUNT_FIELDS = {
+    'NS': 'count_ns',
+    'NC': 'count_nc',
+    'CS': 'count_cs',
+    'CC': 'count_cc',
+    'TS': 'count_ts',
+    'TC': 'count_tc',
+    'PS': 'count_ps',
+}
+
+# Report fields summed over all sources (invoices, POS orders)
+REPORT_SUM_FIELDS = [
+    'count_ns', 'count_nc', 'count_cs', 'count_cc', 'count_ts', 'count_tc', 'count_ps',
+    'total_sales', 'total_refunds', 'total_discounts', 'total_items',
+    'backfilled_items',
+    'taxable_amt_a', 'taxable_amt_b', 'taxable_amt_c', 'taxable_amt_d', 'taxable_amt_e',
+    'tax_amt_a', 'tax_amt_b', 'tax_amt_c', 'tax_amt_d', 'tax_amt_e',
+    'cash_amount', 'card_amount', 'mobile_amount', 'credit_amount', 'other_amount',
+]
+
+
 
 class EtimsDailyReport(models.Model):
     """
@@ -112,6 +139,9 @@ class EtimsDailyReport(models.Model):
 
     # Item counts
     total_items = fields.Integer(string='Total Items Sold')
+    backfilled_items = fields.Integer(
+        string='Backfilled Items',
+        help='Item lines of the period rebuilt on upgrade instead of recorded as sent to KRA.')
 
     currency_id = fields.Many2one(
         'res.currency',
@@ -177,95 +207,12 @@ class EtimsDailyReport(models.Model):
         period_start = self._get_period_start()
         period_end = self.report_datetime
 
-        # Get invoices in period
-        invoices = self.env['account.move'].search([
-            ('company_id', '=', self.company_id.id),
-            ('move_type', 'in', ['out_invoice', 'out_refund']),
-            ('state', '=', 'posted'),
-            ('etims_submitted', '=', True),
-            ('etims_submit_date', '>=', period_start),
-            ('etims_submit_date', '<=', period_end),
-        ])
-
-        # Get POS orders in period (only if point_of_sale module is installed)
-        if 'pos.order' in self.env:
-            pos_orders = self.env['pos.order'].search([
-                ('company_id', '=', self.company_id.id),
-                ('state', 'in', ['paid', 'done', 'invoiced']),
-                ('etims_submitted', '=', True),
-                ('etims_submit_date', '>=', period_start),
-                ('etims_submit_date', '<=', period_end),
-            ])
-        else:
-            pos_orders = self.env['account.move'].browse()  # Empty recordset
-
-        # Calculate totals
-        vals = {
+        vals = self._get_report_values(period_start, period_end)
+        vals.update({
             'period_start': period_start,
             'period_end': period_end,
-            'count_ns': 0,
-            'count_nc': 0,
-            'total_sales': 0,
-            'total_refunds': 0,
-            'total_discounts': 0,
-            'total_items': 0,
-            'taxable_amt_a': 0,
-            'taxable_amt_b': 0,
-            'taxable_amt_c': 0,
-            'taxable_amt_d': 0,
-            'taxable_amt_e': 0,
-            'tax_amt_a': 0,
-            'tax_amt_b': 0,
-            'tax_amt_c': 0,
-            'tax_amt_d': 0,
-            'tax_amt_e': 0,
-            'cash_amount': 0,
-            'card_amount': 0,
-            'mobile_amount': 0,
-            'credit_amount': 0,
-            'other_amount': 0,
-        }
-
-        # Process invoices
-        for inv in invoices:
-            if inv.move_type == 'out_invoice':
-                vals['count_ns'] += 1
-                vals['total_sales'] += inv.amount_total
-            else:
-                vals['count_nc'] += 1
-                vals['total_refunds'] += abs(inv.amount_total)
-
-            vals['total_items'] += len(inv.invoice_line_ids.filtered(
-                lambda l: not l.display_type
-            ))
-
-        # Process POS orders
-        for order in pos_orders:
-            if order.amount_total >= 0:
-                vals['count_ns'] += 1
-                vals['total_sales'] += order.amount_total
-            else:
-                vals['count_nc'] += 1
-                vals['total_refunds'] += abs(order.amount_total)
-
-            vals['total_items'] += len(order.lines)
-
-            # Payment breakdown
-            for payment in order.payment_ids:
-                pm = payment.payment_method_id
-                pm_name = pm.name.lower() if pm.name else ''
-                amount = payment.amount
-
-                if pm.journal_id and pm.journal_id.type == 'cash':
-                    vals['cash_amount'] += amount
-                elif any(mm in pm_name for mm in ['mpesa', 'm-pesa', 'mobile', 'airtel']):
-                    vals['mobile_amount'] += amount
-                elif any(card in pm_name for card in ['card', 'visa', 'mastercard']):
-                    vals['card_amount'] += amount
-                else:
-                    vals['other_amount'] += amount
-
-        vals['state'] = 'confirmed'
+            'state': 'confirmed',
+        })
         self.write(vals)
 
         return {
@@ -278,6 +225,119 @@ class EtimsDailyReport(models.Model):
             }
         }
 
+    def _get_report_values(self, period_start, period_end):
+        """
+        Compute the report figures for a period.
+
+        Modules adding eTIMS documents (e.g. POS orders) extend this and add
+        their own aggregates with _add_report_values().
+        """
+        self.ensure_one()
+        vals = dict.fromkeys(REPORT_SUM_FIELDS, 0)
+        self._add_report_values(vals, self._aggregate_invoices(period_start, period_end))
+        self._add_report_values(vals, self._aggregate_transaction_lines(period_start, period_end))
+        return vals
+
+    @api.model
+    def _add_report_values(self, vals, values):
+        for field_name, value in values.items():
+            vals[field_name] += value or 0
+
+    @api.model
+    def _add_receipt_counts(self, values, rows):
+        """
+        Fill counts and totals from (receipt label, count, amount) rows.
+
+        Normal sales/credit notes feed the totals; copies, training and
+        proforma receipts are only counted.
+        """
+        for label, count, amount in rows:
+            field_name = RECEIPT_COUNT_FIELDS.get(label or 'NS')
+            if field_name:
+                values[field_name] = values.get(field_name, 0) + count
+            if label == 'NS':
+                values['total_sales'] = values.get('total_sales', 0) + amount
+            elif label == 'NC':
+                values['total_refunds'] = values.get('total_refunds', 0) + amount
+
+    @api.model
+    def _add_tax_breakdown(self, values, rows):
+        """Fill per-tax-type sums from (tax code, taxable, tax, discount, items) rows."""
+        for tax_code, taxable, tax, discount, items in rows:
+            suffix = (tax_code or 'D').lower()
+            if suffix not in ('a', 'b', 'c', 'd', 'e'):
+                suffix = 'd'
+            values[f'taxable_amt_{suffix}'] = values.get(f'taxable_amt_{suffix}', 0) + taxable
+            values[f'tax_amt_{suffix}'] = values.get(f'tax_amt_{suffix}', 0) + tax
+            values['total_discounts'] = values.get('total_discounts', 0) + discount
+            values['total_items'] = values.get('total_items', 0) + items
+
+    def _aggregate_transaction_lines(self, period_start, period_end):
+        """
+        Per-tax-type sums, discounts and item counts from the eTIMS ledger.
+
+        Covers every document type (invoices, POS orders) with the amounts
+        exactly as sent to KRA; credit notes are deducted. Lines backfilled
+        on upgrade are included and counted in backfilled_items.
+        """
+        self.ensure_one()
+        self.env['etims.transaction.line'].flush_model()
+        self.env.cr.execute("""
+            SELECT tax_type,
+                   COALESCE(SUM(CASE WHEN receipt_type_label = 'NC'
+                                     THEN -taxable_amount ELSE taxable_amount END), 0),
+                   COALESCE(SUM(CASE WHEN receipt_type_label = 'NC'
+                                     THEN -tax_amount ELSE tax_amount END), 0),
+                   COALESCE(SUM(discount_amount)
+                            FILTER (WHERE COALESCE(receipt_type_label, 'NS') = 'NS'), 0),
+                   COUNT(*)
+            FROM etims_transaction_line
+            WHERE company_id = %s
+              AND submit_date >= %s
+              AND submit_date <= %s
+              AND COALESCE(receipt_type_label, 'NS') IN ('NS', 'NC')
+            GROUP BY tax_type
+        """, (self.company_id.id, period_start, period_end))
+        values = {}
+        self._add_tax_breakdown(values, self.env.cr.fetchall())
+
+        self.env.cr.execute("""
+            SELECT COUNT(*)
+            FROM etims_transaction_line
+            WHERE company_id = %s
+              AND submit_date >= %s
+              AND submit_date <= %s
+              AND backfilled
+        """, (self.company_id.id, period_start, period_end))
+        values['backfilled_items'] = self.env.cr.fetchone()[0]
+        return values
+
+    def _aggregate_invoices(self, period_start, period_end):
+        """Receipt counts and totals of invoices and credit notes submitted in the period."""
+        self.ensure_one()
+        self.env['account.move'].flush_model()
+
+        where = """
+            am.company_id = %(company_id)s
+            AND am.move_type IN ('out_invoice', 'out_refund')
+            AND am.state = 'posted'
+            AND am.etims_submitted
+            AND am.etims_submit_date >= %(start)s
+            AND am.etims_submit_date <= %(end)s
+        """
+        params = {'company_id': self.company_id.id, 'start': period_start, 'end': period_end}
+        values = {}
+
+        self.env.cr.execute(f"""
+            SELECT am.etims_receipt_type_label, COUNT(*), COALESCE(SUM(ABS(am.amount_total)), 0)
+            FROM account_move am
+            WHERE {where}
+            GROUP BY am.etims_receipt_type_label
+        """, params)
+        self._add_receipt_counts(values, self.env.cr.fetchall())
+
+        return values
+
     @api.model
     def action_generate_z_report(self):
         """Generate Z report for today (called at end of day)."""
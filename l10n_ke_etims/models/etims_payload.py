@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+eTIMS Sales Payload Builder
+
+Invoices and POS orders used to build their itemList one line at a time:
+each line resolved the product's item code, UNSPSC class and unit codes
+through ensure_one() helpers, and validation walked the same relations again
+with filtered(). On a 2,000 line B2B invoice that meant thousands of lazy
+loads.
+
+etims.sales.payload.mixin builds the item list of a document in one pass:
+- Product, template, classification and origin country fields of every line
+  are fetched up front, one query per model
+- Items and the per-tax-type taxable/tax totals are computed in the same loop
+- Registration and UNSPSC checks run on the prefetched values
+
+Models using it provide the lines to report (_get_etims_item_lines) and the
+amounts of a line (_get_etims_line_amounts); the rest is shared.
+"""
+from odoo import models, _
+from odoo.exceptions import UserError
+
+ETIMS_TAX_TYPES = ('A', 'B', 'C', 'D', 'E')
+
+
+class EtimsSalesPayloadMixin(models.AbstractModel):
+    """
+    Shared itemList builder for documents reported with /saveTrnsSalesOsdc.
+
+    Models using the mixin implement:
+    - _get_etims_item_lines(): the lines reported to eTIMS, in itemSeq order
+    - _get_etims_line_amounts(line): dict with keys name, qty, price_unit,
+      discount, discount_amt, supply_amt and tax (first tax of the line or None)
+    """
+    _name = 'etims.sales.payload.mixin'
+    _description = 'eTIMS Sales Payload Builder'
+
+    def _get_etims_tax_code(self, tax):
+        """
+        eTIMS tax type code of an Odoo tax (account.tax.l10n_ke_tax_type).
+        A = Exempt, B = 16%, C = 0%, D = Non-VAT, E = 8%
+        """
+        if not tax:
+            return 'D'
+        return self.env['account.tax']._get_etims_tax_type_map(tax.company_id.id).get(tax.id, 'D')
+
+    def _check_etims_products(self, infos):
+        """
+        Raise if a product of the document cannot be reported to eTIMS.
+
+        Args:
+            infos: result of product.product._get_etims_item_infos()
+        """
+        unregistered = [info['name'] for info in infos.values() if not info['registered']]
+        if unregistered:
+            raise UserError(_(
+                'The following products must be registered with eTIMS before submitting:\n%s'
+                '\n\nGo to the product form and click "Register with eTIMS".'
+            ) % ', '.join(unregistered[:5]))
+
+        missing_unspsc = [info['name'] for info in infos.values() if not info['item_class_code']]
+        if missing_unspsc:
+            raise UserError(_(
+                'The following products are missing UNSPSC classification:\n%s'
+                '\n\nGo to the product form, eTIMS Kenya tab, and select a UNSPSC Classification.'
+            ) % ', '.join(missing_unspsc[:5]))
+
+    def _prepare_etims_items(self):
+        """
+        Build the itemList and per-tax-type totals in one pass.
+
+        Returns:
+            tuple (items, taxable_totals, tax_totals); totals are dicts keyed
+            by tax type code
+        """
+        self.ensure_one()
+        lines = self._get_etims_item_lines()
+        infos = lines.product_id._get_etims_item_infos()
+
+        items = []
+        totals = dict.fromkeys(ETIMS_TAX_TYPES, 0)
+        tax_totals = dict.fromkeys(ETIMS_TAX_TYPES, 0)
+        for seq, line in enumerate(lines, 1):
+            amounts = self._get_etims_line_amounts(line)
+            info = infos.get(line.product_id.id)
+            tax = amounts['tax']
+
+            # Prefer product's eTIMS tax type, fallback to line tax
+            if info and info['tax_type']:
+                tax_code = info['tax_type']
+            else:
+                tax_code = self._get_etims_tax_code(tax)
+
+            tax_amt = tax.amount if tax else 0
+            tax_is_inclusive = tax.price_include if tax else True
+            supply_amt = amounts['supply_amt']
+
+            # Calculate tax - handle both inclusive and exclusive pricing for B2B support
+            if tax_amt > 0:
+                if tax_is_inclusive:
+                    # Tax-inclusive: price already includes tax, extract taxable amount
+                    taxable_amt = supply_amt / (1 + tax_amt / 100)
+                    tax_amount = supply_amt - taxable_amt
+                else:
+                    # Tax-exclusive: price is net, calculate tax to add
+                    taxable_amt = supply_amt
+                    tax_amount = supply_amt * tax_amt / 100
+                    # For eTIMS, supply_amt should be the gross amount
+                    supply_amt = taxable_amt + tax_amount
+            else:
+                taxable_amt = supply_amt
+                tax_amount = 0
+
+            item = {
+                'itemSeq': seq,
+                'itemCd': info['item_code'][:20] if info else 'SVC',
+                'itemClsCd': info['item_class_code'] if info else '',
+                'itemNm': (amounts['name'] or 'Item')[:200],
+                'pkgUnitCd': info['pkg_unit'] if info else 'NT',
+                'pkg': 1,
+                'qtyUnitCd': info['qty_unit'] if info else 'U',
+                'qty': amounts['qty'],
+                'prc': round(amounts['price_unit'], 2),
+                'splyAmt': round(supply_amt, 2),
+                'dcRt': amounts['discount'] or 0,
+                'dcAmt': round(amounts['discount_amt'], 2),
+                'taxTyCd': tax_code,
+                'taxblAmt': round(taxable_amt, 2),
+                'taxAmt': round(tax_amount, 2),
+                'totAmt': round(supply_amt, 2),
+            }
+            items.append(item)
+            totals[tax_code] += item['taxblAmt']
+            tax_totals[tax_code] += item['taxAmt']
+
+        return items, totals, tax_totals
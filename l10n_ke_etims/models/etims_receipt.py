@@ -6,6 +6,10 @@ Per TIS Technical Specifications v2.0, Section 6.23:
 - Receipt must include formatted internal data and signature
 - QR code format: date#time#cu_number#receipt_number#internal_data#signature
 - Data should be dash-separated after every 4th character
+
+QR images are stored on the document (etims_qr_code, as an attachment) when
+the receipt data arrives, so form views, reports and receipt reprints read the
+stored PNG instead of re-rendering it. Renders default to a compact box size.
 """
 import base64
 import io
@@ -22,6 +26,31 @@ except ImportError:
     HAS_QRCODE = False
     _logger.warning('qrcode library not installed. QR code generation will be disabled.')
 
+# Receipts display the QR at ~120px: 4px modules keep the PNG small
+QR_BOX_SIZE = 4
+QR_BORDER = 2
+
+# Documents rendered per model and per backfill cron run
+QR_BACKFILL_BATCH = 500
+
+
+def _render_qr_png(content, box_size, border):
+    """Render QR content to a base64 encoded PNG."""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(content)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
 
 class EtimsReceiptMixin(models.AbstractModel):
     """
@@ -152,14 +181,14 @@ class EtimsReceiptMixin(models.AbstractModel):
         return '#'.join(parts)
 
     @api.model
-    def generate_qr_code_image(self, content, box_size=10, border=4):
+    def generate_qr_code_image(self, content, box_size=QR_BOX_SIZE, border=QR_BORDER):
         """
         Generate QR code image as base64 encoded PNG.
 
         Args:
             content: QR code content string
-            box_size: Size of each box in pixels (default 10)
-            border: Border size in boxes (default 4)
+            box_size: Size of each box in pixels (default 4)
+            border: Border size in boxes (default 2)
 
         Returns:
             Base64 encoded PNG image string, or False if qrcode library not available
@@ -172,27 +201,54 @@ class EtimsReceiptMixin(models.AbstractModel):
             return False
 
         try:
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=box_size,
-                border=border,
-            )
-            qr.add_data(content)
-            qr.make(fit=True)
+            return _render_qr_png(content, box_size, border)
+        except Exception as e:
+            _logger.error('Failed to generate QR code: %s', str(e))
+            return False
 
-            img = qr.make_image(fill_color="black", back_color="white")
+    @api.model
+    def _get_qr_backfill_models(self):
+        """
+        Models with a stored etims_qr_code to backfill.
 
-            # Convert to base64
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
+        Modules adding receipts (e.g. POS orders) extend this.
+        """
+        return ['account.move']
 
-            return base64.b64encode(buffer.getvalue()).decode('utf-8')
+    @api.model
+    def _cron_backfill_qr_codes(self, limit=QR_BACKFILL_BATCH):
+        """
+        Store QR images of documents submitted before they were stored.
 
-        except Exception as e:
-            _logger.error('Failed to generate QR code: %s', str(e))
-            return False
+        Documents are walked in id order from the last id processed, kept per
+        model in ir.config_parameter, so those whose QR cannot be rendered
+        (e.g. incomplete receipt data) are passed once instead of filling
+        the batch on every run.
+        """
+        if not HAS_QRCODE:
+            return
+        params = self.env['ir.config_parameter'].sudo()
+        more = False
+        for model_name in self._get_qr_backfill_models():
+            model = self.env[model_name]
+            param_key = 'l10n_ke_etims.qr_backfill_last_id.%s' % model_name
+            last_id = int(params.get_param(param_key, 0))
+            records = model.search([
+                ('id', '>', last_id),
+                ('etims_submitted', '=', True),
+                ('etims_qr_code', '=', False),
+            ], order='id', limit=limit)
+            if not records:
+                continue
+            self.env.add_to_compute(model._fields['etims_qr_code'], records)
+            records.flush_recordset(['etims_qr_code'])
+            params.set_param(param_key, records[-1].id)
+            self.env.cr.commit()
+            stored = len(records.filtered('etims_qr_code'))
+            _logger.info('eTIMS QR backfill: %d/%d %s records stored', stored, len(records), model_name)
+            more = more or len(records) == limit
+        if more:
+            self.env.ref('l10n_ke_etims.ir_cron_etims_qr_backfill')._trigger()
 
     @api.model
     def get_receipt_type_label(self, transaction_type, receipt_type):
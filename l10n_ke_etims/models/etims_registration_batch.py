@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+eTIMS Bulk Product Registration
+
+Registering products one by one meant one get_config(), one blocking /saveItem
+round trip and one write() per product, all in the user's transaction: a
+catalogue of 15k SKUs took hours and could not survive a worker restart.
+
+A registration batch records one line per product and is processed by a cron:
+- Lines are taken in chunks; payloads for a chunk are prepared together
+  (products prefetched in one read) and sent concurrently over the pooled
+  transport, bounded by the configuration's max_concurrency
+- Each chunk is committed, so an interrupted run resumes from the first
+  pending line on the next cron run
+- While KRA is unreachable lines stay pending instead of being failed
+- Per-product errors and the overall throughput are kept on the batch
+"""
+import logging
+import time
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+from .etims_transport import EtimsConnectionError
+
+_logger = logging.getLogger(__name__)
+
+# A cron run stops taking new chunks after this many seconds
+MAX_RUN_SECONDS = 240
+
+
+class EtimsRegistrationBatch(models.Model):
+    _name = 'etims.registration.batch'
+    _description = 'eTIMS Product Registration Batch'
+    _order = 'id desc'
+
+    name = fields.Char(string='Reference', required=True, readonly=True,
+                       default=lambda self: _('New'))
+    company_id = fields.Many2one('res.company', string='Company', required=True,
+                                 default=lambda self: self.env.company, readonly=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('cancel', 'Cancelled'),
+    ], string='Status', default='draft', required=True, index=True, readonly=True)
+    chunk_size = fields.Integer(string='Chunk Size', default=200,
+                                help='Products sent and committed together')
+    line_ids = fields.One2many('etims.registration.line', 'batch_id', string='Products')
+
+    total_count = fields.Integer(string='Products', readonly=True)
+    registered_count = fields.Integer(string='Registered', readonly=True)
+    failed_count = fields.Integer(string='Failed', readonly=True)
+    pending_count = fields.Integer(string='Pending', compute='_compute_pending_count')
+    date_start = fields.Datetime(string='Started At', readonly=True)
+    date_done = fields.Datetime(string='Completed At', readonly=True)
+    duration = fields.Float(string='Processing Time (s)', readonly=True,
+                            help='Time spent sending chunks, across all cron runs')
+    throughput = fields.Float(string='Throughput (items/min)', compute='_compute_throughput')
+    last_error = fields.Text(string='Last Error', readonly=True)
+
+    @api.depends('total_count', 'registered_count', 'failed_count')
+    def _compute_pending_count(self):
+        for batch in self:
+            batch.pending_count = batch.total_count - batch.registered_count - batch.failed_count
+
+    @api.depends('registered_count', 'failed_count', 'duration')
+    def _compute_throughput(self):
+        for batch in self:
+            processed = batch.registered_count + batch.failed_count
+            batch.throughput = processed * 60.0 / batch.duration if batch.duration else 0.0
+
+    @api.model
+    def _create_for_products(self, company, products):
+        """Create a batch with one pending line per product template."""
+        return self.create({
+            'name': _('%(company)s - %(count)s products', company=company.name, count=len(products)),
+            'company_id': company.id,
+            'total_count': len(products),
+            'line_ids': [fields.Command.create({'product_tmpl_id': product.id}) for product in products],
+        })
+
+    def action_start(self):
+        """Queue the batch for the registration cron."""
+        batches = self.filtered(lambda b: b.state in ('draft', 'running'))
+        if not batches:
+            return
+        for batch in batches:
+            self.env['etims.config'].get_config(batch.company_id)
+        batches.write({'state': 'running'})
+        self.env.ref('l10n_ke_etims.ir_cron_etims_registration_batches')._trigger()
+
+    def action_retry_failed(self):
+        """Put failed lines back in the queue."""
+        for batch in self:
+            failed = batch.line_ids.filtered(lambda l: l.state == 'failed')
+            if not failed:
+                continue
+            failed.write({'state': 'pending', 'error': False})
+            batch.write({
+                'failed_count': batch.failed_count - len(failed),
+                'state': 'running',
+                'date_done': False,
+            })
+        self.env.ref('l10n_ke_etims.ir_cron_etims_registration_batches')._trigger()
+
+    def action_cancel(self):
+        self.filtered(lambda b: b.state in ('draft', 'running')).write({'state': 'cancel'})
+
+    def action_view_failed(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Failed Registrations'),
+            'res_model': 'etims.registration.line',
+            'view_mode': 'tree',
+            'domain': [('batch_id', '=', self.id), ('state', '=', 'failed')],
+        }
+
+    @api.model
+    def _cron_process_batches(self):
+        """Process running batches chunk by chunk, committing after each chunk."""
+        deadline = time.monotonic() + MAX_RUN_SECONDS
+        for batch in self.search([('state', '=', 'running')], order='id'):
+            while time.monotonic() < deadline:
+                try:
+                    more = batch._process_next_chunk()
+                except EtimsConnectionError as e:
+                    # Lines stay pending; the next cron run resumes the batch
+                    _logger.warning('eTIMS registration batch %s paused: %s', batch.id, str(e))
+                    return
+                self.env.cr.commit()
+                if not more:
+                    break
+            else:
+                # Out of time: continue in a fresh cron run
+                self.env.ref('l10n_ke_etims.ir_cron_etims_registration_batches')._trigger()
+                return
+
+    def _process_next_chunk(self):
+        """
+        Register the next chunk of pending lines.
+
+        Returns:
+            bool: True if pending lines remain
+
+        Raises:
+            EtimsConnectionError: KRA unreachable; the chunk's lines stay pending
+        """
+        self.ensure_one()
+        lines = self.env['etims.registration.line'].search([
+            ('batch_id', '=', self.id),
+            ('state', '=', 'pending'),
+        ], order='id', limit=max(self.chunk_size, 1))
+        if not lines:
+            self.write({'state': 'done', 'date_done': fields.Datetime.now()})
+            return False
+
+        if not self.date_start:
+            self.date_start = fields.Datetime.now()
+        config = self.env['etims.config'].get_config(self.company_id)
+        start = time.monotonic()
+
+        # Already registered (e.g. from the product form) since the batch was created
+        registered = lines.filtered(lambda l: l.product_tmpl_id.l10n_ke_etims_registered)
+        registered.write({'state': 'done', 'date_done': fields.Datetime.now()})
+        lines -= registered
+
+        products = [line.product_tmpl_id.with_company(self.company_id) for line in lines]
+        payloads = [product._prepare_etims_item_data(config) for product in products]
+        responses = config._call_api_concurrent('/saveItem', [dict(p) for p in payloads])
+
+        done_lines = self.env['etims.registration.line']
+        failed = 0
+        connection_error = None
+        for line, product, item_data, (result, error) in zip(lines, products, payloads, responses):
+            if isinstance(error, EtimsConnectionError):
+                connection_error = connection_error or error
+                continue
+            if error:
+                line.write({'state': 'failed', 'error': str(error)})
+                failed += 1
+            elif result.get('resultCd') == '000':
+                vals = product._get_etims_registered_vals(result, item_data)
+                product.write(vals)
+                line.item_code = vals['l10n_ke_etims_item_code']
+                done_lines |= line
+            else:
+                line.write({
+                    'state': 'failed',
+                    'error': _('eTIMS Error: %s') % result.get('resultMsg', 'Unknown error'),
+                })
+                failed += 1
+        done_lines.write({'state': 'done', 'date_done': fields.Datetime.now()})
+
+        elapsed = time.monotonic() - start
+        self.write({
+            'registered_count': self.registered_count + len(done_lines) + len(registered),
+            'failed_count': self.failed_count + failed,
+            'duration': self.duration + elapsed,
+            'last_error': str(connection_error) if connection_error else False,
+        })
+        _logger.info(
+            'eTIMS registration batch %s: %d registered, %d failed in %.1fs',
+            self.id, len(done_lines) + len(registered), failed, elapsed,
+        )
+        if connection_error:
+            # Keep what KRA accepted, leave the rest pending for the next run
+            self.env.cr.commit()
+            raise connection_error
+        return True
+
+    def unlink(self):
+        if any(batch.state == 'running' for batch in self):
+            raise UserError(_('Cancel a running registration batch before deleting it.'))
+        return super().unlink()
+
+
+class EtimsRegistrationLine(models.Model):
+    _name = 'etims.registration.line'
+    _description = 'eTIMS Product Registration Line'
+    _order = 'batch_id, id'
+    _rec_name = 'product_tmpl_id'
+
+    batch_id = fields.Many2one('etims.registration.batch', string='Batch', required=True,
+                               index=True, ondelete='cascade', readonly=True)
+    product_tmpl_id = fields.Many2one('product.template', string='Product', required=True,
+                                      ondelete='cascade', readonly=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Registered'),
+        ('failed', 'Failed'),
+    ], string='Status', default='pending', required=True, index=True, readonly=True)
+    item_code = fields.Char(string='eTIMS Item Code', readonly=True)
+    error = fields.Text(string='Error', readonly=True)
+    date_done = fields.Datetime(string='Registered On', readonly=True)
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+eTIMS Submission Queue
+
+Invoices, POS orders and stock moves used to be sent to KRA synchronously,
+inside the user's transaction. A slow KRA response kept the PostgreSQL
+transaction open and the HTTP worker busy for up to a minute.
+
+Submissions are now recorded as etims.submission.job rows at the hook points
+(payment, POS checkout, stock validation) and drained by a cron:
+- Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several cron
+  workers can drain the queue without double-sending
+- Each company gets at most `max_concurrency` worker threads, each thread
+  with its own database cursor
+- Sales transactions of a company run in one lane, in invoice number order:
+  documents that already hold an invcNo (kept from an attempt KRA may have
+  received) go first by number, the others follow in job order and are
+  numbered as they are sent, so invcNo reaches KRA in sequence
+- Failures are retried with exponential backoff; jobs that keep failing are
+  dead-lettered for manual review
+
+Handler contract: the target model implements
+``_etims_submit_from_job()`` on a recordset and returns a dict
+{record_id: error message or False}. EtimsConnectionError may be raised
+when KRA is unreachable; what the handler wrote before raising it (e.g. the
+invcNo reserved for the attempt, which KRA may already hold) is kept, the
+lane stops and the remaining jobs are released untouched.
+"""
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+
+from .etims_transport import EtimsConnectionError
+
+_logger = logging.getLogger(__name__)
+
+# Retry backoff: 1 min, 2 min, 4 min ... capped at 6 hours
+RETRY_BASE_DELAY = 60
+RETRY_MAX_DELAY = 6 * 3600
+
+# Running jobs not finished after this long are assumed lost (worker killed)
+STALE_JOB_TIMEOUT = 15 * 60
+
+# Hard cap on worker threads per cron run, across all companies
+MAX_WORKER_THREADS = 16
+
+
+class EtimsSubmissionJob(models.Model):
+    _name = 'etims.submission.job'
+    _description = 'eTIMS Submission Job'
+    _order = 'priority, id'
+    _rec_name = 'res_name'
+
+    company_id = fields.Many2one(
+        'res.company', string='Company', required=True, index=True, readonly=True)
+    job_type = fields.Selection([
+        ('sale', 'Sales Transaction'),
+    ], string='Type', required=True, default='sale', readonly=True)
+    res_model = fields.Char(string='Document Model', required=True, readonly=True)
+    res_id = fields.Many2oneReference(
+        string='Document ID', model_field='res_model', required=True, readonly=True)
+    res_name = fields.Char(string='Document', readonly=True)
+
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed (will retry)'),
+        ('done', 'Done'),
+        ('dead', 'Dead (manual review)'),
+    ], string='Status', default='pending', required=True, index=True, readonly=True)
+    priority = fields.Integer(string='Priority', default=10, readonly=True,
+                              help='Lower values are processed first')
+    attempts = fields.Integer(string='Attempts', default=0, readonly=True)
+    max_attempts = fields.Integer(string='Max Attempts', default=8, readonly=True)
+    next_attempt_date = fields.Datetime(string='Next Attempt', readonly=True)
+    claimed_at = fields.Datetime(string='Started At', readonly=True)
+    date_done = fields.Datetime(string='Completed At', readonly=True)
+    last_error = fields.Text(string='Last Error', readonly=True)
+
+    def init(self):
+        # Queue polling only ever looks at open jobs
+        create_index(
+            self._cr, 'etims_submission_job_queue_idx', self._table,
+            ['priority', 'id'], where="state IN ('pending', 'failed')")
+        create_index(
+            self._cr, 'etims_submission_job_res_idx', self._table,
+            ['res_model', 'res_id'])
+
+    # -------------------------------------------------------------------------
+    # Enqueue
+    # -------------------------------------------------------------------------
+
+    @api.model
+    def _enqueue(self, records, job_type='sale', priority=10):
+        """
+        Queue records for submission to eTIMS.
+
+        Records of companies without an eTIMS configuration are ignored, and
+        records that already have an open or dead job are not queued again
+        (dead jobs are requeued with the Retry action).
+
+        Args:
+            records: Recordset of the document model (account.move, pos.order...)
+            job_type: Job type selection value
+            priority: Lower values are processed first
+
+        Returns:
+            etims.submission.job recordset of the created jobs
+        """
+        if not records:
+            return self.browse()
+
+        configured = set(self.env['etims.config'].sudo().search([
+            ('company_id', 'in', records.company_id.ids),
+        ]).company_id.ids)
+
+        self.env.cr.execute("""
+            SELECT res_id FROM etims_submission_job
+             WHERE res_model = %s AND res_id IN %s
+               AND state IN ('pending', 'running', 'failed', 'dead')
+        """, (records._name, tuple(records.ids)))
+        queued = {row[0] for row in self.env.cr.fetchall()}
+
+        vals_list = [{
+            'company_id': record.company_id.id,
+            'job_type': job_type,
+            'res_model': record._name,
+            'res_id': record.id,
+            'res_name': record.display_name,
+            'priority': priority,
+        } for record in records
+            if record.company_id.id in configured and record.id not in queued]
+        if not vals_list:
+            return self.browse()
+
+        jobs = self.sudo().create(vals_list)
+        self.env.ref('l10n_ke_etims.ir_cron_etims_submission_jobs')._trigger()
+        return jobs
+
+    # -------------------------------------------------------------------------
+    # Queue processing
+    # -------------------------------------------------------------------------
+
+    @api.model
+    def _cron_process_jobs(self, limit=200):
+        """Claim due jobs and process them in per-company worker lanes."""
+        self._requeue_stale_jobs()
+
+        job_ids = self._claim_jobs(limit)
+        if not job_ids:
+            return
+        # Make the claim visible to other workers before the slow part starts
+        self.env.cr.commit()
+
+        lanes = self.browse(job_ids)._build_lanes()
+        _logger.info('eTIMS queue: processing %d jobs in %d lanes', len(job_ids), len(lanes))
+
+        workers = min(len(lanes), MAX_WORKER_THREADS)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='etims-job') as executor:
+            futures = [executor.submit(self._run_lane, lane) for lane in lanes]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception:
+                    _logger.exception('eTIMS queue lane crashed')
+
+        # More due jobs than one batch: run again right away
+        if len(job_ids) >= limit:
+            self.env.ref('l10n_ke_etims.ir_cron_etims_submission_jobs')._trigger()
+
+    @api.model
+    def _requeue_stale_jobs(self):
+        self.env.cr.execute("""
+            UPDATE etims_submission_job
+               SET state = 'failed', next_attempt_date = NULL,
+                   last_error = 'Worker stopped before the job completed'
+             WHERE state = 'running'
+               AND claimed_at < (now() at time zone 'UTC') - %s * interval '1 second'
+         RETURNING id
+        """, (STALE_JOB_TIMEOUT,))
+        stale = self.env.cr.fetchall()
+        if stale:
+            _logger.warning('eTIMS queue: requeued %d stale jobs', len(stale))
+            self.invalidate_model(['state', 'next_attempt_date', 'last_error'])
+
+    @api.model
+    def _claim_jobs(self, limit):
+        """Atomically move due jobs to 'running' and return their ids in order."""
+        self.flush_model()
+        self.env.cr.execute("""
+            UPDATE etims_submission_job job
+               SET state = 'running',
+                   attempts = job.attempts + 1,
+                   claimed_at = now() at time zone 'UTC'
+              FROM (
+                    SELECT id FROM etims_submission_job
+                     WHERE state IN ('pending', 'failed')
+                       AND (next_attempt_date IS NULL
+                            OR next_attempt_date <= now() at time zone 'UTC')
+                  ORDER BY priority, id
+                     LIMIT %s
+                       FOR UPDATE SKIP LOCKED
+                   ) due
+             WHERE job.id = due.id
+         RETURNING job.id
+        """, (limit,))
+        job_ids = sorted(row[0] for row in self.env.cr.fetchall())
+        self.invalidate_model(['state', 'attempts', 'claimed_at'])
+        return job_ids
+
+    def _build_lanes(self):
+        """
+        Split claimed jobs into lanes of job ids, each run by one thread.
+
+        Sales transactions of a company share a single lane so they reach
+        KRA in invcNo order; other job types are spread over the remaining
+        lanes allowed by the company's max_concurrency.
+        """
+        invoice_numbers = self._get_sale_invoice_numbers()
+
+        def sale_order_key(job):
+            number = invoice_numbers.get((job.res_model, job.res_id))
+            return (0, number, 0, 0) if number else (1, 0, job.priority, job.id)
+
+        configs = {
+            config.company_id.id: config
+            for config in self.env['etims.config'].sudo().search([
+                ('company_id', 'in', self.company_id.ids),
+            ])
+        }
+        by_company = defaultdict(lambda: self.browse())
+        for job in self.sorted(lambda j: (j.priority, j.id)):
+            by_company[job.company_id.id] |= job
+
+        lanes = []
+        for company_id, jobs in by_company.items():
+            config = configs.get(company_id)
+            concurrency = max(config.max_concurrency if config else 1, 1)
+            sale_jobs = jobs.filtered(lambda j: j.job_type == 'sale')
+            other_jobs = jobs - sale_jobs
+            if sale_jobs:
+                lanes.append(sale_jobs.sorted(sale_order_key).ids)
+            other_lanes = max(concurrency - (1 if sale_jobs else 0), 1)
+            for i in range(min(other_lanes, len(other_jobs))):
+                lanes.append(other_jobs.ids[i::other_lanes])
+        return lanes
+
+    def _get_sale_invoice_numbers(self):
+        """
+        invcNo already held by the documents of the sale jobs.
+
+        Returns:
+            dict {(res_model, res_id): etims_invoice_number} for numbered documents
+        """
+        numbers = {}
+        sale_jobs = self.filtered(lambda j: j.job_type == 'sale')
+        for res_model, jobs in sale_jobs.grouped('res_model').items():
+            if 'etims_invoice_number' not in self.env[res_model]._fields:
+                continue
+            documents = self.env[res_model].browse(jobs.mapped('res_id')).exists()
+            for document in documents:
+                if document.etims_invoice_number:
+                    numbers[(res_model, document.id)] = document.etims_invoice_number
+        return numbers
+
+    def _run_lane(self, job_ids):
+        """Process a lane of jobs in order, in a dedicated cursor (worker thread)."""
+        threading.current_thread().dbname = self.env.cr.dbname
+        with self.env.registry.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            jobs = env['etims.submission.job'].browse(job_ids)
+            for index, job in enumerate(jobs):
+                try:
+                    job._process()
+                except EtimsConnectionError as e:
+                    env.invalidate_all()
+                    job._mark_failed(str(e))
+                    # KRA is down: leave the rest of the lane for the next run
+                    # without burning their attempts
+                    jobs[index + 1:]._release(job.next_attempt_date)
+                    cr.commit()
+                    break
+                cr.commit()
+
+    def _process(self):
+        """Run a single job through its model handler."""
+        self.ensure_one()
+        record = self.env[self.res_model].browse(self.res_id).exists()
+        if not record:
+            self._mark_done(note=_('Document no longer exists'))
+            return
+
+        connection_error = None
+        try:
+            with self.env.cr.savepoint():
+                try:
+                    errors = record.with_company(self.company_id)._etims_submit_from_job()
+                except EtimsConnectionError as e:
+                    # KRA may have received the request (e.g. read timeout): keep
+                    # what the handler wrote, such as the invcNo it reserved
+                    connection_error = e
+        except Exception as e:
+            _logger.warning('eTIMS job %s (%s) failed: %s', self.id, self.res_name, str(e))
+            errors = {record.id: str(e)}
+        if connection_error:
+            raise connection_error
+
+        error = errors.get(record.id)
+        if error:
+            self._mark_failed(error)
+        else:
+            self._mark_done()
+
+    def _mark_done(self, note=False):
+        self.write({
+            'state': 'done',
+            'date_done': fields.Datetime.now(),
+            'last_error': note,
+        })
+
+    def _mark_failed(self, error):
+        """Schedule a retry with exponential backoff, or dead-letter the job."""
+        for job in self:
+            if job.attempts >= job.max_attempts:
+                job.write({'state': 'dead', 'last_error': error})
+                _logger.error('eTIMS job %s (%s) dead after %d attempts: %s',
+                              job.id, job.res_name, job.attempts, error)
+                record = self.env[job.res_model].browse(job.res_id).exists()
+                if record and hasattr(record, 'message_post'):
+                    record.message_post(body=_(
+                        'eTIMS submission failed after %(attempts)s attempts: %(error)s. '
+                        'Please submit manually.'
+                    ) % {'attempts': job.attempts, 'error': error})
+                continue
+            delay = min(RETRY_BASE_DELAY * 2 ** max(job.attempts - 1, 0), RETRY_MAX_DELAY)
+            job.write({
+                'state': 'failed',
+                'last_error': error,
+                'next_attempt_date': fields.Datetime.now() + timedelta(seconds=delay),
+            })
+
+    def _release(self, next_attempt_date=False):
+        """Put claimed jobs back in the queue without counting the attempt."""
+        for job in self:
+            job.write({
+                'state': 'pending',
+                'attempts': max(job.attempts - 1, 0),
+                'next_attempt_date': next_attempt_date,
+            })
+
+    @api.autovacuum
+    def _gc_done_jobs(self):
+        """Remove completed jobs after 30 days."""
+        self.search([
+            ('state', '=', 'done'),
+            ('date_done', '<', fields.Datetime.now() - timedelta(days=30)),
+        ]).unlink()
+
+    # -------------------------------------------------------------------------
+    # Actions
+    # -------------------------------------------------------------------------
+
+    def action_retry(self):
+        """Requeue failed or dead jobs for immediate processing."""
+        jobs = self.filtered(lambda j: j.state in ('failed', 'dead'))
+        if not jobs:
+            raise UserError(_('Only failed or dead jobs can be retried.'))
+        jobs.write({
+            'state': 'pending',
+            'attempts': 0,
+            'next_attempt_date': False,
+        })
+        self.env.ref('l10n_ke_etims.ir_cron_etims_submission_jobs')._trigger()
+
+    def action_open_document(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self.res_model,
+            'res_id': self.res_id,
+            'view_mode': 'form',
+        }
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+eTIMS Transaction Ledger
+
+One row per item line accepted by KRA, holding the amounts exactly as sent
+in the sales payload (taxTyCd, taxblAmt, taxAmt, dcAmt...) together with the
+receipt type label and submission date.
+
+X/Z reports, reconciliations and audits aggregate this table with indexed SQL
+instead of re-deriving amounts from Odoo taxes. Amounts are stored as sent to
+KRA (positive); credit notes are identified by their receipt type label.
+
+Rows backfilled for documents submitted before the ledger existed were
+rebuilt from the products and taxes at upgrade time, not from the payload
+sent to KRA (which was not stored); they are flagged as backfilled.
+"""
+from odoo import api, fields, models
+from odoo.tools.sql import create_index
+
+TAX_TYPES = [
+    ('A', 'A - Exempt'),
+    ('B', 'B - Standard Rate (16%)'),
+    ('C', 'C - Zero Rate (0%)'),
+    ('D', 'D - Non-VAT'),
+    ('E', 'E - Reduced Rate (8%)'),
+]
+
+
+class EtimsTransactionLine(models.Model):
+    _name = 'etims.transaction.line'
+    _description = 'eTIMS Transaction Line'
+    _order = 'submit_date desc, invoice_number desc, item_seq'
+    _rec_name = 'item_name'
+
+    company_id = fields.Many2one('res.company', string='Company', required=True, readonly=True)
+    move_id = fields.Many2one('account.move', string='Invoice', index='btree_not_null',
+                              ondelete='cascade', readonly=True)
+    invoice_number = fields.Integer(string='eTIMS Invoice Number', readonly=True,
+                                    help='invcNo sent to KRA')
+    receipt_type_label = fields.Char(string='Receipt Type', readonly=True,
+                                     help='Receipt type label per TIS spec (NS, NC, CS, CC, TS, TC, PS)')
+    submit_date = fields.Datetime(string='Submitted On', required=True, readonly=True)
+
+    item_seq = fields.Integer(string='Seq', readonly=True)
+    item_code = fields.Char(string='Item Code', readonly=True)
+    item_class_code = fields.Char(string='UNSPSC Code', readonly=True)
+    item_name = fields.Char(string='Item', readonly=True)
+    tax_type = fields.Selection(TAX_TYPES, string='Tax Type', readonly=True)
+    quantity = fields.Float(string='Quantity', readonly=True)
+    unit_price = fields.Float(string='Unit Price', digits='Product Price', readonly=True)
+    supply_amount = fields.Float(string='Supply Amount', digits='Account', readonly=True)
+    discount_amount = fields.Float(string='Discount', digits='Account', readonly=True)
+    taxable_amount = fields.Float(string='Taxable Amount', digits='Account', readonly=True)
+    tax_amount = fields.Float(string='Tax Amount', digits='Account', readonly=True)
+    total_amount = fields.Float(string='Total', digits='Account', readonly=True)
+    backfilled = fields.Boolean(
+        string='Backfilled', readonly=True,
+        help='Rebuilt on upgrade from the current products and taxes, not recorded from '
+             'the payload sent to KRA.')
+
+    def init(self):
+        create_index(self._cr, 'etims_transaction_line_company_date_idx', self._table,
+                     ['company_id', 'submit_date'])
+
+    @api.model
+    def _create_from_payload(self, payload, vals):
+        """
+        Record the item lines of an accepted sales payload.
+
+        Args:
+            payload: The /saveTrnsSalesOsdc payload sent to KRA
+            vals: Common values (document link, company_id, receipt_type_label, submit_date)
+        """
+        vals = dict(vals, invoice_number=payload.get('invcNo'))
+        return self.sudo().create([dict(
+            vals,
+            item_seq=item.get('itemSeq'),
+            item_code=item.get('itemCd'),
+            item_class_code=item.get('itemClsCd'),
+            item_name=item.get('itemNm'),
+            tax_type=item.get('taxTyCd') or 'D',
+            quantity=item.get('qty', 0),
+            unit_price=item.get('prc', 0),
+            supply_amount=item.get('splyAmt', 0),
+            discount_amount=item.get('dcAmt', 0),
+            taxable_amount=item.get('taxblAmt', 0),
+            tax_amount=item.get('taxAmt', 0),
+            total_amount=item.get('totAmt', 0),
+        ) for item in payload.get('itemList', [])])
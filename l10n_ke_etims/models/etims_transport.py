@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+Pooled HTTP transport for KRA eTIMS
+
+Every eTIMS request used to go through a bare requests.post(), paying for a
+new TCP and TLS handshake to the KRA endpoint on each invoice, POS order,
+stock move and item registration.
+
+This module keeps one requests.Session per Odoo worker process and per
+eTIMS configuration, with:
+- Keep-alive connections and a bounded connection pool
+- Separate connect/read timeouts
+- Retry with exponential backoff for failures where the request never
+  reached KRA (connection errors); gateway 502/503 are only retried for
+  GET, since the upstream may already have processed a POSTed sale
+- Reuse and latency counters for monitoring
+- The working /etims-api URL pattern cached in memory, so the alternative
+  prefix is only probed once per TTL instead of on every failure
+- A circuit breaker that fails fast while KRA is unreachable, with a
+  background half-open probe that closes it again once KRA answers
+- Request telemetry (time, endpoint, status, latency, response excerpt)
+  kept in an in-memory ring buffer instead of on the configuration row,
+  which every concurrent submission would otherwise serialise on
+
+The transport holds no database state and is safe to use from worker threads.
+"""
+import collections
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from odoo import _, fields
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+# How long a discovered URL pattern is trusted before it is re-validated
+URL_PATTERN_TTL = 6 * 3600
+
+# Circuit breaker: consecutive connection failures before opening, and
+# seconds to wait before probing KRA again
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RESET_TIMEOUT = 30
+CIRCUIT_MAX_RESET_TIMEOUT = 300
+
+# Recent requests kept in memory per transport, and response excerpt size
+TELEMETRY_SIZE = 50
+TELEMETRY_RESPONSE_SIZE = 2000
+
+# Transports keyed by (dbname, config_id); one set per worker process
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+class EtimsConnectionError(UserError):
+    """KRA eTIMS could not be reached (network error, timeout, 5xx or open circuit)."""
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker guarding calls to KRA.
+
+    States:
+    - closed: requests flow normally
+    - open: requests fail immediately; a background probe checks KRA
+    - half_open: reset timeout elapsed, a single trial request is let through
+    """
+
+    def __init__(self, probe, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self._probe = probe
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = None
+        self._probe_timer = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() >= self.opened_at + self.reset_timeout:
+                # Let this caller through as the half-open trial
+                self.state = 'half_open'
+                return True
+            return False
+
+    def retry_in(self):
+        """Seconds until the circuit allows a trial request."""
+        return max(int(self.opened_at + self.reset_timeout - time.monotonic()), 0)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                _logger.info('eTIMS circuit closed: KRA is reachable again')
+            self.state = 'closed'
+            self.failures = 0
+            self.reset_timeout = self.base_reset_timeout
+            self.last_error = None
+            if self._probe_timer:
+                self._probe_timer.cancel()
+                self._probe_timer = None
+
+    def record_failure(self, error, probe_url=None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            if self.state == 'half_open':
+                # Trial failed, stay open longer
+                self.reset_timeout = min(self.reset_timeout * 2, CIRCUIT_MAX_RESET_TIMEOUT)
+            elif self.state == 'closed' and self.failures < self.failure_threshold:
+                return
+            elif self.state == 'open':
+                return
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+            _logger.warning(
+                'eTIMS circuit opened after %d failures, retrying in %ds: %s',
+                self.failures, self.reset_timeout, error)
+            if probe_url:
+                self._schedule_probe(probe_url)
+
+    def _schedule_probe(self, probe_url):
+        """Start the background probe timer. Must be called with _lock held."""
+        if self._probe_timer:
+            self._probe_timer.cancel()
+        timer = threading.Timer(self.reset_timeout, self._run_probe, args=(probe_url,))
+        timer.daemon = True
+        timer.name = 'etims-circuit-probe'
+        self._probe_timer = timer
+        timer.start()
+
+    def _run_probe(self, probe_url):
+        """Background half-open probe: any non-5xx answer from KRA closes the circuit."""
+        with self._lock:
+            self._probe_timer = None
+            if self.state == 'closed':
+                return
+        try:
+            status = self._probe(probe_url)
+        except requests.exceptions.RequestException as e:
+            status = None
+            error = str(e)
+        else:
+            error = 'HTTP %s' % status
+        if status is not None and status < 500:
+            self.record_success()
+            return
+        with self._lock:
+            if self.state == 'closed':
+                # A live request closed the circuit while the probe was running
+                return
+            self.reset_timeout = min(self.reset_timeout * 2, CIRCUIT_MAX_RESET_TIMEOUT)
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+            self.last_error = error
+            _logger.info('eTIMS circuit probe failed (%s), next probe in %ds', error, self.reset_timeout)
+            self._schedule_probe(probe_url)
+
+
+class EtimsTransport(object):
+    """
+    Keep-alive HTTP client for a single eTIMS configuration.
+
+    Args:
+        settings: dict with connect_timeout, read_timeout, pool_size and max_retries
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.connect_timeout = settings['connect_timeout']
+        self.read_timeout = settings['read_timeout']
+
+        # POST is not idempotent for KRA (a resent sale is a duplicate sale),
+        # so it is only retried when the connection never opened. A 502/503
+        # may come after the upstream processed the sale: only GET (the
+        # circuit probe) is retried on those, POSTs are left to the queue.
+        retry = Retry(
+            total=settings['max_retries'],
+            connect=settings['max_retries'],
+            read=0,
+            status=settings['max_retries'],
+            status_forcelist=(502, 503),
+            allowed_methods=frozenset(['GET']),
+            backoff_factor=0.5,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings['pool_size'],
+            max_retries=retry,
+            pool_block=False,
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._adapter = adapter
+
+        # Working URL pattern ('with_prefix' / 'no_prefix') and its expiry
+        self.resolved_pattern = None
+        self.resolved_until = 0.0
+
+        self.breaker = CircuitBreaker(self._probe)
+
+        # Counters
+        self._stats_lock = threading.Lock()
+        self.telemetry = collections.deque(maxlen=TELEMETRY_SIZE)
+        self.request_count = 0
+        self.error_count = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def close(self):
+        self.breaker.record_success()  # cancels any pending probe
+        self.session.close()
+
+    def _probe(self, url):
+        """Lightweight reachability check used by the circuit breaker."""
+        response = self.session.get(url, timeout=(self.connect_timeout, 10))
+        return response.status_code
+
+    def get_resolved_pattern(self):
+        if self.resolved_pattern and time.monotonic() < self.resolved_until:
+            return self.resolved_pattern
+        return None
+
+    def set_resolved_pattern(self, pattern):
+        self.resolved_pattern = pattern
+        self.resolved_until = time.monotonic() + URL_PATTERN_TTL
+
+    def call(self, base_urls, preferred_pattern, endpoint, data, headers, timeout=None):
+        """
+        POST a request to eTIMS, resolving the URL pattern once and caching it.
+
+        KRA documentation is inconsistent about the /etims-api prefix. Both
+        variants live on the same host, so only a 404/405 means "wrong prefix";
+        a timeout or connection error would hit the other variant too and is
+        reported straight away instead of waiting through a second timeout.
+
+        Args:
+            base_urls: dict {'with_prefix': url, 'no_prefix': url}
+            preferred_pattern: Pattern configured on etims.config
+            endpoint: API endpoint (e.g., '/saveTrnsSalesOsdc')
+            data: JSON body
+            headers: HTTP headers
+            timeout: Read timeout override in seconds
+
+        Returns:
+            tuple (result dict, pattern that worked)
+
+        Raises:
+            EtimsConnectionError: KRA unreachable or circuit open
+            UserError: KRA answered but the response was unusable
+        """
+        if not self.breaker.allow_request():
+            raise EtimsConnectionError(_(
+                'eTIMS API Error: KRA eTIMS is currently unreachable. '
+                'Retrying automatically in %(seconds)s seconds.\n'
+                'Last error: %(error)s'
+            ) % {'seconds': self.breaker.retry_in(), 'error': self.breaker.last_error})
+
+        resolved = self.get_resolved_pattern()
+        first = resolved or preferred_pattern
+        other = 'no_prefix' if first == 'with_prefix' else 'with_prefix'
+
+        last_error = None
+        for pattern in (first, other):
+            url = base_urls[pattern] + endpoint
+            try:
+                response = self.post(url, json=data, headers=headers, timeout=timeout)
+            except requests.exceptions.RequestException as e:
+                self.breaker.record_failure(str(e), probe_url=base_urls[pattern])
+                _logger.warning('eTIMS API call failed with URL %s: %s', url, str(e))
+                raise EtimsConnectionError(_(
+                    'eTIMS API Error: Failed to connect.\n'
+                    'Last error: %s\n\n'
+                    'Please verify your network connection and try again.'
+                ) % str(e))
+
+            if response.status_code in (404, 405):
+                # Wrong prefix for this environment - try the other one
+                last_error = 'HTTP %s from %s' % (response.status_code, url)
+                _logger.warning('eTIMS endpoint not found at %s, trying alternative URL pattern', url)
+                if pattern == resolved:
+                    self.resolved_pattern = None
+                continue
+
+            if response.status_code >= 500:
+                error = 'HTTP %s: %s' % (response.status_code, (response.text or '')[:200])
+                self.breaker.record_failure(error, probe_url=base_urls[pattern])
+                raise EtimsConnectionError(_('eTIMS API Error: %s') % error)
+
+            # KRA answered: the host is up whatever the payload says
+            self.breaker.record_success()
+            try:
+                response.raise_for_status()
+                result = response.json()
+            except (requests.exceptions.HTTPError, ValueError) as e:
+                raise UserError(_('eTIMS API Error: %s') % str(e))
+
+            self.set_resolved_pattern(pattern)
+            return result, pattern
+
+        self.breaker.record_success()
+        raise UserError(_(
+            'eTIMS API Error: Endpoint not found. Tried both URL patterns.\n'
+            'Last error: %s'
+        ) % last_error)
+
+    def request(self, method, url, json=None, headers=None, timeout=None):
+        """
+        Send a request through the pooled session.
+
+        Args:
+            method: 'GET' or 'POST'
+            url: Full URL
+            json: JSON body (POST only)
+            headers: HTTP headers
+            timeout: Read timeout override in seconds (e.g. longer for device init)
+
+        Returns:
+            requests.Response
+        """
+        start = time.monotonic()
+        try:
+            response = self.session.request(
+                method,
+                url,
+                json=json,
+                headers=headers,
+                timeout=(self.connect_timeout, timeout or self.read_timeout),
+            )
+        except requests.exceptions.RequestException as e:
+            self._record(method, url, time.monotonic() - start, error=str(e))
+            raise
+        self._record(method, url, time.monotonic() - start, status=response.status_code,
+                     body=response.text)
+        return response
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        return self.request('POST', url, json=json, headers=headers, timeout=timeout)
+
+    def _record(self, method, url, latency, status=None, body=None, error=None):
+        with self._stats_lock:
+            self.request_count += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if error:
+                self.error_count += 1
+            self.telemetry.append({
+                'date': fields.Datetime.now(),
+                'method': method,
+                'url': url,
+                'status': status,
+                'latency_ms': round(latency * 1000, 1),
+                'response': (body or error or '')[:TELEMETRY_RESPONSE_SIZE],
+            })
+
+    def get_telemetry(self):
+        """Recent requests, newest first."""
+        with self._stats_lock:
+            return list(reversed(self.telemetry))
+
+    def _connection_counts(self):
+        """Return (connections opened, requests sent) from the urllib3 pools."""
+        opened = sent = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            sent += pool.num_requests
+        return opened, sent
+
+    def get_stats(self):
+        """
+        Get reuse and latency counters for this transport.
+
+        Returns:
+            dict with requests, errors, connections, reused, avg/max latency (ms)
+        """
+        opened, sent = self._connection_counts()
+        with self._stats_lock:
+            count = self.request_count
+            return {
+                'requests': count,
+                'errors': self.error_count,
+                'connections': opened,
+                'reused': max(sent - opened, 0),
+                'avg_latency_ms': round(self.total_latency / count * 1000, 1) if count else 0.0,
+                'max_latency_ms': round(self.max_latency * 1000, 1),
+                'url_pattern': self.get_resolved_pattern() or '',
+                'circuit_state': self.breaker.state,
+            }
+
+
+def get_transport(key, settings):
+    """
+    Get the pooled transport for a configuration, creating it if needed.
+
+    The transport is rebuilt when its settings change (e.g. timeouts edited
+    on the configuration form).
+
+    Args:
+        key: Hashable key, usually (dbname, config_id)
+        settings: dict of transport settings
+
+    Returns:
+        EtimsTransport
+    """
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is not None and transport.settings == settings:
+            return transport
+        if transport is not None:
+            transport.close()
+        transport = EtimsTransport(settings)
+        _transports[key] = transport
+        _logger.info('eTIMS transport created for %s: %s', key, settings)
+        return transport
+
+
+def peek_transport(key):
+    """Get the transport for a key without creating one (None if not created yet)."""
+    return _transports.get(key)
@@ -244,12 +244,7 @@ class ProductTemplate(models.Model):
             result = config._call_api('/saveItem', item_data)
 
             if result.get('resultCd') == '000':
-                result_data = result.get('data', {})
-                self.write({
-                    'l10n_ke_etims_registered': True,
-                    'l10n_ke_etims_item_code': result_data.get('itemCd') or self.default_code or str(self.id),
-                    'l10n_ke_etims_registration_date': fields.Datetime.now(),
-                })
+                self.write(self._get_etims_registered_vals(result, item_data))
                 return {
                     'type': 'ir.actions.client',
                     'tag': 'display_notification',
@@ -269,6 +264,16 @@ class ProductTemplate(models.Model):
             _logger.error('eTIMS item registration error: %s', str(e))
             raise UserError(_('Failed to register with eTIMS: %s') % str(e))
 
+    def _get_etims_registered_vals(self, result, item_data):
+        """Values to write once KRA has accepted a /saveItem request."""
+        self.ensure_one()
+        result_data = result.get('data') or {}
+        return {
+            'l10n_ke_etims_registered': True,
+            'l10n_ke_etims_item_code': result_data.get('itemCd') or item_data.get('itemCd') or str(self.id),
+            'l10n_ke_etims_registration_date': fields.Datetime.now(),
+        }
+
     def _prepare_etims_item_data(self, config):
         """Prepare item data for eTIMS API."""
         self.ensure_one()
@@ -319,7 +324,14 @@ class ProductTemplate(models.Model):
         }
 
     def action_bulk_register_etims(self):
-        """Bulk register selected products with eTIMS."""
+        """
+        Bulk register selected products with eTIMS.
+
+        Products are registered in the background by an eTIMS registration
+        batch: payloads are sent concurrently in chunks and each chunk is
+        committed, so large catalogues do not hold one long transaction and
+        an interrupted run resumes where it stopped.
+        """
         products_to_register = self.filtered(lambda p: not p.l10n_ke_etims_registered)
 
         if not products_to_register:
@@ -332,29 +344,19 @@ class ProductTemplate(models.Model):
                 'The following products are missing UNSPSC classification:\n%s'
             ) % '\n'.join(missing_unspsc.mapped('name')))
 
-        success_count = 0
-        failed_products = []
-
-        for product in products_to_register:
-            try:
-                product.action_register_etims()
-                success_count += 1
-            except Exception as e:
-                _logger.warning('Failed to register product %s: %s', product.name, str(e))
-                failed_products.append(f"{product.name}: {str(e)}")
-
-        message = _('Registered: %d') % success_count
-        if failed_products:
-            message += _('\nFailed: %d') % len(failed_products)
+        batches = self.env['etims.registration.batch']
+        for company, products in products_to_register.grouped(
+                lambda p: p.company_id or self.env.company).items():
+            batches |= batches._create_for_products(company, products)
+        batches.action_start()
 
         return {
-            'type': 'ir.actions.client',
-            'tag': 'display_notification',
-            'params': {
-                'title': _('Bulk Registration Complete'),
-                'message': message,
-                'type': 'success' if not failed_products else 'warning',
-            }
+            'type': 'ir.actions.act_window',
+            'name': _('eTIMS Product Registration'),
+            'res_model': 'etims.registration.batch',
+            'view_mode': 'form' if len(batches) == 1 else 'tree,form',
+            'res_id': batches.id if len(batches) == 1 else False,
+            'domain': [('id', 'in', batches.ids)],
         }
 
 
@@ -422,3 +424,42 @@ class ProductProduct(models.Model):
         """Get the eTIMS tax type for this product."""
         self.ensure_one()
         return self.product_tmpl_id.l10n_ke_tax_type or 'B'
+
+    def _get_etims_item_infos(self):
+        """
+        eTIMS attributes of every product in the recordset.
+
+        Product, template, classification and origin country fields are
+        fetched once for the whole recordset, so the per-product helpers
+        below only hit the cache.
+
+        Returns:
+            dict: product id -> {name, registered, item_code, item_class_code,
+                  pkg_unit, qty_unit, tax_type}
+        """
+        if not self:
+            return {}
+        self.fetch(['default_code', 'product_tmpl_id'])
+        templates = self.product_tmpl_id
+        templates.fetch([
+            'name', 'l10n_ke_etims_registered', 'l10n_ke_etims_item_code', 'l10n_ke_item_class_id',
+            'l10n_ke_origin_country_id', 'l10n_ke_product_type', 'l10n_ke_pkg_unit_code',
+            'l10n_ke_qty_unit_code', 'l10n_ke_tax_type',
+        ])
+        templates.l10n_ke_item_class_id.fetch(['code'])
+        templates.l10n_ke_origin_country_id.fetch(['code'])
+
+        infos = {}
+        for product in self:
+            tmpl = product.product_tmpl_id
+            unit_codes = product._get_etims_unit_codes()
+            infos[product.id] = {
+                'name': tmpl.name,
+                'registered': tmpl.l10n_ke_etims_registered,
+                'item_code': product._get_etims_item_code(),
+                'item_class_code': tmpl.l10n_ke_item_class_id.code or '',
+                'pkg_unit': unit_codes['pkg_unit'],
+                'qty_unit': unit_codes['qty_unit'],
+                'tax_type': tmpl.l10n_ke_tax_type,
+            }
+        return infos
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.addons.l10n_ke_etims.models.etims_transport import EtimsConnectionError, EtimsTransport
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install')
+class TestEtimsSubmissionJob(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        cls.config = cls.env['etims.config'].create({
+            'company_id': cls.company_data['company'].id,
+            'tin': 'P000000000X',
+            'bhf_id': '00',
+            'cmn_key': 'TESTKEY',
+            'sdc_id': 'KRACU0400000001',
+            'device_state': 'initialized',
+        })
+        item_class = cls.env['etims.item.class'].create({
+            'code': '10101501',
+            'name': 'Test commodity',
+        })
+        cls.product_a.product_tmpl_id.write({
+            'l10n_ke_etims_registered': True,
+            'l10n_ke_item_class_id': item_class.id,
+        })
+
+    def _get_counter(self):
+        return self.env['etims.counter'].search([
+            ('company_id', '=', self.company_data['company'].id),
+            ('counter_type', '=', 'invoice'),
+        ])
+
+    def test_timeout_keeps_invoice_number(self):
+        """A read timeout may reach KRA: the invcNo and the counter increment must survive."""
+        invoice = self.init_invoice('out_invoice', products=self.product_a, post=True)
+        job = self.env['etims.submission.job']._enqueue(invoice)
+        self.assertEqual(len(job), 1)
+
+        timeout = EtimsConnectionError('eTIMS API Error: Read timed out.')
+        with patch.object(EtimsTransport, 'call', side_effect=timeout):
+            with self.assertRaises(EtimsConnectionError):
+                job._process()
+
+        self.assertFalse(invoice.etims_submitted)
+        self.assertTrue(invoice.etims_invoice_number)
+        self.assertEqual(self._get_counter().last_number, invoice.etims_invoice_number)
+
+        # The retry resends the same number
+        with patch.object(EtimsTransport, 'call', side_effect=timeout) as call:
+            with self.assertRaises(EtimsConnectionError):
+                job._process()
+        sent = call.call_args.args[3]
+        self.assertEqual(sent['invcNo'], invoice.etims_invoice_number)
+        self.assertEqual(self._get_counter().last_number, invoice.etims_invoice_number)
@@ -3,7 +3,7 @@
     'name': 'Kenya - eTIMS POS Integration',
     # Version format: 17.0.{TIS_MAJOR}.{TIS_MINOR}.{TIS_PATCH}
     # Must match base l10n_ke_etims module versioning
-    'version': '17.0.2.0.0',
+    'version': '17.0.2.0.1',
     'category': 'Point of Sale',
     'summary': 'VumaERP KRA eTIMS integration for Point of Sale',
     'description': """
@@ -16,7 +16,7 @@ TIS IDENTIFICATION
 ------------------
 - TIS Name: VumaERP
 - TIS Version: 2.0.0
-- Module Version: 17.0.2.0.0 (Odoo 17.0, TIS v2.0.0)
+- Module Version: 17.0.2.0.1 (Odoo 17.0, TIS v2.0.0)
 
 CRITICAL COMPLIANCE FEATURE
 ---------------------------
@@ -26,12 +26,14 @@ must represent actual sales transactions.
 
 POS FEATURES
 ------------
-* Real-time POS order submission to eTIMS at payment completion
-* Batch submission at session close for any missed orders
+* POS orders queued for eTIMS at payment completion and submitted by the
+  background submission queue, so checkout never waits on KRA
+* Session close only queues the orders still pending; nothing is sent inline
 * POS return/refund handling with KRA reason codes
 * Session-level eTIMS submission tracking (submitted/pending/failed stats)
 * eTIMS receipt printing with SCU and receipt numbers
 * Offline queue capability with automatic retry
+* Browser-side (IndexedDB) buffer of orders awaiting fiscalisation, flushed in bulk
 
 INVOICE/PAYMENT FEATURES
 ------------------------
@@ -65,6 +67,7 @@ This module requires the base Kenya eTIMS module (l10n_ke_etims).
     ],
     'assets': {
         'point_of_sale._assets_pos': [
+            'l10n_ke_etims_pos/static/src/js/etims_offline_queue.js',
             'l10n_ke_etims_pos/static/src/js/pos_etims.js',
             'l10n_ke_etims_pos/static/src/xml/pos_etims.xml',
         ],
@@ -2,5 +2,9 @@
 
 from . import account_move
 from . import account_payment
+from . import etims_counter
+from . import etims_daily_report
+from . import etims_receipt
+from . import etims_transaction_line
 from . import pos_order
 from . import pos_session
@@ -45,7 +45,8 @@ class AccountMove(models.Model):
         Auto-submit invoice to eTIMS when payment is received.
 
         This method is called by account.payment when a customer payment
-        is posted and reconciled against this invoice.
+        is posted and reconciled against this invoice. The invoice is queued
+        in etims.submission.job and sent to KRA in the background.
 
         Key compliance point (per KPMG advisory):
         - Submit to eTIMS only when payment is actually received
@@ -78,33 +79,13 @@ class AccountMove(models.Model):
         if self.company_id.country_id.code != 'KE':
             return False
 
-        try:
-            # Use the existing action_submit_etims method from base module
-            self.action_submit_etims()
-            _logger.info(
-                'Invoice %s auto-submitted to eTIMS on payment receipt',
-                self.name
-            )
-            return True
-
-        except UserError as e:
-            # Log but don't block - payment already received
-            _logger.warning(
-                'Failed to auto-submit invoice %s to eTIMS: %s',
-                self.name, str(e)
-            )
-            self.message_post(
-                body=_('eTIMS auto-submission failed on payment: %s. '
-                       'Please submit manually.') % str(e)
-            )
-            return False
-
-        except Exception as e:
-            _logger.error(
-                'Unexpected error during eTIMS submission for invoice %s: %s',
-                self.name, str(e)
-            )
-            return False
+        # Queue the submission: the payment transaction must not wait on KRA
+        self.env['etims.submission.job']._enqueue(self)
+        _logger.info(
+            'Invoice %s queued for eTIMS submission on payment receipt',
+            self.name
+        )
+        return True
 
     def action_post(self):
         """
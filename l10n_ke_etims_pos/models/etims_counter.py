@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models
+
+
+class EtimsCounter(models.Model):
+    _inherit = 'etims.counter'
+
+    @api.model
+    def _get_seed_value(self, company, counter_type):
+        """POS orders consume invoice numbers (invcNo) too."""
+        value = super()._get_seed_value(company, counter_type)
+        if counter_type == 'invoice':
+            self.env.cr.execute("""
+                SELECT COALESCE(MAX(etims_invoice_number), 0)
+                FROM pos_order
+                WHERE company_id = %s
+            """, (company.id,))
+            value = max(value, self.env.cr.fetchone()[0])
+        return value
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+POS orders in the eTIMS X/Z reports.
+
+POS orders are aggregated in SQL like invoices (their tax breakdown comes
+from the eTIMS transaction ledger); payments are bucketed with
+a method -> bucket mapping computed once per report instead of matching
+payment method names for every payment.
+"""
+from odoo import api, models
+
+# Payment method name fragments identifying a bucket
+MOBILE_MONEY_KEYWORDS = ('mpesa', 'm-pesa', 'mobile', 'airtel')
+CARD_KEYWORDS = ('card', 'visa', 'mastercard')
+
+
+class EtimsDailyReport(models.Model):
+    _inherit = 'etims.daily.report'
+
+    def _get_report_values(self, period_start, period_end):
+        vals = super()._get_report_values(period_start, period_end)
+        self._add_report_values(vals, self._aggregate_pos_orders(period_start, period_end))
+        return vals
+
+    @api.model
+    def _get_payment_bucket(self, method):
+        """Report payment field for a POS payment method."""
+        name = (method.name or '').lower()
+        if method.type == 'pay_later':
+            return 'credit_amount'
+        if method.journal_id.type == 'cash':
+            return 'cash_amount'
+        if any(keyword in name for keyword in MOBILE_MONEY_KEYWORDS):
+            return 'mobile_amount'
+        if any(keyword in name for keyword in CARD_KEYWORDS):
+            return 'card_amount'
+        return 'other_amount'
+
+    def _aggregate_pos_orders(self, period_start, period_end):
+        """Receipt counts, totals and payments of POS orders submitted in the period."""
+        self.ensure_one()
+        self.env['pos.order'].flush_model()
+        self.env['pos.payment'].flush_model()
+
+        where = """
+            po.company_id = %(company_id)s
+            AND po.state IN ('paid', 'done', 'invoiced')
+            AND po.etims_submitted
+            AND po.etims_submit_date >= %(start)s
+            AND po.etims_submit_date <= %(end)s
+        """
+        params = {'company_id': self.company_id.id, 'start': period_start, 'end': period_end}
+        values = {}
+
+        self.env.cr.execute(f"""
+            SELECT po.etims_receipt_type_label, COUNT(*), COALESCE(SUM(ABS(po.amount_total)), 0)
+            FROM pos_order po
+            WHERE {where}
+            GROUP BY po.etims_receipt_type_label
+        """, params)
+        self._add_receipt_counts(values, self.env.cr.fetchall())
+
+        self.env.cr.execute(f"""
+            SELECT pay.payment_method_id, COALESCE(SUM(pay.amount), 0)
+            FROM pos_payment pay
+            JOIN pos_order po ON po.id = pay.pos_order_id
+            WHERE {where}
+            GROUP BY pay.payment_method_id
+        """, params)
+        amounts = dict(self.env.cr.fetchall())
+        methods = self.env['pos.payment.method'].sudo().with_context(active_test=False).browse(amounts)
+        for method in methods:
+            bucket = self._get_payment_bucket(method)
+            values[bucket] = values.get(bucket, 0) + amounts[method.id]
+        return values
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models
+
+
+class EtimsReceiptMixin(models.AbstractModel):
+    _inherit = 'etims.receipt.mixin'
+
+    @api.model
+    def _get_qr_backfill_models(self):
+        """POS receipts carry a QR code too."""
+        return super()._get_qr_backfill_models() + ['pos.order']
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+
+
+class EtimsTransactionLine(models.Model):
+    _inherit = 'etims.transaction.line'
+
+    pos_order_id = fields.Many2one('pos.order', string='POS Order', index='btree_not_null',
+                                   ondelete='cascade', readonly=True)
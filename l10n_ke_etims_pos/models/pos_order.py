@@ -4,26 +4,33 @@ POS Order eTIMS Integration
 
 Handles submission of Point of Sale orders to KRA eTIMS.
 POS transactions are submitted when:
-1. Payment is completed at the POS (immediate submission)
+1. Payment is completed at the POS (queued, sent in the background)
 2. Session is closed (batch submission for any missed orders)
 
 This is critical for SME compliance as POS is a primary sales channel.
 
 Key Features:
-- Real-time submission when payment is finalized
+- Background submission queued when payment is finalized
 - Offline queue for submission when connectivity is lost
-- Batch submission at session close
+- Missed orders queued at session close
 - POS refund/return handling
 """
 import logging
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+
+from odoo.addons.l10n_ke_etims.models.etims_transport import EtimsConnectionError
 
 _logger = logging.getLogger(__name__)
 
+# Orders fiscalised per call of the POS bulk endpoint; the batch holds the
+# etims.counter row lock across all of its KRA round trips
+MAX_FISCALISE_BATCH = 10
+
 
 class PosOrder(models.Model):
-    _inherit = 'pos.order'
+    _inherit = ['pos.order', 'etims.sales.payload.mixin']
 
     # eTIMS Submission Fields
     etims_submitted = fields.Boolean(
@@ -105,6 +112,26 @@ class PosOrder(models.Model):
         help='Receipt type label per TIS spec (NS, NC, CS, CC, TS, TC, PS)'
     )
 
+    # QR Code
+    etims_qr_code = fields.Binary(
+        string='eTIMS QR Code',
+        compute='_compute_etims_qr_code',
+        store=True,
+        attachment=True,
+        copy=False,
+        help='QR code for receipt per TIS spec, rendered once when KRA returns the receipt data'
+    )
+
+    def init(self):
+        super().init()
+        # X/Z reports aggregate submitted orders by submission date
+        create_index(self._cr, 'pos_order_etims_submit_date_idx', self._table,
+                     ['company_id', 'etims_submit_date'], where='etims_submitted')
+        # Pending/failed eTIMS orders of a session; the predicate matches the
+        # SQL the ORM generates for ('etims_submitted', '=', False)
+        create_index(self._cr, 'pos_order_etims_pending_session_idx', self._table,
+                     ['session_id'], where='etims_submitted IS NULL OR etims_submitted = FALSE')
+
     @api.depends('etims_transaction_type', 'amount_total')
     def _compute_etims_receipt_type_label(self):
         """Compute receipt type label per TIS spec Section 4."""
@@ -175,32 +202,17 @@ class PosOrder(models.Model):
         content = self.get_etims_qr_content()
         if not content:
             return False
+        return self.env['etims.receipt.mixin'].generate_qr_code_image(content)
 
-        try:
-            import qrcode
-            import io
-            import base64
-
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(content)
-            qr.make(fit=True)
-            img = qr.make_image(fill_color="black", back_color="white")
-
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-            return base64.b64encode(buffer.getvalue()).decode('utf-8')
-        except ImportError:
-            _logger.warning('qrcode library not installed')
-            return False
-        except Exception as e:
-            _logger.error('Failed to generate QR code: %s', str(e))
-            return False
+    @api.depends('etims_submitted', 'etims_sdc_datetime', 'etims_sdc_id', 'etims_rcpt_no',
+                 'etims_intrl_data', 'etims_rcpt_sign')
+    def _compute_etims_qr_code(self):
+        """Generate QR code image per TIS spec."""
+        for order in self:
+            if not order.etims_submitted:
+                order.etims_qr_code = False
+                continue
+            order.etims_qr_code = order.get_etims_qr_image() or False
 
     @api.depends('etims_sdc_id', 'etims_rcpt_no')
     def _compute_etims_cu_invoice_number(self):
@@ -216,30 +228,14 @@ class PosOrder(models.Model):
         Get the next sequential eTIMS invoice number for POS.
         Per OSCU spec, invcNo must be a NUMBER (integer sequence).
 
-        Uses PostgreSQL advisory lock to prevent race conditions when
-        multiple POS terminals submit orders simultaneously.
+        POS orders share the company's invoice counter (etims.counter) with
+        invoices. The number is stored on the order right away, so a retried
+        submission reuses it.
         """
         self.ensure_one()
-        # Acquire advisory lock for this company's invoice number sequence
-        # Uses a hash of 'etims_invc_no_{company_id}' as the lock key
-        self.env.cr.execute(
-            "SELECT pg_advisory_xact_lock(hashtext(%s))",
-            (f'etims_invc_no_{self.company_id.id}',)
-        )
-        # Get the max invoice number for this company from both invoices and POS orders
-        self.env.cr.execute("""
-            SELECT COALESCE(MAX(max_num), 0) + 1 FROM (
-                SELECT MAX(etims_invoice_number) as max_num
-                FROM account_move
-                WHERE company_id = %s AND etims_invoice_number IS NOT NULL
-                UNION ALL
-                SELECT MAX(etims_invoice_number) as max_num
-                FROM pos_order
-                WHERE company_id = %s AND etims_invoice_number IS NOT NULL
-            ) combined
-        """, (self.company_id.id, self.company_id.id))
-        result = self.env.cr.fetchone()
-        return result[0] if result else 1
+        number = self.env['etims.counter']._reserve(self.company_id, 'invoice')
+        self.etims_invoice_number = number
+        return number
 
     # Refund-specific fields for POS returns
     # Per OSCU Spec Section 4.16: only codes 01-05 are valid
@@ -281,23 +277,6 @@ class PosOrder(models.Model):
             dt = fields.Datetime.from_string(dt)
         return dt.strftime('%Y%m%d%H%M%S')
 
-    def _get_etims_tax_code(self, tax):
-        """
-        Map Odoo tax to eTIMS tax type code.
-        A = Exempt, B = 16%, C = 0%, D = Non-VAT, E = 8%
-        """
-        if not tax:
-            return 'D'
-        amount = tax.amount if tax else 0
-        if amount == 16:
-            return 'B'
-        elif amount == 8:
-            return 'E'
-        elif amount == 0:
-            return 'C'
-        else:
-            return 'D'
-
     def _get_etims_payment_type(self):
         """
         Determine eTIMS payment type based on POS payment methods.
@@ -342,94 +321,27 @@ class PosOrder(models.Model):
 
         return '01'  # Default to cash
 
-    def _prepare_etims_item(self, line, seq):
-        """Prepare a single POS order line for eTIMS."""
-        product = line.product_id
-        product_tmpl = product.product_tmpl_id if product else None
-
-        # Get tax information
-        tax = line.tax_ids[:1] if line.tax_ids else line.tax_ids_after_fiscal_position[:1] if hasattr(line, 'tax_ids_after_fiscal_position') else None
-        if product_tmpl and product_tmpl.l10n_ke_tax_type:
-            tax_code = product_tmpl.l10n_ke_tax_type
-        else:
-            tax_code = self._get_etims_tax_code(tax)
-
-        tax_amt = tax.amount if tax else 0
-        tax_is_inclusive = tax.price_include if tax else True
-
-        # Get quantities - handle negative for refunds
-        qty = abs(line.qty)
-        unit_price = line.price_unit
-        discount_amt = (abs(unit_price * line.qty) * line.discount / 100) if line.discount else 0
-        supply_amt = abs(line.price_subtotal_incl)
-
-        # Calculate tax amounts - handle both inclusive and exclusive pricing for B2B support
-        if tax_amt > 0:
-            if tax_is_inclusive:
-                # Tax-inclusive: price already includes tax, extract taxable amount
-                taxable_amt = supply_amt / (1 + tax_amt / 100)
-                tax_amount = supply_amt - taxable_amt
-            else:
-                # Tax-exclusive: price is net, calculate tax to add
-                taxable_amt = supply_amt
-                tax_amount = supply_amt * tax_amt / 100
-                # For eTIMS, supply_amt should be the gross amount
-                supply_amt = taxable_amt + tax_amount
-        else:
-            taxable_amt = supply_amt
-            tax_amount = 0
-
-        # Get item codes
-        if product:
-            item_code = product._get_etims_item_code()[:20]
-            item_class_code = product._get_etims_item_class_code()
-            unit_codes = product._get_etims_unit_codes()
-            pkg_unit_code = unit_codes['pkg_unit']
-            qty_unit_code = unit_codes['qty_unit']
-        else:
-            item_code = 'SVC'
-            item_class_code = ''
-            pkg_unit_code = 'NT'
-            qty_unit_code = 'U'
+    def _get_etims_item_lines(self):
+        return self.lines
 
+    def _get_etims_line_amounts(self, line):
+        # Quantities and amounts are negative on refunds; eTIMS expects them positive
+        tax = line.tax_ids[:1] or line.tax_ids_after_fiscal_position[:1]
         return {
-            'itemSeq': seq,
-            'itemCd': item_code,
-            'itemClsCd': item_class_code,
-            'itemNm': (line.full_product_name or product.name if product else 'Item')[:200],
-            'pkgUnitCd': pkg_unit_code,
-            'pkg': 1,
-            'qtyUnitCd': qty_unit_code,
-            'qty': qty,
-            'prc': round(abs(unit_price), 2),
-            'splyAmt': round(supply_amt, 2),
-            'dcRt': line.discount or 0,
-            'dcAmt': round(discount_amt, 2),
-            'taxTyCd': tax_code,
-            'taxblAmt': round(taxable_amt, 2),
-            'taxAmt': round(tax_amount, 2),
-            'totAmt': round(supply_amt, 2),
+            'name': line.full_product_name or line.product_id.name,
+            'qty': abs(line.qty),
+            'price_unit': abs(line.price_unit),
+            'discount': line.discount,
+            'discount_amt': (abs(line.price_unit * line.qty) * line.discount / 100) if line.discount else 0,
+            'supply_amt': abs(line.price_subtotal_incl),
+            'tax': tax or None,
         }
 
     def _prepare_etims_payload(self):
         """Prepare the full eTIMS sales transaction payload for POS order."""
         self.ensure_one()
 
-        # Prepare items
-        items = []
-        totals = {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'E': 0}
-        tax_totals = {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'E': 0}
-
-        seq = 0
-        for line in self.lines:
-            seq += 1
-            item = self._prepare_etims_item(line, seq)
-            items.append(item)
-
-            # Accumulate totals by tax type
-            tax_code = item['taxTyCd']
-            totals[tax_code] += item['taxblAmt']
-            tax_totals[tax_code] += item['taxAmt']
+        items, totals, tax_totals = self._prepare_etims_items()
 
         # Determine if this is a refund/return
         is_return = self.amount_total < 0
@@ -534,23 +446,8 @@ class PosOrder(models.Model):
                     'Please submit the original order to eTIMS first, then submit this refund.'
                 ) % self.etims_original_order_id.name)
 
-        # Validate products
-        for line in self.lines:
-            product = line.product_id
-            if not product:
-                continue
-
-            if not product.product_tmpl_id.l10n_ke_etims_registered:
-                raise UserError(_(
-                    'Product "%s" must be registered with eTIMS before it can be sold.\n'
-                    'Go to the product form and click "Register with eTIMS".'
-                ) % product.name)
-
-            if not product.product_tmpl_id.l10n_ke_item_class_id:
-                raise UserError(_(
-                    'Product "%s" is missing UNSPSC classification.\n'
-                    'Go to the product form, eTIMS Kenya tab, and select a UNSPSC Classification.'
-                ) % product.name)
+        # Validate products are registered with eTIMS and have UNSPSC codes
+        self._check_etims_products(self.lines.product_id._get_etims_item_infos())
 
         return True
 
@@ -571,56 +468,92 @@ class PosOrder(models.Model):
             _logger.warning('eTIMS not configured for company %s', self.company_id.name)
             return False
 
-        # Prepare and send
+        # Prepare and send; a number reserved here is given back if KRA rejects the order
+        fresh = not self.etims_invoice_number
         payload = self._prepare_etims_payload()
 
         try:
             result = config._call_api('/saveTrnsSalesOsdc', payload)
+            accepted = self._etims_process_response(config, payload, result)
 
-            if result.get('resultCd') == '000':
-                data = result.get('data', {})
-                # Get SDC ID from config (set during device initialization)
-                sdc_id = config.sdc_id if hasattr(config, 'sdc_id') else ''
-                # Per OSCU spec: curRcptNo is the current receipt number
-                rcpt_no = str(data.get('curRcptNo', data.get('rcptNo', '')))
-
-                self.write({
-                    'etims_submitted': True,
-                    'etims_invoice_number': payload.get('invcNo'),  # Store the invoice number we sent
-                    'etims_sdc_id': sdc_id,
-                    'etims_rcpt_no': rcpt_no,
-                    'etims_intrl_data': data.get('intrlData', ''),
-                    'etims_rcpt_sign': data.get('rcptSign', ''),
-                    'etims_sdc_datetime': data.get('sdcDateTime', ''),
-                    'etims_submit_date': fields.Datetime.now(),
-                    'etims_response': str(result),
-                    'etims_submission_error': False,
-                })
-                _logger.info(
-                    'POS Order %s submitted to eTIMS. Receipt #: %s',
-                    self.name, rcpt_no
-                )
-                return True
-            else:
-                error_msg = result.get('resultMsg', 'Unknown error')
-                self.write({
-                    'etims_response': str(result),
-                    'etims_submission_error': error_msg,
-                })
-                _logger.warning(
-                    'POS Order %s eTIMS submission failed: %s',
-                    self.name, error_msg
-                )
-                return False
-
+        except EtimsConnectionError as e:
+            # KRA unreachable: let the caller (e.g. the submission queue) back off.
+            # The number is kept, KRA may have received it before a timeout.
+            self.etims_submission_error = str(e)
+            raise
         except Exception as e:
             self.etims_submission_error = str(e)
             _logger.error(
                 'POS Order %s eTIMS submission error: %s',
                 self.name, str(e)
             )
+            accepted = False
+
+        if not accepted and fresh:
+            self._release_etims_invoice_number()
+        return accepted
+
+    def _release_etims_invoice_number(self):
+        """Give back the invcNo of a rejected order, unless a later number was handed out since."""
+        self.ensure_one()
+        number = self.etims_invoice_number
+        if number and self.env['etims.counter']._release(self.company_id, 'invoice', number):
+            self.etims_invoice_number = 0
+
+    def _etims_process_response(self, config, payload, result):
+        """
+        Store the KRA response of a sales submission.
+
+        On success the receipt data is written on the order and the item
+        lines are recorded in the eTIMS transaction ledger.
+
+        Returns:
+            bool: True if KRA accepted the transaction
+        """
+        self.ensure_one()
+
+        if result.get('resultCd') != '000':
+            error_msg = result.get('resultMsg', 'Unknown error')
+            self.write({
+                'etims_response': str(result),
+                'etims_submission_error': error_msg,
+            })
+            _logger.warning(
+                'POS Order %s eTIMS submission failed: %s',
+                self.name, error_msg
+            )
             return False
 
+        data = result.get('data', {})
+        # Get SDC ID from config (set during device initialization)
+        sdc_id = config.sdc_id if hasattr(config, 'sdc_id') else ''
+        # Per OSCU spec: curRcptNo is the current receipt number
+        rcpt_no = str(data.get('curRcptNo', data.get('rcptNo', '')))
+
+        self.write({
+            'etims_submitted': True,
+            'etims_invoice_number': payload.get('invcNo'),  # Store the invoice number we sent
+            'etims_sdc_id': sdc_id,
+            'etims_rcpt_no': rcpt_no,
+            'etims_intrl_data': data.get('intrlData', ''),
+            'etims_rcpt_sign': data.get('rcptSign', ''),
+            'etims_sdc_datetime': data.get('sdcDateTime', ''),
+            'etims_submit_date': fields.Datetime.now(),
+            'etims_response': str(result),
+            'etims_submission_error': False,
+        })
+        self.env['etims.transaction.line']._create_from_payload(payload, {
+            'pos_order_id': self.id,
+            'company_id': self.company_id.id,
+            'receipt_type_label': self.etims_receipt_type_label,
+            'submit_date': self.etims_submit_date,
+        })
+        _logger.info(
+            'POS Order %s submitted to eTIMS. Receipt #: %s',
+            self.name, rcpt_no
+        )
+        return True
+
     def action_submit_etims(self):
         """Manual action to submit POS order to eTIMS."""
         self.ensure_one()
@@ -645,33 +578,199 @@ class PosOrder(models.Model):
 
     def action_pos_order_paid(self):
         """
-        Override to submit to eTIMS when POS order is paid.
+        Override to queue eTIMS submission when POS order is paid.
         This is the key integration point - eTIMS submission happens at payment.
+
+        The order is sent to KRA by the submission queue (etims.submission.job)
+        so checkout never waits on a KRA round-trip.
         """
         res = super().action_pos_order_paid()
 
-        # Submit to eTIMS for Kenyan companies
-        for order in self:
-            if order._is_etims_applicable():
-                try:
-                    if order._validate_etims_submission():
-                        order._submit_to_etims()
-                except UserError as e:
-                    # Don't block the POS transaction, log and continue
-                    _logger.warning(
-                        'eTIMS submission failed for POS order %s: %s',
-                        order.name, str(e)
-                    )
-                    order.etims_submission_error = str(e)
-                except Exception as e:
-                    _logger.error(
-                        'eTIMS submission error for POS order %s: %s',
-                        order.name, str(e)
-                    )
-                    order.etims_submission_error = str(e)
+        orders = self.filtered(lambda o: o._is_etims_applicable() and not o.etims_submitted)
+        self.env['etims.submission.job']._enqueue(orders)
 
         return res
 
+    def _etims_submit_from_job(self):
+        """
+        Submission queue handler (see etims.submission.job).
+
+        Returns:
+            dict {order_id: error message or False}
+        """
+        errors = {}
+        locked = self._etims_lock_for_submission()
+        locked.lines.product_id._get_etims_item_infos()
+        for order in self:
+            if order.etims_submitted:
+                errors[order.id] = False
+                continue
+            if order not in locked:
+                errors[order.id] = _('Order is being submitted by another process.')
+                continue
+            try:
+                if not order._validate_etims_submission():
+                    errors[order.id] = _('Order is not ready for eTIMS submission.')
+                elif order._submit_to_etims():
+                    errors[order.id] = False
+                else:
+                    errors[order.id] = order.etims_submission_error or _('Unknown error')
+            except EtimsConnectionError:
+                raise
+            except UserError as e:
+                order.etims_submission_error = str(e)
+                errors[order.id] = str(e)
+        return errors
+
+    def _etims_lock_for_submission(self):
+        """
+        Lock the unsubmitted orders of this recordset for submission.
+
+        Both the submission queue and the POS bulk endpoint can pick up the
+        same order; only the transaction holding the row lock sends it, so
+        an order is never fiscalised twice. Orders locked by another
+        transaction are left out.
+
+        Returns:
+            pos.order recordset of the locked orders
+        """
+        if not self:
+            return self
+        self.flush_recordset(['etims_submitted'])
+        self.env.cr.execute("""
+            SELECT id FROM pos_order
+             WHERE id IN %s AND etims_submitted IS NOT TRUE
+               FOR UPDATE SKIP LOCKED
+        """, (tuple(self.ids),))
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def etims_fiscalise_orders(self, order_refs):
+        """
+        Fiscalise orders buffered by the POS frontend (bulk endpoint).
+
+        The POS keeps finalized orders waiting for eTIMS receipt data in a
+        local queue and flushes them here in batches. Invoice numbers for a
+        batch are reserved in one counter update; the orders are then sent
+        in number order over the pooled connection, since KRA expects invcNo
+        in sequence. While KRA is unreachable the rest of the batch is left
+        pending and the submission queue keeps retrying it.
+
+        Args:
+            order_refs: POS order references (pos_reference, e.g. 'Order 00001-001-0001')
+
+        Returns:
+            list of dicts, one per reference: {'reference', 'state', 'error'}
+            plus the receipt fields when the order is submitted. state is one
+            of submitted, pending, failed, skipped or unknown (order not
+            synced to the server yet).
+        """
+        order_refs = list(order_refs or [])[:MAX_FISCALISE_BATCH]
+        orders = self.search([('pos_reference', 'in', order_refs)], order='id')
+        states = {}
+
+        to_send = orders.filtered(lambda o: not o.etims_submitted and o._is_etims_applicable())
+        for order in orders - to_send:
+            states[order.id] = ('submitted' if order.etims_submitted else 'skipped', False)
+
+        locked = to_send._etims_lock_for_submission()
+        for order in to_send - locked:
+            states[order.id] = ('pending', _('Order is being submitted by another process.'))
+
+        for company, company_orders in locked.grouped('company_id').items():
+            states.update(company_orders.with_company(company)._etims_submit_batch())
+
+        results = []
+        orders_by_ref = {order.pos_reference: order for order in orders}
+        for ref in order_refs:
+            order = orders_by_ref.get(ref)
+            if not order:
+                results.append({'reference': ref, 'state': 'unknown', 'error': False})
+                continue
+            state, error = states[order.id]
+            result = {'reference': ref, 'state': state, 'error': error}
+            if state == 'submitted':
+                result.update(order._get_etims_receipt_data())
+            results.append(result)
+        return results
+
+    def _etims_submit_batch(self):
+        """
+        Submit orders of one company in invoice number order.
+
+        Returns:
+            dict {order_id: (state, error message or False)}
+        """
+        states = {}
+        valid = self.browse()
+        # Product data of the whole batch in one read; per-order payloads hit the cache
+        self.lines.product_id._get_etims_item_infos()
+        for order in self:
+            try:
+                order._validate_etims_submission()
+                valid |= order
+            except UserError as e:
+                order.etims_submission_error = str(e)
+                states[order.id] = ('failed', str(e))
+
+        # One counter update for the whole batch. Numbers are handed out as
+        # the orders are sent: a rejected order gives its number to the next
+        # one and numbers left over are released, so numbering stays gapless.
+        # Orders still holding a number from an earlier attempt go first.
+        unnumbered = valid.filtered(lambda o: not o.etims_invoice_number)
+        next_number = last_number = 0
+        if unnumbered:
+            next_number = self.env['etims.counter']._reserve(self.env.company, 'invoice', count=len(unnumbered))
+            last_number = next_number + len(unnumbered) - 1
+
+        ordered = (valid - unnumbered).sorted('etims_invoice_number') + unnumbered
+        for index, order in enumerate(ordered):
+            fresh = not order.etims_invoice_number
+            if fresh:
+                order.etims_invoice_number = next_number
+            try:
+                with self.env.cr.savepoint():
+                    submitted = order._submit_to_etims()
+            except EtimsConnectionError as e:
+                # KRA may have received this number: keep it, the queue
+                # retries it first and numbers the rest when they are sent
+                if fresh:
+                    next_number += 1
+                for pending in ordered[index:]:
+                    states[pending.id] = ('pending', str(e))
+                break
+            except UserError as e:
+                order.etims_submission_error = str(e)
+                submitted = False
+            if submitted:
+                states[order.id] = ('submitted', False)
+                if fresh:
+                    next_number += 1
+            else:
+                states[order.id] = ('failed', order.etims_submission_error or _('Unknown error'))
+                if fresh:
+                    order.etims_invoice_number = 0
+
+        if unnumbered and next_number <= last_number:
+            self.env['etims.counter']._release(self.env.company, 'invoice', next_number, last_number)
+        return states
+
+    def _get_etims_receipt_data(self):
+        """eTIMS fields printed on the POS receipt."""
+        self.ensure_one()
+        return {
+            'etims_submitted': self.etims_submitted,
+            'etims_sdc_id': self.etims_sdc_id or '',
+            'etims_rcpt_no': self.etims_rcpt_no or '',
+            'etims_cu_invoice_number': self.etims_cu_invoice_number or '',
+            'etims_receipt_type_label': self.etims_receipt_type_label or '',
+            'etims_sdc_datetime': self.etims_sdc_datetime or '',
+            'etims_intrl_data_formatted': self.get_formatted_internal_data() or '',
+            'etims_rcpt_sign_formatted': self.get_formatted_receipt_signature() or '',
+            'etims_qr_image': self.etims_qr_code.decode() if self.etims_qr_code else '',
+            'etims_transaction_type': self.etims_transaction_type or '',
+        }
+
     def export_for_printing(self):
         """
         Override to include all eTIMS receipt fields for printing.
@@ -686,18 +785,15 @@ class PosOrder(models.Model):
         - QR Code
         """
         result = super().export_for_printing()
-        result.update({
-            'etims_submitted': self.etims_submitted,
-            'etims_sdc_id': self.etims_sdc_id or '',
-            'etims_rcpt_no': self.etims_rcpt_no or '',
-            'etims_cu_invoice_number': self.etims_cu_invoice_number or '',
-            'etims_receipt_type_label': self.etims_receipt_type_label or '',
-            'etims_sdc_datetime': self.etims_sdc_datetime or '',
-            'etims_intrl_data_formatted': self.get_formatted_internal_data() or '',
-            'etims_rcpt_sign_formatted': self.get_formatted_receipt_signature() or '',
-            'etims_qr_image': self.get_etims_qr_image() or '',
-            'etims_transaction_type': self.etims_transaction_type or '',
-        })
+        result.update(self._get_etims_receipt_data())
+        return result
+
+    def _export_for_ui(self, order):
+        """Send the eTIMS receipt data with orders the POS loads for reprints."""
+        result = super()._export_for_ui(order)
+        result['etims_submission_error'] = order.etims_submission_error or False
+        if order.etims_submitted:
+            result.update(order._get_etims_receipt_data())
         return result
 
     @api.model
@@ -734,16 +830,5 @@ class PosOrderLine(models.Model):
         if product and product.product_tmpl_id.l10n_ke_tax_type:
             return product.product_tmpl_id.l10n_ke_tax_type
 
-        # Fallback to tax amount detection
-        tax = self.tax_ids[:1] if self.tax_ids else None
-        if not tax:
-            return 'D'
-
-        amount = tax.amount if tax else 0
-        if amount == 16:
-            return 'B'
-        elif amount == 8:
-            return 'E'
-        elif amount == 0:
-            return 'C'
-        return 'D'
+        # Fallback to the tax's eTIMS tax type
+        return self.order_id._get_etims_tax_code(self.tax_ids[:1])
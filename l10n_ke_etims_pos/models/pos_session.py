@@ -2,9 +2,10 @@
 """
 POS Session eTIMS Integration
 
-Handles batch submission of POS orders to eTIMS at session close.
-This ensures any orders that failed to submit during real-time processing
-are submitted before the session is closed.
+Hands POS orders still waiting for eTIMS to the submission queue at session
+close. Orders missed during an outage are sent in the background, one commit
+per order, so closing a session never waits on KRA and an interrupted drain
+resumes where it stopped.
 
 Also provides session-level reporting and status tracking.
 """
@@ -18,45 +19,69 @@ _logger = logging.getLogger(__name__)
 class PosSession(models.Model):
     _inherit = 'pos.session'
 
-    # eTIMS Session Stats
+    # eTIMS Session Stats (stored, recomputed when an order's eTIMS state changes)
     etims_orders_submitted = fields.Integer(
         string='eTIMS Submitted Orders',
         compute='_compute_etims_stats',
+        store=True,
         help='Number of orders submitted to eTIMS in this session'
     )
     etims_orders_pending = fields.Integer(
         string='eTIMS Pending Orders',
         compute='_compute_etims_stats',
+        store=True,
         help='Number of orders pending eTIMS submission'
     )
     etims_orders_failed = fields.Integer(
         string='eTIMS Failed Orders',
         compute='_compute_etims_stats',
+        store=True,
         help='Number of orders with eTIMS submission errors'
     )
     etims_submission_complete = fields.Boolean(
         string='eTIMS Submission Complete',
         compute='_compute_etims_stats',
+        store=True,
         help='True if all orders have been submitted to eTIMS'
     )
 
-    @api.depends('order_ids.etims_submitted', 'order_ids.etims_submission_error')
+    @api.depends('order_ids.state', 'order_ids.etims_submitted', 'order_ids.etims_submission_error')
     def _compute_etims_stats(self):
+        """Count the sessions' orders by eTIMS state with one grouped query."""
+        stats = {}
+        session_ids = [session_id for session_id in self.ids if session_id]
+        if session_ids:
+            self.env['pos.order'].flush_model(
+                ['session_id', 'state', 'etims_submitted', 'etims_submission_error'])
+            self.env.cr.execute("""
+                SELECT session_id,
+                       COUNT(*) FILTER (WHERE etims_submitted),
+                       COUNT(*) FILTER (WHERE etims_submitted IS NOT TRUE
+                                          AND COALESCE(etims_submission_error, '') != ''),
+                       COUNT(*) FILTER (WHERE etims_submitted IS NOT TRUE
+                                          AND COALESCE(etims_submission_error, '') = '')
+                  FROM pos_order
+                 WHERE session_id IN %s
+                   AND state IN ('paid', 'done', 'invoiced')
+              GROUP BY session_id
+            """, (tuple(session_ids),))
+            stats = {row[0]: row[1:] for row in self.env.cr.fetchall()}
+
         for session in self:
-            orders = session.order_ids.filtered(
-                lambda o: o.state in ('paid', 'done', 'invoiced')
-            )
-            session.etims_orders_submitted = len(orders.filtered('etims_submitted'))
-            session.etims_orders_failed = len(orders.filtered(
-                lambda o: not o.etims_submitted and o.etims_submission_error
-            ))
-            session.etims_orders_pending = len(orders.filtered(
-                lambda o: not o.etims_submitted and not o.etims_submission_error
-            ))
-            session.etims_submission_complete = (
-                session.etims_orders_pending == 0 and
-                session.etims_orders_failed == 0
-            )
+            submitted, failed, pending = stats.get(session.id, (0, 0, 0))
+            session.etims_orders_submitted = submitted
+            session.etims_orders_failed = failed
+            session.etims_orders_pending = pending
+            session.etims_submission_complete = not pending and not failed
+
+    def _get_etims_pending_domain(self):
+        """Domain of the session's paid orders not yet submitted to eTIMS."""
+        self.ensure_one()
+        return [
+            ('session_id', '=', self.id),
+            ('etims_submitted', '=', False),
+            ('state', 'in', ('paid', 'done', 'invoiced')),
+        ]
 
     def _validate_session(self):
         """
@@ -70,7 +95,7 @@ class PosSession(models.Model):
             if session.company_id.country_id.code != 'KE':
                 continue
 
-            # Try to submit any pending orders before final close
+            # Queue any pending orders; they drain after the close commits
             session._submit_pending_etims_orders()
 
             # Warn if there are failed submissions
@@ -84,61 +109,61 @@ class PosSession(models.Model):
 
     def action_pos_session_close(self):
         """
-        Override session close to submit pending eTIMS orders.
+        Override session close to queue pending eTIMS orders.
         """
-        # First, try to submit any pending orders
+        # First, queue any pending orders
         for session in self:
             if session.company_id.country_id.code == 'KE':
                 session._submit_pending_etims_orders()
 
         return super().action_pos_session_close()
 
-    def _submit_pending_etims_orders(self):
+    def _submit_pending_etims_orders(self, retry_failed=False):
         """
-        Submit all pending POS orders to eTIMS.
+        Queue all pending POS orders of the session for eTIMS submission.
         Called at session close to ensure all orders are submitted.
+
+        Args:
+            retry_failed: Also requeue orders whose submission job failed or
+                          was dead-lettered
+
+        Returns:
+            int: Number of orders queued or requeued
         """
         self.ensure_one()
 
         # Find orders that need submission
-        pending_orders = self.order_ids.filtered(
-            lambda o: (
-                o.state in ('paid', 'done', 'invoiced') and
-                not o.etims_submitted
-            )
+        pending_orders = self.env['pos.order'].search(self._get_etims_pending_domain()).filtered(
+            lambda o: o._is_etims_applicable()
         )
 
         if not pending_orders:
-            return
-
-        success_count = 0
-        fail_count = 0
-
-        for order in pending_orders:
-            try:
-                if order._validate_etims_submission():
-                    if order._submit_to_etims():
-                        success_count += 1
-                    else:
-                        fail_count += 1
-            except Exception as e:
-                _logger.warning(
-                    'Failed to submit POS order %s to eTIMS: %s',
-                    order.name, str(e)
-                )
-                order.etims_submission_error = str(e)
-                fail_count += 1
+            return 0
+
+        Job = self.env['etims.submission.job']
+        queued = len(Job._enqueue(pending_orders))
+
+        if retry_failed:
+            failed_jobs = Job.sudo().search([
+                ('res_model', '=', 'pos.order'),
+                ('res_id', 'in', pending_orders.ids),
+                ('state', 'in', ('failed', 'dead')),
+            ])
+            if failed_jobs:
+                failed_jobs.action_retry()
+                queued += len(failed_jobs)
 
         _logger.info(
-            'POS Session %s: Submitted %d orders to eTIMS, %d failed',
-            self.name, success_count, fail_count
+            'POS Session %s: %d of %d pending orders queued for eTIMS',
+            self.name, queued, len(pending_orders)
         )
+        return queued
 
     def action_submit_pending_etims(self):
         """Manual action to retry submitting pending eTIMS orders."""
         self.ensure_one()
 
-        self._submit_pending_etims_orders()
+        queued = self._submit_pending_etims_orders(retry_failed=True)
 
         return {
             'type': 'ir.actions.client',
@@ -146,11 +171,12 @@ class PosSession(models.Model):
             'params': {
                 'title': _('eTIMS Submission'),
                 'message': _(
-                    'Submitted: %d, Pending: %d, Failed: %d'
-                ) % (
-                    self.etims_orders_submitted,
-                    self.etims_orders_pending,
-                    self.etims_orders_failed
+                    '%(queued)d orders queued for eTIMS; they are sent in the background.\n'
+                    'Submitted: %(submitted)d, Pending: %(pending)d, Failed: %(failed)d',
+                    queued=queued,
+                    submitted=self.etims_orders_submitted,
+                    pending=self.etims_orders_pending,
+                    failed=self.etims_orders_failed,
                 ),
                 'type': 'success' if self.etims_submission_complete else 'warning',
             }
@@ -159,30 +185,24 @@ class PosSession(models.Model):
     def action_view_etims_pending(self):
         """View orders pending eTIMS submission."""
         self.ensure_one()
-        pending_orders = self.order_ids.filtered(
-            lambda o: not o.etims_submitted and o.state in ('paid', 'done', 'invoiced')
-        )
         return {
             'name': _('Pending eTIMS Orders'),
             'type': 'ir.actions.act_window',
             'res_model': 'pos.order',
             'view_mode': 'tree,form',
-            'domain': [('id', 'in', pending_orders.ids)],
+            'domain': self._get_etims_pending_domain(),
             'context': {'create': False},
         }
 
     def action_view_etims_failed(self):
         """View orders with failed eTIMS submission."""
         self.ensure_one()
-        failed_orders = self.order_ids.filtered(
-            lambda o: not o.etims_submitted and o.etims_submission_error
-        )
         return {
             'name': _('Failed eTIMS Orders'),
             'type': 'ir.actions.act_window',
             'res_model': 'pos.order',
             'view_mode': 'tree,form',
-            'domain': [('id', 'in', failed_orders.ids)],
+            'domain': self._get_etims_pending_domain() + [('etims_submission_error', '!=', False)],
             'context': {'create': False},
         }
 
@@ -198,6 +218,12 @@ class PosConfig(models.Model):
         default=True,
         help='Automatically submit POS orders to eTIMS when payment is completed'
     )
+    etims_enabled = fields.Boolean(
+        string='eTIMS Enabled',
+        compute='_compute_etims_enabled',
+        help='Orders of this POS are fiscalised with eTIMS: auto-submit is on and '
+             'the company is a Kenyan company with an eTIMS configuration'
+    )
     etims_block_on_failure = fields.Boolean(
         string='Block on eTIMS Failure',
         default=False,
@@ -205,6 +231,18 @@ class PosConfig(models.Model):
              'Disable this for offline capability.'
     )
 
+    @api.depends('etims_auto_submit', 'company_id')
+    def _compute_etims_enabled(self):
+        configured = set(self.env['etims.config'].sudo().search([
+            ('company_id', 'in', self.company_id.ids),
+        ]).company_id.ids)
+        for config in self:
+            config.etims_enabled = (
+                config.etims_auto_submit and
+                config.company_id.country_id.code == 'KE' and
+                config.company_id.id in configured
+            )
+
     def get_limited_partners_loading(self):
         """Override to include eTIMS settings in POS."""
         result = super().get_limited_partners_loading()
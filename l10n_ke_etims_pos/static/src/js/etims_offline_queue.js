@@ -0,0 +1,105 @@
+/** @odoo-module **/
+
+/**
+ * Kenya eTIMS offline queue for Point of Sale
+ *
+ * Finalized orders still waiting for eTIMS receipt data are kept in an
+ * IndexedDB store, so they survive page reloads and lost connectivity.
+ * The POS flushes them in batches to pos.order.etims_fiscalise_orders and
+ * removes them once the server has taken them over; the receipt data lives
+ * on the order from then on.
+ *
+ * Entry: { uid, reference, state, created_at }
+ *   state: 'queued' (waiting for fiscalisation)
+ */
+
+const DB_NAME = "l10n_ke_etims_pos";
+// Version 2 drops the 'submitted' entries version 1 kept around
+const DB_VERSION = 2;
+const STORE = "orders";
+
+function promisify(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+export class EtimsOfflineQueue {
+    constructor() {
+        this._db = null;
+    }
+
+    async _open() {
+        if (this._db) {
+            return this._db;
+        }
+        if (!window.indexedDB) {
+            return null;
+        }
+        const request = window.indexedDB.open(DB_NAME, DB_VERSION);
+        request.onupgradeneeded = (event) => {
+            if (event.oldVersion < 1) {
+                const store = request.result.createObjectStore(STORE, { keyPath: "uid" });
+                store.createIndex("state", "state");
+                return;
+            }
+            const store = request.transaction.objectStore(STORE);
+            store.index("state").openCursor("submitted").onsuccess = (cursorEvent) => {
+                const cursor = cursorEvent.target.result;
+                if (cursor) {
+                    cursor.delete();
+                    cursor.continue();
+                }
+            };
+        };
+        try {
+            this._db = await promisify(request);
+        } catch (error) {
+            console.warn("eTIMS: offline queue unavailable", error);
+            this._db = null;
+        }
+        return this._db;
+    }
+
+    async _store(mode) {
+        const db = await this._open();
+        return db ? db.transaction(STORE, mode).objectStore(STORE) : null;
+    }
+
+    /**
+     * Queue a finalized order for fiscalisation.
+     */
+    async add(order) {
+        const store = await this._store("readwrite");
+        if (!store) {
+            return;
+        }
+        await promisify(store.put({
+            uid: order.uid,
+            reference: order.name,
+            state: "queued",
+            created_at: Date.now(),
+        }));
+    }
+
+    /**
+     * Oldest queued entries first.
+     */
+    async getQueued(limit) {
+        const store = await this._store("readonly");
+        if (!store) {
+            return [];
+        }
+        const entries = await promisify(store.index("state").getAll("queued"));
+        entries.sort((a, b) => a.created_at - b.created_at);
+        return limit ? entries.slice(0, limit) : entries;
+    }
+
+    async remove(uid) {
+        const store = await this._store("readwrite");
+        if (store) {
+            await promisify(store.delete(uid));
+        }
+    }
+}
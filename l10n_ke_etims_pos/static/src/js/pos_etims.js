@@ -3,7 +3,10 @@
 import { patch } from "@web/core/utils/patch";
 import { Order } from "@point_of_sale/app/store/models";
 import { PaymentScreen } from "@point_of_sale/app/screens/payment_screen/payment_screen";
+import { PosStore } from "@point_of_sale/app/store/pos_store";
 import { useService } from "@web/core/utils/hooks";
+import { ConnectionLostError } from "@web/core/network/rpc_service";
+import { EtimsOfflineQueue } from "./etims_offline_queue";
 
 /**
  * Kenya eTIMS Integration for Point of Sale
@@ -12,8 +15,120 @@ import { useService } from "@web/core/utils/hooks";
  * 1. Display eTIMS submission status on orders
  * 2. Show eTIMS receipt information after payment
  * 3. Handle refunds with proper reason codes
+ * 4. Buffer orders awaiting fiscalisation offline and flush them in bulk
  */
 
+// Orders sent per call to pos.order.etims_fiscalise_orders (server caps at 10)
+const ETIMS_FLUSH_BATCH = 10;
+const ETIMS_FLUSH_INTERVAL = 30000;
+
+// Receipt fields returned by the server for a fiscalised order
+const ETIMS_RECEIPT_FIELDS = [
+    "etims_submitted",
+    "etims_sdc_id",
+    "etims_rcpt_no",
+    "etims_cu_invoice_number",
+    "etims_receipt_type_label",
+    "etims_sdc_datetime",
+    "etims_intrl_data_formatted",
+    "etims_rcpt_sign_formatted",
+    "etims_qr_image",
+];
+
+// Keep a local queue of orders awaiting eTIMS receipt data
+patch(PosStore.prototype, {
+    async setup() {
+        await super.setup(...arguments);
+        this.etimsQueue = new EtimsOfflineQueue();
+        this._etimsFlushing = false;
+        this._etimsFlushTimer = null;
+        if (this.config.etims_enabled) {
+            this._etimsFlushTimer = setInterval(() => this.flushEtimsQueue(), ETIMS_FLUSH_INTERVAL);
+        }
+    },
+
+    async closePos() {
+        this._stopEtimsFlush();
+        return super.closePos(...arguments);
+    },
+
+    _stopEtimsFlush() {
+        if (this._etimsFlushTimer) {
+            clearInterval(this._etimsFlushTimer);
+            this._etimsFlushTimer = null;
+        }
+    },
+
+    async queueEtimsOrder(order) {
+        await this.etimsQueue.add(order);
+        this.flushEtimsQueue();
+    },
+
+    /**
+     * Send queued orders to the server in batches and reconcile the receipt
+     * data. Stops at the first connection error; orders not synced yet
+     * (state unknown) or still pending stay queued for the next flush.
+     */
+    async flushEtimsQueue() {
+        if (this._etimsFlushing) {
+            return;
+        }
+        this._etimsFlushing = true;
+        try {
+            let entries = await this.etimsQueue.getQueued(ETIMS_FLUSH_BATCH);
+            while (entries.length) {
+                const results = await this.orm.call("pos.order", "etims_fiscalise_orders", [
+                    entries.map((entry) => entry.reference),
+                ]);
+                let progress = false;
+                for (const [index, result] of results.entries()) {
+                    const entry = entries[index];
+                    if (result.state === "submitted") {
+                        const receipt = Object.fromEntries(
+                            ETIMS_RECEIPT_FIELDS.map((field) => [field, result[field]])
+                        );
+                        await this.etimsQueue.remove(entry.uid);
+                        this._applyEtimsReceipt(entry.uid, receipt);
+                        progress = true;
+                    } else if (result.state === "failed" || result.state === "skipped") {
+                        // The server-side submission queue owns retries from here
+                        await this.etimsQueue.remove(entry.uid);
+                        this._applyEtimsReceipt(entry.uid, {
+                            etims_submission_error: result.error || null,
+                        });
+                        progress = true;
+                    }
+                }
+                if (!progress || entries.length < ETIMS_FLUSH_BATCH) {
+                    break;
+                }
+                entries = await this.etimsQueue.getQueued(ETIMS_FLUSH_BATCH);
+            }
+        } catch (error) {
+            if (!(error instanceof ConnectionLostError)) {
+                throw error;
+            }
+            // Offline: keep the queue, retry on the next interval
+        } finally {
+            this._etimsFlushing = false;
+        }
+    },
+
+    /**
+     * Set receipt data on the order if it is loaded. Paid orders usually
+     * left the open order list by the time the queue flushes; they are
+     * looked up among the synced orders of the ticket screen too. Orders
+     * fetched from the server later carry the receipt data themselves.
+     */
+    _applyEtimsReceipt(uid, values) {
+        const syncedOrders = Object.values(this.TICKET_SCREEN_STATE?.syncedOrders?.cache || {});
+        const order = [...this.get_order_list(), ...syncedOrders].find((o) => o.uid === uid);
+        if (order) {
+            Object.assign(order, values);
+        }
+    },
+});
+
 // Extend Order model to include eTIMS fields
 patch(Order.prototype, {
     setup() {
@@ -32,6 +147,12 @@ patch(Order.prototype, {
         this.etims_rcpt_no = json.etims_rcpt_no || null;
         this.etims_submission_error = json.etims_submission_error || null;
         this.etims_refund_reason = json.etims_refund_reason || '01';
+        // Receipt data of orders loaded from the server (see _export_for_ui)
+        for (const field of ETIMS_RECEIPT_FIELDS) {
+            if (json[field] !== undefined) {
+                this[field] = json[field];
+            }
+        }
     },
 
     export_as_JSON() {
@@ -46,9 +167,11 @@ patch(Order.prototype, {
 
     export_for_printing() {
         const receipt = super.export_for_printing(...arguments);
-        receipt.etims_submitted = this.etims_submitted;
-        receipt.etims_sdc_id = this.etims_sdc_id;
-        receipt.etims_rcpt_no = this.etims_rcpt_no;
+        for (const field of ETIMS_RECEIPT_FIELDS) {
+            if (this[field] !== undefined) {
+                receipt[field] = this[field];
+            }
+        }
         return receipt;
     },
 
@@ -74,10 +197,15 @@ patch(PaymentScreen.prototype, {
     },
 
     async _finalizeValidation() {
+        const order = this.currentOrder;
         const result = await super._finalizeValidation(...arguments);
 
+        // Queue for fiscalisation; the receipt data arrives with the next flush
+        if (order && !order.etims_submitted && this.pos.config.etims_enabled) {
+            this.pos.queueEtimsOrder(order);
+        }
+
         // Show eTIMS notification if available
-        const order = this.currentOrder;
         if (order && order.etims_submitted) {
             this.notification.add(
                 `eTIMS Receipt: ${order.etims_sdc_id || 'Submitted'}`,
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Kenya - eTIMS Stock Integration',
-    'version': '17.0.2.0.1',
+    'version': '17.0.2.0.2',
     'category': 'Inventory/Localizations',
     'summary': 'VumaERP KRA eTIMS stock movement reporting',
     'description': """
@@ -14,8 +14,8 @@ Install this module if you use the Inventory (stock) module.
 Features:
 - Automatic stock movement reporting to KRA eTIMS
 - Stock picking eTIMS status tracking
-- Inventory level reporting
-- Auto-report on stock move validation
+- Inventory level reporting (only changed quantities, hourly)
+- Auto-report on stock move validation, one request per transfer (batched)
 
 This module requires both l10n_ke_etims and stock modules.
     """,
@@ -27,6 +27,7 @@ This module requires both l10n_ke_etims and stock modules.
         'l10n_ke_etims',
     ],
     'data': [
+        'security/ir.model.access.csv',
         'data/etims_stock_cron.xml',
         'views/stock_views.xml',
     ],
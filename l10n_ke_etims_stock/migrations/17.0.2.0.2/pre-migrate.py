@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Convert stock_move.l10n_ke_etims_sar_no from varchar to integer in place.
+
+Without this the ORM would move the old column aside and create an empty
+integer column, losing the SAR numbers the etims.counter is seeded from.
+Values that are not plain numbers are dropped.
+"""
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    cr.execute("""
+        SELECT data_type FROM information_schema.columns
+         WHERE table_name = 'stock_move' AND column_name = 'l10n_ke_etims_sar_no'
+    """)
+    row = cr.fetchone()
+    if not row or row[0] == 'integer':
+        return
+
+    cr.execute("""
+        ALTER TABLE stock_move
+        ALTER COLUMN l10n_ke_etims_sar_no TYPE integer
+        USING CASE
+            WHEN l10n_ke_etims_sar_no ~ '^[0-9]{1,9}$' THEN l10n_ke_etims_sar_no::integer
+        END
+    """)
+    _logger.info('Converted stock_move.l10n_ke_etims_sar_no to integer')
@@ -1,2 +1,6 @@
 # -*- coding: utf-8 -*-
+from . import etims_config
+from . import etims_counter
+from . import etims_stock_master
+from . import etims_submission_job
 from . import stock_move
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from odoo import fields, models
+
+
+class EtimsConfig(models.Model):
+    _inherit = 'etims.config'
+
+    stock_report_batch_size = fields.Integer(
+        string='Stock Report Batch Size', default=200,
+        help='Maximum stock moves sent in one /insertStockIO request. A transfer '
+             'with more lines is reported in several requests, each with its own SAR number.')
+
+    # Backlog metrics (see stock.move._cron_drain_etims_backlog)
+    stock_backlog_count = fields.Integer(
+        string='Unreported Stock Moves', compute='_compute_stock_backlog',
+        help='Done stock moves of registered products not reported to eTIMS yet')
+    stock_drain_rate = fields.Integer(
+        string='Stock Moves Reported (last hour)', compute='_compute_stock_backlog')
+
+    def _compute_stock_backlog(self):
+        since = fields.Datetime.now() - timedelta(hours=1)
+        for config in self:
+            if not config.company_id:
+                config.stock_backlog_count = config.stock_drain_rate = 0
+                continue
+            self.env.cr.execute("""
+                SELECT COUNT(*)
+                  FROM stock_move m
+                  JOIN product_product pp ON pp.id = m.product_id
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                 WHERE m.company_id = %s
+                   AND m.state = 'done'
+                   AND (m.l10n_ke_etims_reported IS NULL OR m.l10n_ke_etims_reported = FALSE)
+                   AND pt.l10n_ke_etims_registered
+            """, (config.company_id.id,))
+            config.stock_backlog_count = self.env.cr.fetchone()[0]
+            self.env.cr.execute("""
+                SELECT COUNT(*) FROM stock_move
+                 WHERE company_id = %s AND l10n_ke_etims_report_date >= %s
+            """, (config.company_id.id, since))
+            config.stock_drain_rate = self.env.cr.fetchone()[0]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models
+
+
+class EtimsCounter(models.Model):
+    _inherit = 'etims.counter'
+
+    counter_type = fields.Selection(selection_add=[
+        ('sar', 'Stock SAR Number (sarNo)'),
+    ], ondelete={'sar': 'cascade'})
+
+    @api.model
+    def _get_seed_value(self, company, counter_type):
+        """Stock reports number their requests with sarNo."""
+        value = super()._get_seed_value(company, counter_type)
+        if counter_type == 'sar':
+            self.env.cr.execute("""
+                SELECT COALESCE(MAX(l10n_ke_etims_sar_no), 0)
+                FROM stock_move
+                WHERE company_id = %s
+            """, (company.id,))
+            value = max(value, self.env.cr.fetchone()[0])
+        return value
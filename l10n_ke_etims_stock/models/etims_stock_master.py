@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+eTIMS Stock Master Synchronisation
+
+KRA keeps the remaining quantity (rsdQty) of every item, reported with
+/saveStockMaster. Reporting used to send one request per quant, and every
+quant again on each run, whether its quantity had changed or not.
+
+KRA keys stock by item code (itemCd), and the variants of a registered
+template share the template's code. etims.stock.master therefore remembers
+the last quantity reported per item code. A sync run:
+- Sums on-hand quantities per product over internal locations with one
+  grouped SQL query, then per item code
+- Compares them with the remembered quantities and only keeps the changes
+  (codes whose stock disappeared are reported at zero)
+- Sends one summed quantity per code, in batches of concurrent requests
+  over the pooled transport, committing after each batch when run by the cron
+"""
+import logging
+import time
+from collections import defaultdict
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from odoo.tools import float_compare, split_every
+
+from odoo.addons.l10n_ke_etims.models.etims_transport import EtimsConnectionError
+
+_logger = logging.getLogger(__name__)
+
+STOCK_MASTER_BATCH_SIZE = 200
+STOCK_MASTER_PRECISION = 3
+# A cron run stops taking new batches after this many seconds
+STOCK_MASTER_TIME_BUDGET = 240
+
+
+class EtimsStockMaster(models.Model):
+    _name = 'etims.stock.master'
+    _description = 'eTIMS Stock Master'
+    _order = 'company_id, item_code'
+    _rec_name = 'item_code'
+
+    company_id = fields.Many2one('res.company', string='Company', required=True,
+                                 ondelete='cascade', readonly=True)
+    item_code = fields.Char(string='eTIMS Item Code', required=True, readonly=True)
+    product_id = fields.Many2one('product.product', string='Product', ondelete='set null', readonly=True,
+                                 help='A product reported under this item code (variants of a '
+                                      'registered template share its code)')
+    reported_qty = fields.Float(string='Reported Quantity', digits='Product Unit of Measure',
+                                readonly=True, help='Last remaining quantity (rsdQty) accepted by KRA')
+    report_date = fields.Datetime(string='Reported On', readonly=True)
+    last_error = fields.Text(string='Last Error', readonly=True)
+
+    _sql_constraints = [
+        ('item_code_company_uniq', 'unique(company_id, item_code)',
+         'Only one stock master line per item code and company allowed.'),
+    ]
+
+    @api.model
+    def _cron_sync_stock_master(self):
+        """Report changed remaining quantities for every ready eTIMS company."""
+        deadline = time.monotonic() + STOCK_MASTER_TIME_BUDGET
+        configs = self.env['etims.config'].sudo().search([('company_id.country_id.code', '=', 'KE')])
+        for config in configs:
+            if not config.is_ready():
+                continue
+            try:
+                self.with_company(config.company_id)._sync(config, commit=True, deadline=deadline)
+            except EtimsConnectionError as e:
+                _logger.warning('eTIMS stock master sync for %s stopped: %s', config.company_id.name, str(e))
+            if time.monotonic() >= deadline:
+                self.env.ref('l10n_ke_etims_stock.ir_cron_etims_stock_master')._trigger()
+                break
+
+    @api.model
+    def _sync(self, config, product_ids=None, commit=False, deadline=None):
+        """
+        Report the item codes whose remaining quantity changed since last report.
+
+        Args:
+            config: etims.config of the company
+            product_ids: Restrict the sync to the item codes of these products
+                (the quantity sent still covers every product of the code)
+            commit: Commit after each batch (cron only)
+            deadline: time.monotonic() value after which no new batch is sent
+
+        Returns:
+            tuple (sent, failed, unchanged)
+
+        Raises:
+            EtimsConnectionError: KRA unreachable
+        """
+        company = config.company_id
+        current, code_products = self._get_current_quantities(company)
+        domain = [('company_id', '=', company.id)]
+        if product_ids:
+            codes = {
+                product._get_etims_item_code()[:20]
+                for product in self.env['product.product'].browse(product_ids)
+            }
+            current = {code: qty for code, qty in current.items() if code in codes}
+            domain.append(('item_code', 'in', list(codes)))
+        masters = {master.item_code: master for master in self.search(domain)}
+        # Stock that disappeared from every internal location is reported at zero
+        for code in masters:
+            current.setdefault(code, 0.0)
+
+        # Codes never accepted by KRA, or whose last report failed, are resent
+        # whatever their quantity
+        changed = [
+            code for code, qty in current.items()
+            if code not in masters
+            or masters[code].last_error
+            or not masters[code].report_date
+            or float_compare(qty, masters[code].reported_qty, precision_digits=STOCK_MASTER_PRECISION)
+        ]
+        unchanged = len(current) - len(changed)
+        sent = failed = 0
+
+        for batch_codes in split_every(STOCK_MASTER_BATCH_SIZE, changed):
+            if deadline and time.monotonic() >= deadline:
+                break
+            payloads = [{'itemCd': code, 'rsdQty': current[code]} for code in batch_codes]
+            responses = config._call_api_concurrent('/saveStockMaster', [dict(p) for p in payloads])
+
+            connection_error = None
+            for code, payload, (result, error) in zip(batch_codes, payloads, responses):
+                if isinstance(error, EtimsConnectionError):
+                    connection_error = connection_error or error
+                    continue
+                if error or result.get('resultCd') != '000':
+                    message = str(error) if error else result.get('resultMsg', 'Unknown error')
+                    _logger.warning('eTIMS stock master failed for item %s: %s', code, message)
+                    vals = {'last_error': message}
+                    failed += 1
+                else:
+                    vals = {
+                        'reported_qty': payload['rsdQty'],
+                        'report_date': fields.Datetime.now(),
+                        'last_error': False,
+                    }
+                    sent += 1
+                if code in masters:
+                    masters[code].write(vals)
+                else:
+                    masters[code] = self.create(dict(
+                        vals, company_id=company.id, item_code=code,
+                        product_id=code_products.get(code, False)))
+
+            if commit:
+                self.env.cr.commit()
+            if connection_error:
+                raise connection_error
+
+        _logger.info('eTIMS stock master for %s: %d sent, %d failed, %d unchanged',
+                     company.name, sent, failed, unchanged)
+        return sent, failed, unchanged
+
+    @api.model
+    def _get_current_quantities(self, company):
+        """
+        On-hand quantity per item code of the registered products, over internal locations.
+
+        Returns:
+            tuple ({item_code: quantity}, {item_code: product id})
+        """
+        self.env['stock.quant'].flush_model(['product_id', 'location_id', 'company_id', 'quantity'])
+        self.env.cr.execute("""
+            SELECT q.product_id, SUM(q.quantity)
+              FROM stock_quant q
+              JOIN stock_location l ON l.id = q.location_id
+              JOIN product_product pp ON pp.id = q.product_id
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             WHERE q.company_id = %s
+               AND l.usage = 'internal'
+               AND pt.l10n_ke_etims_registered
+          GROUP BY q.product_id
+        """, (company.id,))
+        rows = self.env.cr.fetchall()
+
+        quantities = defaultdict(float)
+        code_products = {}
+        products = self.env['product.product'].browse([product_id for product_id, qty in rows])
+        for product, (product_id, qty) in zip(products, rows):
+            code = product._get_etims_item_code()[:20]
+            quantities[code] += qty
+            code_products.setdefault(code, product_id)
+        return dict(quantities), code_products
+
+    def action_sync_now(self):
+        """Report changed quantities of the current company."""
+        config = self.env['etims.config'].get_config(self.env.company)
+        try:
+            sent, failed, unchanged = self._sync(config)
+        except EtimsConnectionError as e:
+            raise UserError(str(e))
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('eTIMS Stock Master'),
+                'message': _('Reported: %(sent)d, Failed: %(failed)d, Unchanged: %(unchanged)d',
+                             sent=sent, failed=failed, unchanged=unchanged),
+                'type': 'success' if not failed else 'warning',
+            }
+        }
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+
+
+class EtimsSubmissionJob(models.Model):
+    _inherit = 'etims.submission.job'
+
+    job_type = fields.Selection(selection_add=[
+        ('stock', 'Stock Movement'),
+    ], ondelete={'stock': 'cascade'})
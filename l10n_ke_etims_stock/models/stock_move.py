@@ -9,14 +9,52 @@ This includes:
 - Internal transfers
 - Inventory adjustments
 
-Stock moves auto-send to eTIMS post-validation for registered products.
+Stock moves of registered products are queued for eTIMS post-validation
+and reported by the submission queue (etims.submission.job). Moves are
+reported per transfer: one /insertStockIO request with a multi-item itemList
+and one SAR number per picking and stock type, split in batches of the
+configured size. Moves without a transfer (inventory adjustments) are
+reported on their own.
 """
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from psycopg2 import OperationalError
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.tools import split_every
+from odoo.tools.sql import create_index
 import logging
 
+from odoo.addons.l10n_ke_etims.models.etims_transport import EtimsConnectionError
+
 _logger = logging.getLogger(__name__)
 
+# Backlog drainer (_cron_drain_etims_backlog)
+DRAIN_TIME_BUDGET = 120  # seconds per cron run
+DRAIN_BATCH_MIN = 200
+DRAIN_BATCH_MAX = 5000
+DRAIN_BATCH_TARGET = 10  # seconds one batch should take
+DRAIN_BATCH_PARAM = 'l10n_ke_etims_stock.drain_batch_size'
+# Backlog jobs yield to transfers validated live (priority 10)
+DRAIN_JOB_PRIORITY = 20
+# Stop feeding a company's queue while it holds this many open stock jobs
+DRAIN_MAX_OPEN_JOBS = 5000
+# Seconds before the drainer runs again, per error class
+DRAIN_RETRY_DELAYS = {
+    'queue_full': 300,
+    'lock': 60,
+    'error': 900,
+}
+
+# Done moves not reported yet; the predicate matches the SQL the ORM
+# generates for ('l10n_ke_etims_reported', '=', False)
+UNREPORTED_WHERE = (
+    "state = 'done' AND (l10n_ke_etims_reported IS NULL OR l10n_ke_etims_reported = FALSE)"
+)
+
 
 class StockMove(models.Model):
     _inherit = 'stock.move'
@@ -28,11 +66,13 @@ class StockMove(models.Model):
         copy=False,
         help='Indicates if this stock move has been reported to KRA eTIMS',
     )
-    l10n_ke_etims_sar_no = fields.Char(
+    l10n_ke_etims_sar_no = fields.Integer(
         string='SAR Number',
         copy=False,
         readonly=True,
-        help='Stock Adjustment/Receipt Number assigned by eTIMS'
+        index='btree_not_null',
+        help='Stock Adjustment/Receipt Number (sarNo) the move was reported under. '
+             'Shared by all moves reported in the same request.'
     )
     l10n_ke_etims_move_type = fields.Selection([
         ('01', 'Import'),
@@ -47,6 +87,7 @@ class StockMove(models.Model):
         string='eTIMS Report Date',
         copy=False,
         readonly=True,
+        index='btree_not_null',
     )
     l10n_ke_etims_response = fields.Text(
         string='eTIMS Response',
@@ -54,47 +95,273 @@ class StockMove(models.Model):
         readonly=True,
     )
 
+    def init(self):
+        super().init()
+        # Backlog drainer and backlog metrics only look at unreported done moves
+        create_index(self._cr, 'stock_move_etims_unreported_idx', self._table,
+                     ['company_id', 'id'], where=UNREPORTED_WHERE)
+
     def _action_done(self, cancel_backorder=False):
-        """Override to auto-report to eTIMS after validation."""
+        """Override to queue eTIMS reporting after validation."""
         res = super()._action_done(cancel_backorder=cancel_backorder)
 
-        # Auto-report to eTIMS for Kenyan companies
-        for move in self:
-            if (move.company_id.country_id.code == 'KE' and
-                    move.product_id.product_tmpl_id.l10n_ke_etims_registered and
-                    not move.l10n_ke_etims_reported):
-                try:
-                    move._report_to_etims()
-                except Exception as e:
-                    # Log but don't block the stock move
-                    _logger.warning('eTIMS stock report failed for move %s: %s', move.id, str(e))
+        # Queue for Kenyan companies; the submission queue talks to KRA so
+        # validating a transfer never waits on the eTIMS API
+        moves = self.filtered(lambda m: m._is_etims_reportable())
+        moves._enqueue_etims_report()
 
         return res
 
-    def _report_to_etims(self):
-        """Report stock movement to eTIMS."""
+    def _is_etims_reportable(self):
         self.ensure_one()
+        return (
+            self.state == 'done' and
+            self.company_id.country_id.code == 'KE' and
+            self.product_id.product_tmpl_id.l10n_ke_etims_registered and
+            not self.l10n_ke_etims_reported
+        )
+
+    def _enqueue_etims_report(self, priority=10):
+        """Queue one job per transfer, and one per move without a transfer."""
+        Job = self.env['etims.submission.job']
+        jobs = Job._enqueue(self.picking_id, job_type='stock', priority=priority)
+        jobs |= Job._enqueue(self.filtered(lambda m: not m.picking_id), job_type='stock', priority=priority)
+        return jobs
+
+    # -------------------------------------------------------------------------
+    # Backlog drainer
+    # -------------------------------------------------------------------------
+
+    @api.model
+    def _cron_drain_etims_backlog(self):
+        """
+        Queue unreported stock moves for eTIMS, oldest first.
+
+        Moves are read in keyset-paginated batches through the partial index
+        on unreported done moves. The batch size adapts to how long a batch
+        takes and is kept between runs. A run stops after DRAIN_TIME_BUDGET
+        seconds and triggers itself again while work remains; errors delay
+        the next run according to their class instead of being swallowed.
+        """
+        cron = self.env.ref('l10n_ke_etims_stock.ir_cron_etims_stock_report')
+        deadline = time.monotonic() + DRAIN_TIME_BUDGET
+        batch_size = self._get_etims_drain_batch_size()
+        retry_in = None
+
+        configs = self.env['etims.config'].sudo().search([('company_id.country_id.code', '=', 'KE')])
+        for config in configs:
+            company = config.company_id
+            if not config.is_ready():
+                _logger.info('eTIMS stock backlog: company %s not ready, skipped', company.name)
+                continue
+
+            last_id = 0
+            while True:
+                if time.monotonic() >= deadline:
+                    retry_in = 0
+                    break
+                if self._count_open_etims_stock_jobs(company) >= DRAIN_MAX_OPEN_JOBS:
+                    _logger.info('eTIMS stock backlog: queue full for company %s', company.name)
+                    retry_in = DRAIN_RETRY_DELAYS['queue_full'] if retry_in is None else min(
+                        retry_in, DRAIN_RETRY_DELAYS['queue_full'])
+                    break
+
+                start = time.monotonic()
+                try:
+                    move_ids = self._get_etims_backlog_ids(company, last_id, batch_size)
+                    if move_ids:
+                        self.browse(move_ids).with_company(company)._enqueue_etims_report(
+                            priority=DRAIN_JOB_PRIORITY)
+                    self.env.cr.commit()
+                except OperationalError as e:
+                    # Lock or serialization conflict with live validations
+                    self.env.cr.rollback()
+                    _logger.warning('eTIMS stock backlog: %s, retrying in %ss',
+                                    str(e).strip(), DRAIN_RETRY_DELAYS['lock'])
+                    self._set_etims_drain_batch_size(batch_size // 2)
+                    cron._trigger(fields.Datetime.now() + timedelta(seconds=DRAIN_RETRY_DELAYS['lock']))
+                    return
+                except Exception:
+                    self.env.cr.rollback()
+                    _logger.exception('eTIMS stock backlog drain failed, retrying in %ss',
+                                      DRAIN_RETRY_DELAYS['error'])
+                    cron._trigger(fields.Datetime.now() + timedelta(seconds=DRAIN_RETRY_DELAYS['error']))
+                    return
+
+                if len(move_ids) < batch_size:
+                    break
+                last_id = move_ids[-1]
+                batch_size = self._adapt_etims_drain_batch_size(batch_size, time.monotonic() - start)
+
+        self._set_etims_drain_batch_size(batch_size)
+        if retry_in is not None:
+            cron._trigger(fields.Datetime.now() + timedelta(seconds=retry_in))
+
+    @api.model
+    def _get_etims_backlog_ids(self, company, after_id, limit):
+        """Unreported done moves of registered products without an open job."""
+        self.env.cr.execute("""
+            SELECT m.id
+              FROM stock_move m
+              JOIN product_product pp ON pp.id = m.product_id
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             WHERE m.company_id = %s
+               AND m.id > %s
+               AND m.state = 'done'
+               AND (m.l10n_ke_etims_reported IS NULL OR m.l10n_ke_etims_reported = FALSE)
+               AND pt.l10n_ke_etims_registered
+               AND NOT EXISTS (
+                   SELECT 1 FROM etims_submission_job j
+                    WHERE j.state IN ('pending', 'running', 'failed', 'dead')
+                      AND ((j.res_model = 'stock.move' AND j.res_id = m.id)
+                        OR (j.res_model = 'stock.picking' AND j.res_id = m.picking_id))
+               )
+          ORDER BY m.id
+             LIMIT %s
+        """, (company.id, after_id, limit))
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _count_open_etims_stock_jobs(self, company):
+        self.env.cr.execute("""
+            SELECT COUNT(*) FROM etims_submission_job
+             WHERE company_id = %s AND job_type = 'stock'
+               AND state IN ('pending', 'running', 'failed')
+        """, (company.id,))
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _get_etims_drain_batch_size(self):
+        size = int(self.env['ir.config_parameter'].sudo().get_param(DRAIN_BATCH_PARAM, DRAIN_BATCH_MIN))
+        return min(max(size, DRAIN_BATCH_MIN), DRAIN_BATCH_MAX)
+
+    @api.model
+    def _set_etims_drain_batch_size(self, size):
+        size = min(max(size, DRAIN_BATCH_MIN), DRAIN_BATCH_MAX)
+        if size != self._get_etims_drain_batch_size():
+            self.env['ir.config_parameter'].sudo().set_param(DRAIN_BATCH_PARAM, size)
+
+    @api.model
+    def _adapt_etims_drain_batch_size(self, size, elapsed):
+        """Double the batch while batches are fast, halve it when they are slow."""
+        if elapsed < DRAIN_BATCH_TARGET / 2:
+            size *= 2
+        elif elapsed > DRAIN_BATCH_TARGET:
+            size //= 2
+        return min(max(size, DRAIN_BATCH_MIN), DRAIN_BATCH_MAX)
+
+    def _etims_submit_from_job(self):
+        """
+        Submission queue handler (see etims.submission.job).
 
-        if self.l10n_ke_etims_reported:
-            return
+        Returns:
+            dict {move_id: error message or False}
+        """
+        errors = {}
+        for move in self:
+            if move._report_to_etims() or move.l10n_ke_etims_reported:
+                errors[move.id] = False
+            else:
+                errors[move.id] = move.l10n_ke_etims_response or _('eTIMS stock report failed')
+        return errors
 
-        if self.state != 'done':
-            return
+    def _report_to_etims(self):
+        """
+        Report stock movements to eTIMS.
+
+        Moves are grouped per company, transfer and stock type (sarTyCd) and
+        each group is sent as /insertStockIO requests of at most the
+        configured batch size, each with its own SAR number.
+
+        Returns:
+            bool: True if KRA accepted all reportable moves, False if any was
+                  skipped or rejected
+
+        Raises:
+            EtimsConnectionError: KRA is unreachable and nothing was reported yet
+        """
+        pending = self.filtered(lambda m: not m.l10n_ke_etims_reported)
+        if not pending:
+            return True
 
         # Check if product is registered
-        if not self.product_id.product_tmpl_id.l10n_ke_etims_registered:
-            _logger.info('Skipping eTIMS report for unregistered product: %s', self.product_id.name)
-            return
+        unregistered = pending.filtered(lambda m: not m.product_id.product_tmpl_id.l10n_ke_etims_registered)
+        for move in unregistered:
+            _logger.info('Skipping eTIMS report for unregistered product: %s', move.product_id.name)
+        moves = pending.filtered(lambda m: m.state == 'done') - unregistered
+        success = moves == pending
+
+        groups = defaultdict(lambda: self.browse())
+        for move in moves:
+            groups[move.company_id, move.picking_id, move._determine_etims_move_type()] |= move
+
+        batches = []
+        for (company, picking, move_type), group in groups.items():
+            try:
+                config = self.env['etims.config'].get_config(company)
+            except UserError:
+                _logger.info('eTIMS not configured for company %s, skipping stock report', company.name)
+                success = False
+                continue
 
-        try:
-            config = self.env['etims.config'].get_config(self.company_id)
-        except UserError:
-            _logger.info('eTIMS not configured for company %s, skipping stock report', self.company_id.name)
-            return
+            batch_size = max(config.stock_report_batch_size, 1)
+            for batch_ids in split_every(batch_size, group.ids):
+                batches.append((config, move_type, self.browse(batch_ids)))
+
+        self._assign_sar_numbers([batch for config, move_type, batch in batches])
+
+        reported = False
+        for config, move_type, batch in batches:
+            try:
+                accepted = batch._report_batch_to_etims(config, move_type)
+            except EtimsConnectionError as e:
+                if not reported:
+                    raise
+                # Part of the transfer is already with KRA: keep it and
+                # let the queue retry the rest
+                moves.filtered(lambda m: not m.l10n_ke_etims_reported).l10n_ke_etims_response = str(e)
+                return False
+            reported = reported or accepted
+            success = success and accepted
+        return success
+
+    @api.model
+    def _assign_sar_numbers(self, batches):
+        """
+        Give each batch of moves its SAR number.
 
-        # Determine move type
-        move_type = self._determine_etims_move_type()
+        A batch whose moves already share a number (reserved by an earlier,
+        rejected attempt) keeps it, so SAR numbers stay gapless. The others
+        get numbers from a block reserved with one counter update per company.
+
+        Args:
+            batches: list of stock.move recordsets, one per /insertStockIO request
+        """
+        used = set()
+        unnumbered = defaultdict(list)
+        for batch in batches:
+            numbers = set(batch.mapped('l10n_ke_etims_sar_no'))
+            number = numbers.pop() if len(numbers) == 1 else 0
+            if number and number not in used:
+                used.add(number)
+            else:
+                unnumbered[batch.company_id].append(batch)
+
+        for company, company_batches in unnumbered.items():
+            first = self.env['etims.counter']._reserve(company, 'sar', count=len(company_batches))
+            for offset, batch in enumerate(company_batches):
+                batch.l10n_ke_etims_sar_no = first + offset
+
+    def _report_batch_to_etims(self, config, move_type):
+        """
+        Send moves of one transfer and stock type in a single /insertStockIO.
 
+        Returns:
+            bool: True if KRA accepted the movement
+
+        Raises:
+            EtimsConnectionError: KRA is unreachable
+        """
         # Prepare stock data
         stock_data = self._prepare_etims_stock_data(config, move_type)
 
@@ -105,20 +372,26 @@ class StockMove(models.Model):
             if result.get('resultCd') == '000':
                 self.write({
                     'l10n_ke_etims_reported': True,
-                    'l10n_ke_etims_sar_no': str(stock_data.get('sarNo', '')),
+                    'l10n_ke_etims_sar_no': stock_data['sarNo'],
                     'l10n_ke_etims_move_type': move_type,
                     'l10n_ke_etims_report_date': fields.Datetime.now(),
                     'l10n_ke_etims_response': str(result),
                 })
-                _logger.info('Stock move %s reported to eTIMS with SAR #%s', self.id, stock_data.get('sarNo'))
+                _logger.info('%d stock moves reported to eTIMS with SAR #%s',
+                             len(self), stock_data.get('sarNo'))
+                return True
             else:
                 error_msg = result.get('resultMsg', 'Unknown error')
                 _logger.warning('eTIMS stock report failed: %s', error_msg)
                 self.l10n_ke_etims_response = str(result)
 
+        except EtimsConnectionError as e:
+            self.l10n_ke_etims_response = str(e)
+            raise
         except Exception as e:
             _logger.error('eTIMS stock report error: %s', str(e))
             self.l10n_ke_etims_response = str(e)
+        return False
 
     def _determine_etims_move_type(self):
         """
@@ -159,87 +432,98 @@ class StockMove(models.Model):
 
         return '11'  # Default to Opening Stock
 
-    def _get_next_sar_number(self):
-        """Get the next sequential SAR (Stock Adjustment/Receipt) number."""
+    def _get_next_sar_number(self, count=1):
+        """
+        Get the next sequential SAR (Stock Adjustment/Receipt) number.
+
+        Numbers come from the company's etims.counter row ('sar'), allocated
+        atomically per branch; count > 1 reserves a block and returns its
+        first number.
+        """
         self.ensure_one()
-        self.env.cr.execute("""
-            SELECT COALESCE(MAX(CAST(l10n_ke_etims_sar_no AS INTEGER)), 0) + 1
-            FROM stock_move
-            WHERE company_id = %s
-            AND l10n_ke_etims_sar_no IS NOT NULL
-            AND l10n_ke_etims_sar_no ~ '^[0-9]+$'
-        """, (self.company_id.id,))
-        result = self.env.cr.fetchone()
-        return result[0] if result else 1
+        return self.env['etims.counter']._reserve(self.company_id, 'sar', count=count)
 
     def _prepare_etims_stock_data(self, config, move_type):
         """
         Prepare stock movement data for eTIMS API (StockIOSaveReq).
 
+        All moves of the recordset go in one itemList; they must belong to
+        the same transfer and stock type.
+
         Per OSCU spec, the structure requires:
         - sarNo: Sequential SAR number (NUMBER 38)
         - regTyCd: "M" for Manual or "A" for Automatic
         - sarTyCd: Stock type from Section 4.14
         """
-        self.ensure_one()
-
-        product = self.product_id
-        tmpl = product.product_tmpl_id
+        first = self[0]
+        partner = first.picking_id.partner_id
 
         # Get date in eTIMS format
-        move_date = self.date.strftime('%Y%m%d') if self.date else fields.Date.today().strftime('%Y%m%d')
-
-        # Calculate amounts if available
-        unit_price = 0
-        if self.sale_line_id:
-            unit_price = self.sale_line_id.price_unit
-        elif self.purchase_line_id:
-            unit_price = self.purchase_line_id.price_unit
-        else:
-            unit_price = product.list_price or 0
+        move_date = first.date.strftime('%Y%m%d') if first.date else fields.Date.today().strftime('%Y%m%d')
 
-        supply_amount = unit_price * self.product_uom_qty
+        item_list = [move._prepare_etims_stock_item(seq) for seq, move in enumerate(self, start=1)]
+        total_amount = round(sum(item['totAmt'] for item in item_list), 2)
 
-        # Get next SAR number
-        sar_no = self._get_next_sar_number()
+        # SAR number (one per document), normally assigned by _assign_sar_numbers
+        sar_no = first.l10n_ke_etims_sar_no or first._get_next_sar_number()
 
         return {
             'sarNo': sar_no,  # Stock Adjustment/Receipt Number (unique sequence)
             'orgSarNo': 0,  # Original SAR number for adjustments
             'regTyCd': 'A',  # Registration Type: A=Automatic (system-generated)
-            'custTin': self.picking_id.partner_id.vat if self.picking_id and self.picking_id.partner_id else '',
-            'custNm': (self.picking_id.partner_id.name if self.picking_id and self.picking_id.partner_id else '')[:100],
+            'custTin': partner.vat or '',
+            'custNm': (partner.name or '')[:100],
             'custBhfId': '00',
             'sarTyCd': move_type,  # Stock Adjustment/Receipt Type Code (from Section 4.14)
             'ocrnDt': move_date,  # Occurrence Date
-            'totItemCnt': 1,
-            'totTaxblAmt': round(supply_amount, 2),
+            'totItemCnt': len(item_list),
+            'totTaxblAmt': total_amount,
             'totTaxAmt': 0,  # Will be calculated if needed
-            'totAmt': round(supply_amount, 2),
-            'remark': (self.name or '')[:400],
+            'totAmt': total_amount,
+            'remark': (first.picking_id.name or first.name or '')[:400],
             'regrId': (self.env.user.login or 'admin')[:20],
             'regrNm': (self.env.user.name or 'Admin')[:60],
             'modrId': (self.env.user.login or 'admin')[:20],
             'modrNm': (self.env.user.name or 'Admin')[:60],
-            'itemList': [{
-                'itemSeq': 1,
-                'itemCd': product._get_etims_item_code()[:20],
-                'itemClsCd': product._get_etims_item_class_code(),
-                'itemNm': (product.name or '')[:200],
-                'bcd': (product.barcode or '')[:20],
-                'pkgUnitCd': product._get_etims_unit_codes()['pkg_unit'],
-                'pkg': self.product_uom_qty,
-                'qtyUnitCd': product._get_etims_unit_codes()['qty_unit'],
-                'qty': self.product_uom_qty,
-                'itemExprDt': '',  # Expiry date if applicable
-                'prc': round(unit_price, 2),
-                'splyAmt': round(supply_amount, 2),
-                'totDcAmt': 0,
-                'taxblAmt': round(supply_amount, 2),
-                'taxTyCd': product._get_etims_tax_type(),
-                'taxAmt': 0,
-                'totAmt': round(supply_amount, 2),
-            }],
+            'itemList': item_list,
+        }
+
+    def _prepare_etims_stock_item(self, seq):
+        """Prepare the itemList entry of a stock move."""
+        self.ensure_one()
+
+        product = self.product_id
+        unit_codes = product._get_etims_unit_codes()
+
+        # Calculate amounts if available
+        unit_price = 0
+        if self.sale_line_id:
+            unit_price = self.sale_line_id.price_unit
+        elif self.purchase_line_id:
+            unit_price = self.purchase_line_id.price_unit
+        else:
+            unit_price = product.list_price or 0
+
+        supply_amount = unit_price * self.product_uom_qty
+
+        return {
+            'itemSeq': seq,
+            'itemCd': product._get_etims_item_code()[:20],
+            'itemClsCd': product._get_etims_item_class_code(),
+            'itemNm': (product.name or '')[:200],
+            'bcd': (product.barcode or '')[:20],
+            'pkgUnitCd': unit_codes['pkg_unit'],
+            'pkg': self.product_uom_qty,
+            'qtyUnitCd': unit_codes['qty_unit'],
+            'qty': self.product_uom_qty,
+            'itemExprDt': '',  # Expiry date if applicable
+            'prc': round(unit_price, 2),
+            'splyAmt': round(supply_amount, 2),
+            'totDcAmt': 0,
+            'taxblAmt': round(supply_amount, 2),
+            'taxTyCd': product._get_etims_tax_type(),
+            'taxAmt': 0,
+            'totAmt': round(supply_amount, 2),
         }
 
     def action_report_to_etims(self):
@@ -256,7 +540,7 @@ class StockMove(models.Model):
                     'Product "%s" must be registered with eTIMS before reporting stock movements.'
                 ) % move.product_id.name)
 
-            move._report_to_etims()
+        self._report_to_etims()
 
         return {
             'type': 'ir.actions.client',
@@ -288,20 +572,37 @@ class StockPicking(models.Model):
             else:
                 picking.l10n_ke_etims_reported = False
 
+    def _get_etims_moves_to_report(self):
+        return self.move_ids.filtered(
+            lambda m: m.state == 'done' and
+                      not m.l10n_ke_etims_reported and
+                      m.product_id.product_tmpl_id.l10n_ke_etims_registered
+        )
+
+    def _etims_submit_from_job(self):
+        """
+        Submission queue handler (see etims.submission.job).
+
+        Returns:
+            dict {picking_id: error message or False}
+        """
+        errors = {}
+        for picking in self:
+            moves = picking._get_etims_moves_to_report()
+            if not moves or moves._report_to_etims():
+                errors[picking.id] = False
+            else:
+                failed = moves.filtered(lambda m: not m.l10n_ke_etims_reported)
+                errors[picking.id] = failed[:1].l10n_ke_etims_response or _('eTIMS stock report failed')
+        return errors
+
     def action_report_stock_to_etims(self):
         """Report all moves in picking to eTIMS."""
         for picking in self:
-            moves_to_report = picking.move_ids.filtered(
-                lambda m: m.state == 'done' and
-                          not m.l10n_ke_etims_reported and
-                          m.product_id.product_tmpl_id.l10n_ke_etims_registered
-            )
-
-            for move in moves_to_report:
-                try:
-                    move._report_to_etims()
-                except Exception as e:
-                    _logger.warning('Failed to report move %s: %s', move.id, str(e))
+            try:
+                picking._get_etims_moves_to_report()._report_to_etims()
+            except Exception as e:
+                _logger.warning('Failed to report transfer %s: %s', picking.name, str(e))
 
         return {
             'type': 'ir.actions.client',
@@ -318,46 +619,35 @@ class StockQuant(models.Model):
     _inherit = 'stock.quant'
 
     def action_report_inventory_to_etims(self):
-        """Report current inventory levels to eTIMS."""
+        """
+        Report current inventory levels of the selected products to eTIMS.
+
+        Quantities are summed per eTIMS item code over internal locations and
+        only codes whose remaining quantity changed since the last report are
+        sent (see etims.stock.master).
+        """
         try:
             config = self.env['etims.config'].get_config()
         except UserError as e:
             raise UserError(_('eTIMS not configured: %s') % str(e))
 
-        success_count = 0
-        failed_count = 0
-
-        for quant in self.filtered(lambda q: q.quantity > 0):
-            product = quant.product_id
-
-            # Skip unregistered products
-            if not product.product_tmpl_id.l10n_ke_etims_registered:
-                continue
-
-            stock_data = {
-                'itemCd': product._get_etims_item_code()[:20],
-                'rsdQty': quant.quantity,
-            }
+        product_ids = self.product_id.filtered(
+            lambda p: p.product_tmpl_id.l10n_ke_etims_registered).ids
+        if not product_ids:
+            raise UserError(_('None of the selected products is registered with eTIMS.'))
 
-            try:
-                # Per OSCU spec: /saveStockMaster for updating remaining quantity
-                result = config._call_api('/saveStockMaster', stock_data)
-                if result.get('resultCd') == '000':
-                    success_count += 1
-                else:
-                    failed_count += 1
-                    _logger.warning('eTIMS inventory report failed for %s: %s',
-                                    product.name, result.get('resultMsg'))
-            except Exception as e:
-                failed_count += 1
-                _logger.error('eTIMS inventory error for %s: %s', product.name, str(e))
+        try:
+            sent, failed, unchanged = self.env['etims.stock.master']._sync(config, product_ids=product_ids)
+        except EtimsConnectionError as e:
+            raise UserError(str(e))
 
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': _('eTIMS Inventory'),
-                'message': _('Reported: %d, Failed: %d') % (success_count, failed_count),
-                'type': 'success' if failed_count == 0 else 'warning',
+                'message': _('Reported: %(sent)d, Failed: %(failed)d, Unchanged: %(unchanged)d',
+                             sent=sent, failed=failed, unchanged=unchanged),
+                'type': 'success' if failed == 0 else 'warning',
             }
         }